@@ -0,0 +1,23 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# server.py monta espelho, perfis, listas e lojas na importação: nada de tocar nos arquivos reais
+DATA_DIR = tempfile.mkdtemp(prefix="bridge-tests-")
+os.environ["BRIDGE_DATA_DIR"] = DATA_DIR
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vr_soft_api"))
+
+@pytest.fixture(scope="session")
+def server():
+    import server
+    return server
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+def pytest_unconfigure(config):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
@@ -0,0 +1,24 @@
+import pytest
+
+def test_marca_dagua_ida_e_volta(server):
+    for marca in [("venda102026", 12345, ()), ("venda102026", 12345, (12340, 12342)), ("venda102026", 12345, None)]:
+        assert server.parse_watermark(server.format_watermark(*marca)) == marca
+
+def test_marca_dagua_transbordada(server):
+    assert server.format_watermark("venda102026", 7, None) == "venda102026:7:*"
+
+def test_marca_sem_since(server):
+    assert server.parse_watermark(None) is None
+    assert server.parse_watermark("") is None
+
+@pytest.mark.parametrize("marca", ["venda102026", "venda102026:x", "vendas:1", "venda102026:1:2,a", "venda102026:1:2:3"])
+def test_marca_invalida(server, marca):
+    with pytest.raises(ValueError):
+        server.parse_watermark(marca)
+
+def test_pending_ids_novos_e_buracos(server):
+    # 11 e 13 ainda não confirmados; o buraco 5 apareceu, o 7 continua ausente
+    assert server.pending_ids((5, 7), 10, 14, {5, 12, 14}) == [7, 11, 13]
+
+def test_pending_ids_sem_lacunas(server):
+    assert server.pending_ids((), 10, 12, {11, 12}) == []
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+@pytest.fixture
+def relogio(server, monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(server.time, "monotonic", relogio)
+    return relogio
+
+@pytest.fixture
+def falha_erp(server):
+    return server.psycopg2.OperationalError("timeout")
+
+def test_abre_depois_de_falhas_seguidas(server, falha_erp):
+    breaker = server.CircuitBreaker(failure_threshold=3)
+    for _ in range(2):
+        breaker.before()
+        breaker.record(falha_erp)
+    assert breaker.stats()["state"] == "closed"
+    breaker.before()
+    breaker.record(falha_erp)
+    assert breaker.stats()["state"] == "open"
+    with pytest.raises(server.CircuitOpen):
+        breaker.before()
+    assert breaker.stats()["rejected"] == 1
+
+def test_sucesso_zera_as_falhas(server, falha_erp):
+    breaker = server.CircuitBreaker(failure_threshold=2)
+    breaker.record(falha_erp)
+    breaker.record(None)
+    breaker.record(falha_erp)
+    assert breaker.stats()["state"] == "closed"
+
+def test_erro_que_nao_e_do_erp_nao_conta(server):
+    breaker = server.CircuitBreaker(failure_threshold=1)
+    breaker.record(server.psycopg2.ProgrammingError("sintaxe"))
+    breaker.record(ValueError("parâmetro"))
+    assert breaker.stats()["state"] == "closed"
+
+def test_meia_abertura_deixa_uma_tentativa(server, relogio, falha_erp):
+    breaker = server.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record(falha_erp)
+    relogio.agora += 30
+    breaker.before()
+    assert breaker.stats()["state"] == "half_open"
+    with pytest.raises(server.CircuitOpen):
+        breaker.before()  # só uma chamada de teste por vez
+    breaker.record(None)
+    assert breaker.stats()["state"] == "closed"
+
+def test_falha_na_meia_abertura_reabre(server, relogio, falha_erp):
+    breaker = server.CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record(falha_erp)
+    relogio.agora += 30
+    breaker.before()
+    breaker.record(falha_erp)
+    assert breaker.stats()["state"] == "open"
+    assert breaker.stats()["opened"] == 2
+
+@pytest.mark.parametrize("erro", ["circuito", "cancelado"])
+def test_rejeicao_e_cancelamento_sao_neutros(server, relogio, falha_erp, erro):
+    excecao = {"circuito": server.CircuitOpen("aberto"), "cancelado": server.ExportCancelled()}[erro]
+    breaker = server.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record(falha_erp)
+    relogio.agora += 30
+    breaker.before()
+    breaker.record(excecao)
+    # A tentativa foi liberada, mas o estado não mudou: outra chamada de teste pode passar
+    assert breaker.stats()["state"] == "half_open"
+    breaker.before()
+
+def test_conexao_descartada_informa_o_disjuntor(server, falha_erp):
+    class Pool:
+        on_query = None
+
+        def release(self, conn, discard=False):
+            self.liberada = (conn, discard)
+
+    pool, registrados = Pool(), []
+    conn = server.PooledConnection(pool, "conexao", on_close=registrados.append)
+    conn.discard(falha_erp)
+    conn.discard(falha_erp)  # segunda chamada não faz nada
+    assert registrados == [falha_erp]
+    assert pool.liberada == ("conexao", True)
+
+# Stale-while-revalidate no ResultCache
+
+def test_erp_fora_entrega_o_vencido(server, relogio, falha_erp):
+    idades = []
+    cache = server.ResultCache(stale_max=3600, on_stale=idades.append)
+    cache.put("k", "antigo", ttl=60)
+    relogio.agora += 90
+
+    def carregar():
+        raise falha_erp
+
+    assert cache.get_or_load("k", carregar, ttl=60) == "antigo"
+    assert idades == [90]
+    assert cache.stats()["stale_served"] == 1
+
+def test_erp_lento_entrega_o_vencido_e_atualiza_depois(server, relogio):
+    cache = server.ResultCache(stale_max=3600, stale_wait=0.05)
+    cache.put("k", "antigo", ttl=60)
+    relogio.agora += 90
+    liberar = threading.Event()
+
+    def carregar():
+        liberar.wait(5)
+        return "novo"
+
+    assert cache.get_or_load("k", carregar, ttl=60) == "antigo"
+    liberar.set()
+    limite = time.perf_counter() + 5
+    while cache.get("k") != (True, "novo"):
+        assert time.perf_counter() < limite
+        time.sleep(0.005)
+
+def test_erro_que_nao_e_do_erp_nao_usa_o_vencido(server, relogio):
+    cache = server.ResultCache(stale_max=3600)
+    cache.put("k", "antigo", ttl=60)
+    relogio.agora += 90
+    with pytest.raises(ZeroDivisionError):
+        cache.get_or_load("k", lambda: 1 / 0, ttl=60)
+
+def test_sem_vencido_o_erro_do_erp_sobe(server, falha_erp):
+    cache = server.ResultCache()
+
+    def carregar():
+        raise falha_erp
+
+    with pytest.raises(server.psycopg2.OperationalError):
+        cache.get_or_load("k", carregar)
@@ -0,0 +1,35 @@
+import pytest
+
+@pytest.fixture
+def breaker_aberto(server, monkeypatch):
+    breaker = server.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record(server.psycopg2.OperationalError("ERP fora"))
+    monkeypatch.setattr(server, "erp_breaker", breaker)
+    monkeypatch.setattr(server.venda_catalog, "tables", lambda: ["venda012026"])
+    return breaker
+
+@pytest.mark.parametrize("formato", ["csv", "ndjson"])
+def test_breaker_aberto_responde_503_antes_do_corpo(client, breaker_aberto, formato):
+    resposta = client.get(f"/vendas/exportar/2026-01?formato={formato}")
+    assert resposta.status_code == 503
+    assert "ERP indisponível" in resposta.get_json()["error"]
+    assert breaker_aberto.stats()["rejected"] == 1
+
+def test_erro_no_copy_responde_500(server, client, monkeypatch):
+    class Conexao:
+        def cursor(self):
+            raise server.psycopg2.ProgrammingError("relation does not exist")
+
+        def cancel(self):
+            pass
+
+        def discard(self, error=None):
+            self.descartada = error
+
+    conn = Conexao()
+    monkeypatch.setattr(server, "get_db_connection", lambda statement_timeout=None: conn)
+    monkeypatch.setattr(server.venda_catalog, "tables", lambda: ["venda012026"])
+    resposta = client.get("/vendas/exportar/2026-01")
+    assert resposta.status_code == 500
+    assert "relation does not exist" in resposta.get_json()["error"]
+    assert isinstance(conn.descartada, server.psycopg2.ProgrammingError)
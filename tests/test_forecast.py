@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+
+import pytest
+
+from forecast import damped_steps, forecast, holt, weekday_columns
+
+def eixo_de(inicio, dias):
+    return [inicio + timedelta(days=i) for i in range(dias)]
+
+# 2026-09-07 é segunda-feira
+SEGUNDA = date(2026, 9, 7)
+
+def test_colunas_do_dia_da_semana():
+    eixo = eixo_de(SEGUNDA, 15)
+    assert weekday_columns(eixo, 0) == [0, 7, 14]
+    assert weekday_columns(eixo, 6) == [6, 13]
+
+def test_holt_serie_constante_sem_tendencia():
+    assert holt([5.0, 5.0, 5.0, 5.0], 0.3, 0.1, 0.9) == (5.0, 0.0)
+    assert holt([], 0.3, 0.1, 0.9) == (0.0, 0.0)
+
+def test_holt_acompanha_crescimento():
+    nivel, tendencia = holt([10.0, 20.0, 30.0, 40.0], 0.5, 0.5, 1.0)
+    assert 10 < nivel < 40
+    assert tendencia > 0
+
+def test_passos_amortecidos():
+    assert damped_steps(1, 0.9) == pytest.approx(0.9)
+    assert damped_steps(3, 0.5) == pytest.approx(0.875)
+    assert damped_steps(2, 1.0) == 2
+
+def test_serie_constante_aplica_margem():
+    eixo = eixo_de(SEGUNDA, 28)
+    previsto = forecast(eixo, [[8.0] * 28], [SEGUNDA + timedelta(days=28)], margem=0.25)
+    assert previsto == [{"media": [8.0], "suavizada": [8.0], "tendencia": [0.0], "sugestao": [10.0]}]
+
+def test_cada_dia_usa_so_o_mesmo_dia_da_semana():
+    eixo = eixo_de(SEGUNDA, 28)
+    # Vende 12 às segundas e nada nos outros dias
+    serie = [12.0 if d.weekday() == 0 else 0.0 for d in eixo]
+    alvo = [SEGUNDA + timedelta(days=28), SEGUNDA + timedelta(days=29)]
+    previsto = forecast(eixo, [serie], alvo, margem=0)[0]
+    assert previsto["sugestao"] == [12.0, 0.0]
+
+def test_tendencia_cresce_com_o_horizonte():
+    eixo = eixo_de(SEGUNDA, 28)
+    serie = [float(10 * (i // 7 + 1)) for i in range(28)]
+    perto, longe = SEGUNDA + timedelta(days=28), SEGUNDA + timedelta(days=42)
+    previsto = forecast(eixo, [serie], [perto, longe], alpha=0.5, beta=0.5, phi=0.9, margem=0)[0]
+    assert previsto["tendencia"][0] == previsto["tendencia"][1] > 0
+    # Última segunda do histórico é o dia 21: três semanas à frente somam phi + phi² + phi³, não 3x
+    nivel, tendencia = holt([10.0, 20.0, 30.0, 40.0], 0.5, 0.5, 0.9)
+    assert previsto["suavizada"] == [round(nivel + 0.9 * tendencia, 3),
+                                     round(nivel + (0.9 + 0.81 + 0.729) * tendencia, 3)]
+
+def test_suavizada_nunca_negativa():
+    eixo = eixo_de(SEGUNDA, 28)
+    serie = [float(40 - 10 * (i // 7)) for i in range(28)]
+    previsto = forecast(eixo, [serie], [SEGUNDA + timedelta(days=70)], alpha=0.9, beta=0.9, phi=1.0)[0]
+    assert previsto["suavizada"] == [0.0]
+
+def test_dia_sem_historico_preve_zero():
+    eixo = eixo_de(SEGUNDA, 3)
+    previsto = forecast(eixo, [[5.0, 5.0, 5.0]], [SEGUNDA + timedelta(days=5)])[0]
+    assert previsto["sugestao"] == [0.0]
@@ -0,0 +1,29 @@
+import pytest
+
+import metrics
+
+def test_contador_calculado_sai_como_counter():
+    registro = metrics.Registry()
+    registro.counter_func("x_eventos_total", "Eventos", lambda: {("hits",): 3, ("misses",): 1}, ("kind",))
+    assert registro.render().splitlines() == [
+        "# HELP x_eventos_total Eventos",
+        "# TYPE x_eventos_total counter",
+        'x_eventos_total{kind="hits"} 3',
+        'x_eventos_total{kind="misses"} 1',
+    ]
+
+def test_contador_calculado_exige_sufixo_total():
+    with pytest.raises(ValueError):
+        metrics.Registry().counter_func("x_eventos", "Eventos", lambda: 1)
+
+def test_gauge_continua_gauge():
+    registro = metrics.Registry()
+    registro.gauge("x_em_andamento", "Em andamento", lambda: 2)
+    assert "# TYPE x_em_andamento gauge" in registro.render()
+
+def test_metricas_do_bridge(client):
+    texto = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE bridge_cache_events_total counter" in texto
+    assert "# TYPE bridge_coalesced_requests_total counter" in texto
+    assert "# TYPE bridge_coalesced_in_flight gauge" in texto
+    assert 'bridge_coalesced_requests_total{kind="in_flight"}' not in texto
@@ -0,0 +1,32 @@
+def test_codigo_nao_numerico_nem_chega_ao_banco(server, client, monkeypatch):
+    def sem_banco(*args, **kwargs):
+        raise AssertionError("não deveria consultar o ERP")
+
+    monkeypatch.setattr(server, "get_db_connection", sem_banco)
+    assert client.get("/produto/1%20OR%201=1").status_code == 404
+    assert client.get("/produto/abc").status_code == 404
+
+def test_codigo_vai_como_parametro(server, client, monkeypatch):
+    consultas = []
+
+    class Cursor:
+        def execute(self, sql, params=None):
+            consultas.append((sql, params))
+
+        def fetchone(self):
+            return {"id": 42, "descricao": "PRODUTO 42"}
+
+    class Conexao:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def cursor(self, cursor_factory=None):
+            return Cursor()
+
+    monkeypatch.setattr(server, "get_db_connection", lambda: Conexao())
+    resposta = client.get("/produto/42")
+    assert resposta.get_json() == {"found": True, "data": {"id": 42, "descricao": "PRODUTO 42"}}
+    assert consultas == [("SELECT * FROM produto WHERE id = %s LIMIT 1", (42,))]
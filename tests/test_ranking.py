@@ -0,0 +1,83 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+def totais(**por_produto):
+    return {int(cod[1:]): {"quantidade": q, "receita": r, "numero_vendas": 1}
+            for cod, (q, r) in por_produto.items()}
+
+def test_classe_pela_participacao_antes_do_produto(server):
+    # O item que cruza o corte ainda pertence à classe
+    assert server.classe_abc(0.3, 0.9, 0.8, 0.95) == "A"
+    assert server.classe_abc(0.05, 0.9, 0.8, 0.95) == "B"
+    assert server.classe_abc(0.04, 0.99, 0.8, 0.95) == "C"
+
+def test_ranking_e_curva_abc(server):
+    dados = totais(p1=(Decimal(60), 10), p2=(Decimal(25), 10), p3=(Decimal(10), 10), p4=(Decimal(5), 10))
+    ranking = server.rank_totais(dados, "quantidade", top=10, corte_a=0.8, corte_b=0.9)
+    # Antes de cada produto: 0, 0.60, 0.85, 0.95 -> A, A (cruza o corte de A), B, C
+    assert [(p["posicao"], p["codigo"], p["classe"]) for p in ranking["produtos"]] == [
+        (1, 1, "A"), (2, 2, "A"), (3, 3, "B"), (4, 4, "C")]
+    assert [p["participacao_acumulada"] for p in ranking["produtos"]] == [0.6, 0.85, 0.95, 1.0]
+    assert ranking["total"] == 100 and ranking["total_produtos"] == 4
+
+def test_totais_nao_dependem_do_filtro_de_classe(server):
+    dados = totais(p1=(Decimal(90), 10), p2=(Decimal(10), 10))
+    ranking = server.rank_totais(dados, "quantidade", top=10, corte_a=0.8, corte_b=1, classe="C")
+    assert ranking["produtos"] == []
+    assert ranking["total"] == 100 and ranking["total_produtos"] == 2
+
+def test_filtro_de_classe_mantem_a_posicao_geral(server):
+    dados = totais(p1=(Decimal(60), 10), p2=(Decimal(25), 10), p3=(Decimal(10), 10), p4=(Decimal(5), 10))
+    ranking = server.rank_totais(dados, "quantidade", top=10, corte_a=0.8, corte_b=0.9, classe="B")
+    assert [(p["posicao"], p["codigo"]) for p in ranking["produtos"]] == [(3, 3)]
+
+def test_metrica_nula_conta_zero_e_vai_para_o_fim(server):
+    dados = totais(p1=(1, None), p2=(1, Decimal(10)), p3=(1, Decimal(0)))
+    ranking = server.rank_totais(dados, "receita", top=10, corte_a=0.8, corte_b=0.95)
+    assert [p["codigo"] for p in ranking["produtos"]] == [2, 1, 3]
+    assert ranking["produtos"][1]["receita"] == 0
+
+def test_empate_pelo_codigo_e_limite_top(server):
+    dados = totais(p9=(Decimal(5), 1), p3=(Decimal(5), 1), p7=(Decimal(5), 1))
+    ranking = server.rank_totais(dados, "quantidade", top=2, corte_a=0.8, corte_b=0.95)
+    assert [p["codigo"] for p in ranking["produtos"]] == [3, 7]
+
+def test_soma_de_lojas(server):
+    loja_a = totais(p1=(Decimal(5), Decimal(50)), p2=(Decimal(1), None))
+    loja_b = totais(p1=(Decimal(2), Decimal(20)), p3=(Decimal(4), Decimal(8)))
+    soma = server.merge_totais([loja_a, loja_b])
+    assert soma[1] == {"quantidade": 7, "receita": 70, "numero_vendas": 2}
+    assert soma[2]["receita"] == 0 and soma[3]["quantidade"] == 4
+
+def test_totais_da_consulta_quando_o_filtro_nao_acha_nada(server, monkeypatch):
+    # plan_ranking_query devolve a linha de resumo com id_produto nulo quando nada passa no filtro
+    class Cursor:
+        def execute(self, sql, params=None):
+            self.sql = sql
+
+        def fetchall(self):
+            return [{"total": Decimal("143.5"), "total_produtos": 12, "id_produto": None}]
+
+    class Conexao:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def cursor(self, cursor_factory=None):
+            return Cursor()
+
+    monkeypatch.setattr(server.venda_catalog, "tables_between", lambda inicio, fim: ["venda012026"])
+    monkeypatch.setattr(server, "get_db_connection", lambda: Conexao())
+    monkeypatch.setattr(server, "fetch_nomes_produtos", lambda ids, conn=None: {})
+    ranking = server.fetch_vendas_ranking(date(2026, 1, 1), date(2026, 1, 31), "quantidade", 10, 0.8, 0.95, "C")
+    assert ranking["produtos"] == []
+    assert ranking["total"] == Decimal("143.5") and ranking["total_produtos"] == 12
+
+def test_consulta_ordena_metrica_nula_como_zero(server):
+    sql = server.plan_ranking_query(["venda012026"], "receita")
+    assert "ORDER BY COALESCE(receita, 0) DESC, id_produto" in sql
+    assert "LEFT JOIN" in sql
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+@pytest.fixture
+def relogio(server, monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(server.time, "monotonic", relogio)
+    return relogio
+
+def test_acerto_e_erro(server):
+    cache = server.ResultCache()
+    assert cache.get("a") == (False, None)
+    cache.put("a", [1, 2], rows=2)
+    assert cache.get("a") == (True, [1, 2])
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_periodo_fechado_nao_expira_e_hoje_expira(server):
+    cache = server.ResultCache(ttl_hoje=60)
+    assert cache.ttl_for(date.today() - timedelta(days=1)) is None
+    assert cache.ttl_for(date.today()) == 60
+
+def test_ttl(server, relogio):
+    cache = server.ResultCache(stale_max=100)
+    cache.put("hoje", "v", ttl=60)
+    cache.put("fechado", "f", ttl=None)
+    relogio.agora += 59
+    assert cache.get("hoje") == (True, "v")
+    relogio.agora += 2
+    assert cache.get("hoje") == (False, None)
+    assert cache.get_stale("hoje")[0] == "v"   # vencido continua guardado como reserva
+    relogio.agora += 100
+    assert cache.get("hoje") == (False, None)
+    assert cache.get_stale("hoje") is None     # passou de stale_max: removido
+    assert cache.get("fechado") == (True, "f")
+
+def test_lru_por_entradas(server):
+    cache = server.ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")       # a passa a ser o mais recente
+    cache.put("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1) and cache.get("c") == (True, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_por_linhas(server):
+    cache = server.ResultCache(max_rows=10)
+    cache.put("a", "a", rows=6)
+    cache.put("b", "b", rows=6)
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["rows"] == 6
+
+def test_resultado_maior_que_o_limite_nao_entra(server):
+    cache = server.ResultCache(max_rows=10)
+    cache.put("a", "a", rows=3)
+    cache.put("grande", "g", rows=11)
+    assert cache.get("grande") == (False, None)
+    assert cache.get("a") == (True, "a")
+
+def test_regravar_a_chave_nao_duplica_linhas(server):
+    cache = server.ResultCache()
+    cache.put("a", [1], rows=1)
+    cache.put("a", [1, 2], rows=2)
+    assert cache.stats()["rows"] == 2 and cache.stats()["entries"] == 1
+
+def test_get_or_load_carrega_uma_vez(server):
+    cache = server.ResultCache()
+    chamadas = []
+    carregar = lambda: chamadas.append(1) or [1, 2, 3]
+    assert cache.get_or_load("k", carregar) == [1, 2, 3]
+    assert cache.get_or_load("k", carregar) == [1, 2, 3]
+    assert len(chamadas) == 1
+    assert cache.stats()["rows"] == 3
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+def esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "tempo esgotado"
+        time.sleep(0.005)
+
+def em_paralelo(n, fn):
+    resultados, erros = [None] * n, [None] * n
+
+    def rodar(i):
+        try:
+            resultados[i] = fn()
+        except Exception as e:
+            erros[i] = e
+
+    threads = [threading.Thread(target=rodar, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, resultados, erros
+
+def test_chamadas_simultaneas_executam_uma_vez(server):
+    voo = server.SingleFlight()
+    liberar = threading.Event()
+    execucoes = []
+
+    def consulta():
+        execucoes.append(1)
+        liberar.wait(5)
+        return {"linhas": 3}
+
+    threads, resultados, erros = em_paralelo(5, lambda: voo.do("k", consulta))
+    esperar(lambda: voo.stats()["collapsed"] == 4)
+    liberar.set()
+    for t in threads:
+        t.join()
+    assert execucoes == [1]
+    assert erros == [None] * 5
+    assert all(r is resultados[0] for r in resultados)
+    assert voo.stats() == {"executed": 1, "collapsed": 4, "in_flight": 0}
+
+def test_erro_chega_a_todos_e_nao_fica_guardado(server):
+    voo = server.SingleFlight()
+    liberar = threading.Event()
+
+    def falha():
+        liberar.wait(5)
+        raise RuntimeError("ERP fora")
+
+    threads, _, erros = em_paralelo(3, lambda: voo.do("k", falha))
+    esperar(lambda: voo.stats()["collapsed"] == 2)
+    liberar.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(e, RuntimeError) for e in erros)
+    assert voo.do("k", lambda: "ok") == "ok"
+
+def test_chaves_diferentes_nao_se_agrupam(server):
+    voo = server.SingleFlight()
+    assert voo.do("a", lambda: 1) == 1
+    assert voo.do("b", lambda: 2) == 2
+    assert voo.stats()["executed"] == 2 and voo.stats()["collapsed"] == 0
+
+def test_chamadas_em_sequencia_executam_de_novo(server):
+    voo = server.SingleFlight()
+    contador = iter(range(10))
+    assert voo.do("k", lambda: next(contador)) == 0
+    assert voo.do("k", lambda: next(contador)) == 1
+
+def test_erro_do_lider(server):
+    voo = server.SingleFlight()
+    with pytest.raises(ValueError):
+        voo.do("k", lambda: int("x"))
+    assert voo.stats()["in_flight"] == 0
@@ -0,0 +1,64 @@
+import math
+from datetime import date
+
+from stockout import detect
+
+HOJE = date(2026, 10, 12)
+HISTORICO = [date(2026, 9, 21), date(2026, 9, 28), date(2026, 10, 5)]
+
+# 100 linhas por dia; o dia alvo vai do id 1000 ao 1099
+DIAS = {d: (i * 100, i * 100 + 99, 100) for i, d in enumerate(HISTORICO)}
+DIAS[HOJE] = (1000, 1099, 100)
+
+def historico(cod, quantidade, vendas, dias=HISTORICO):
+    return [(cod, d, quantidade, vendas, None) for d in dias]
+
+def test_parou_cedo():
+    # Taxa de 0.1 venda por linha; 59 linhas sem vender -> lambda 5.9
+    produtos = historico(1, 10, 10) + [(1, HOJE, 4, 4, 1040)]
+    alertas, resumo = detect(produtos, DIAS, HOJE)
+    assert [(a["codigo"], a["motivo"]) for a in alertas] == [(1, "parou_cedo")]
+    assert alertas[0]["vendas_esperadas_no_silencio"] == 5.9
+    assert alertas[0]["probabilidade"] == round(1 - math.exp(-5.9), 3)
+    assert alertas[0]["ultima_venda_fracao"] == round(40 / 99, 3)
+    assert resumo["produtos_analisados"] == 1 and resumo["progresso_dia"] == 1.0
+
+def test_sem_venda_no_dia():
+    alertas, _ = detect(historico(1, 10, 10), DIAS, HOJE)
+    assert alertas[0]["motivo"] == "sem_venda"
+    assert alertas[0]["vendas_esperadas_no_silencio"] == 10.0
+    assert alertas[0]["ultima_venda_fracao"] is None
+
+def test_venda_recente_nao_alerta():
+    produtos = historico(1, 10, 10) + [(1, HOJE, 10, 10, 1098)]
+    assert detect(produtos, DIAS, HOJE)[0] == []
+
+def test_abaixo_do_esperado():
+    # Vende até o fim do dia, mas 5 unidades contra 20 esperadas
+    produtos = historico(1, 20, 10) + [(1, HOJE, 5, 5, 1099)]
+    alertas, _ = detect(produtos, DIAS, HOJE)
+    assert [(a["motivo"], a["quantidade"], a["quantidade_esperada"]) for a in alertas] == [
+        ("abaixo_esperado", 5, 20)]
+
+def test_produto_raro_nao_alerta_por_quantidade():
+    # Menos de min_vendas_esperadas no dia: quantidade baixa é ruído
+    produtos = historico(1, 2, 1) + [(1, HOJE, 0, 1, 1099)]
+    assert detect(produtos, DIAS, HOJE)[0] == []
+
+def test_poucos_dias_de_historico_ficam_fora():
+    alertas, resumo = detect(historico(1, 10, 10, HISTORICO[:2]), DIAS, HOJE)
+    assert alertas == [] and resumo["produtos_analisados"] == 0
+
+def test_ordem_do_mais_provavel():
+    produtos = (historico(1, 10, 10) + [(1, HOJE, 4, 4, 1040)]
+                + historico(2, 10, 10)
+                + historico(3, 20, 10) + [(3, HOJE, 5, 5, 1099)])
+    alertas, _ = detect(produtos, DIAS, HOJE)
+    assert [a["codigo"] for a in alertas] == [2, 1, 3]
+
+def test_dia_alvo_sem_movimento():
+    dias = {d: DIAS[d] for d in HISTORICO}
+    alertas, resumo = detect(historico(1, 10, 10), dias, HOJE)
+    assert alertas == []
+    assert resumo["linhas_dia"] == 0 and resumo["progresso_dia"] is None
+    assert resumo["linhas_media_historico"] == 100
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import sys
+
+def editar(path, prefixo, n):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vr_soft_api"))
+    import server
+    listas = server.Watchlists(path, compute=None)
+    for i in range(n):
+        listas.put(f"{prefixo}{i}", [i])
+    listas.delete(f"{prefixo}0")
+
+def test_edicoes_em_processos_diferentes_nao_se_perdem(tmp_path):
+    path = str(tmp_path / "watchlists.json")
+    ctx = multiprocessing.get_context("spawn")
+    processos = [ctx.Process(target=editar, args=(path, prefixo, 15)) for prefixo in "abcd"]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join(60)
+        assert p.exitcode == 0
+
+    import server
+    nomes = server.Watchlists(path, compute=None).names()
+    assert set(nomes) == {f"{prefixo}{i}" for prefixo in "abcd" for i in range(1, 15)}
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+def test_outro_processo_altera_e_o_resultado_guardado_e_descartado(server, tmp_path):
+    path = str(tmp_path / "watchlists.json")
+    calculos = []
+    a = server.Watchlists(path, compute=lambda nome, codigos: calculos.append(codigos) or {"codigos": codigos})
+    b = server.Watchlists(path, compute=None)
+    a.put("x", [1, 2])
+    a.result("x")
+    b.put("x", [3])
+    assert a.codigos("x") == [3]
+    a.result("x")
+    assert calculos == [[1, 2], [3]]
+
+def test_seguidor_usa_o_resultado_do_principal_sem_recalcular(server, tmp_path):
+    path, results = str(tmp_path / "watchlists.json"), str(tmp_path / "resultados.db")
+    principal = server.Watchlists(path, compute=lambda nome, codigos: {"codigos": codigos}, results_path=results)
+    principal.put("x", [1, 2])
+    corpo, etag, _, _ = principal.refresh("x")
+
+    def nao_calcula(nome, codigos):
+        raise AssertionError("o seguidor não deve ir ao ERP")
+
+    seguidor = server.Watchlists(path, compute=nao_calcula, results_path=results)
+    seguidor._load_results()
+    assert seguidor.result("x")[:2] == (corpo, etag)
+
+def test_seguidor_ignora_resultado_de_lista_antiga(server, tmp_path):
+    path, results = str(tmp_path / "watchlists.json"), str(tmp_path / "resultados.db")
+    principal = server.Watchlists(path, compute=lambda nome, codigos: {"codigos": codigos}, results_path=results)
+    principal.put("x", [1, 2])
+    principal.refresh("x")
+
+    calculos = []
+    seguidor = server.Watchlists(path, compute=lambda nome, codigos: calculos.append(codigos) or {"codigos": codigos},
+                                 results_path=results)
+    seguidor.put("x", [3])
+    seguidor._load_results()
+    seguidor.result("x")
+    assert calculos == [[3]]
@@ -0,0 +1,9 @@
+@echo off
+cd /d "%~dp0"
+title VR API - PRODUCAO
+
+REM Bridge em modo de producao (ver serve.py): workers, threads limitadas e reinicio gracioso
+REM Ex.: INICIAR_PRODUCAO.bat --workers 2 --threads 16
+set "PYTHON=%~dp0python.exe"
+
+"%PYTHON%" serve.py %* >> api_log.txt 2>&1
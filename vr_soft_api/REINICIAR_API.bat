@@ -0,0 +1,7 @@
+@echo off
+cd /d "%~dp0"
+
+REM Reinicio gracioso do serve.py em execucao (um worker por vez, sem derrubar conexoes)
+set "PYTHON=%~dp0python.exe"
+
+"%PYTHON%" serve.py --reiniciar
@@ -0,0 +1,408 @@
+"""
+Benchmark do bridge contra um Postgres local, sem tocar no ERP.
+
+    setup    sobe um Postgres local (initdb + pg_ctl, se --pgdata) e cria as
+             tabelas produto e vendaMMYYYY com vendas sintéticas calibradas
+             pelo histórico real (ver synthetic_sales.py), até o dia de hoje
+    run      serve o app do server.py num servidor HTTP com threads, apontado
+             para esse banco (ou usa um bridge já rodando, com --url), e
+             dispara cada rota com N clientes simultâneos por --duracao
+             segundos; grava p50/p95/p99, vazão e consultas ao banco por
+             requisição num JSON
+    compare  diferença entre dois resultados do run
+    stop     para o Postgres iniciado pelo setup
+
+As consultas por requisição e os acertos de cache vêm da diferença do
+/metrics antes e depois de cada rodada, então valem também com --url.
+Os parâmetros (códigos, datas) são sorteados com --seed: duas rodadas
+com a mesma seed fazem as mesmas requisições. /vendas/stream (SSE) fica
+de fora: a conexão não termina.
+
+Uso:
+    python benchmark.py setup --pgdata C:\\bench\\pg --meses 24 --linhas-dia 40000
+    python benchmark.py run --concorrencia 1,8,32 --duracao 15 --saida antes.json
+    python benchmark.py compare antes.json depois.json
+    python benchmark.py stop --pgdata C:\\bench\\pg
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+
+import psycopg2
+
+from synthetic_sales import generate
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCH_DB = {"host": "127.0.0.1", "port": "55432", "database": "vr_bench", "user": "postgres", "password": ""}
+
+# ============================================
+# POSTGRES LOCAL
+# ============================================
+
+def pg_command(pg_bin, nome):
+    return os.path.join(pg_bin, nome) if pg_bin else nome
+
+def start_postgres(pgdata, port, pg_bin=None):
+    """Cria o cluster em pgdata (se ainda não existe) e o inicia na porta, só em 127.0.0.1"""
+    if not os.path.exists(os.path.join(pgdata, "PG_VERSION")):
+        subprocess.run([pg_command(pg_bin, "initdb"), "-D", pgdata, "-U", "postgres",
+                        "-A", "trust", "-E", "UTF8"], check=True)
+    status = subprocess.run([pg_command(pg_bin, "pg_ctl"), "-D", pgdata, "status"], capture_output=True)
+    if status.returncode == 0:
+        print(f"Postgres já rodando em {pgdata}")
+        return
+    opcoes = f"-p {port} -c listen_addresses=127.0.0.1"
+    if os.name != "nt":
+        opcoes += f' -k "{pgdata}"'
+    subprocess.run([pg_command(pg_bin, "pg_ctl"), "-D", pgdata, "-o", opcoes,
+                    "-l", os.path.join(pgdata, "postgres.log"), "-w", "start"], check=True)
+
+def stop_postgres(pgdata, pg_bin=None):
+    subprocess.run([pg_command(pg_bin, "pg_ctl"), "-D", pgdata, "-m", "fast", "-w", "stop"], check=True)
+
+def ensure_database(db):
+    """Cria o banco de benchmark se ainda não existe"""
+    conn = psycopg2.connect(**dict(db, database="postgres"))
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db["database"],))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{db["database"]}"')
+    finally:
+        conn.close()
+
+def setup(args):
+    db = db_from_args(args)
+    if args.pgdata:
+        start_postgres(args.pgdata, db["port"], args.pg_bin)
+    ensure_database(db)
+    generate(db=db, meses=args.meses, produtos=args.produtos, linhas_dia=args.linhas_dia,
+             seed=args.seed, processos=args.processos, indice=args.indice)
+
+# ============================================
+# CENÁRIOS
+# ============================================
+
+class Contexto:
+    """Códigos e datas disponíveis no banco de benchmark, para sortear parâmetros"""
+
+    def __init__(self, db):
+        conn = psycopg2.connect(**db)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id FROM produto ORDER BY id")
+                self.codigos = [r[0] for r in cur.fetchall()]
+                cur.execute("""
+                    SELECT count(*), COALESCE(sum(reltuples), 0)::bigint FROM pg_class
+                    WHERE relkind = 'r' AND relname ~ '^venda[0-9]{6}$'
+                """)
+                self.tabelas, self.linhas = cur.fetchone()
+        finally:
+            conn.close()
+        self.hoje = date.today()
+
+    def codigo(self, rng):
+        # Viés para os primeiros códigos: os tablets consultam quase sempre os mesmos produtos
+        return self.codigos[min(len(self.codigos) - 1, int(rng.expovariate(1 / 200)))]
+
+    def lista(self, rng, n):
+        return sorted({self.codigo(rng) for _ in range(n)})
+
+    def dia(self, rng, ate=60):
+        return self.hoje - timedelta(days=rng.randint(0, ate))
+
+def _get(path, **query):
+    return "GET", f"{path}?{urlencode(query)}" if query else path, None
+
+def _post(path, body):
+    return "POST", path, body
+
+def _periodo(ctx, rng, dias):
+    fim = ctx.dia(rng, 30)
+    return (fim - timedelta(days=dias - 1)).isoformat(), fim.isoformat()
+
+def _ranking(ctx, rng):
+    inicio, fim = _periodo(ctx, rng, 30)
+    return _get("/vendas/ranking", data_inicio=inicio, data_fim=fim, top=50)
+
+def _periodo_produtos(ctx, rng):
+    inicio, fim = _periodo(ctx, rng, rng.choice((7, 30, 90)))
+    return _post("/vendas/produtos/periodo", {"codigos": ctx.lista(rng, 30), "data_inicio": inicio, "data_fim": fim})
+
+def _serie(ctx, rng):
+    inicio, fim = _periodo(ctx, rng, 60)
+    return _post("/vendas/serie", {"codigos": ctx.lista(rng, 10), "data_inicio": inicio, "data_fim": fim})
+
+def _exportar(ctx, rng):
+    d = ctx.dia(rng, 20)
+    return _get(f"/vendas/exportar/{d:%Y-%m}", formato="ndjson", data_inicio=d.isoformat(), data_fim=d.isoformat())
+
+# nome -> fn(contexto, rng) -> (método, caminho, corpo JSON ou None)
+CENARIOS = {
+    "home": lambda ctx, rng: _get("/"),
+    "produto": lambda ctx, rng: _get(f"/produto/{ctx.codigo(rng)}"),
+    "vendas_produto": lambda ctx, rng: _get(f"/vendas/produto/{ctx.codigo(rng)}"),
+    "historico": lambda ctx, rng: _get(f"/vendas/produto/{ctx.codigo(rng)}/historico"),
+    "vendas_produtos": lambda ctx, rng: _post("/vendas/produtos", {"codigos": ctx.lista(rng, 20)}),
+    "ruptura": lambda ctx, rng: _get(f"/vendas/ruptura/{ctx.dia(rng, 14)}"),
+    "ruptura_alertas": lambda ctx, rng: _get(f"/vendas/ruptura/{ctx.dia(rng, 14)}/alertas"),
+    "periodo": _periodo_produtos,
+    "ranking": _ranking,
+    "serie": _serie,
+    "comparativo": lambda ctx, rng: _post("/vendas/comparativo", {
+        "codigos": ctx.lista(rng, 20), "data": ctx.dia(rng, 14).isoformat(), "semanas": 4}),
+    "previsao": lambda ctx, rng: _post("/previsao", {"codigos": ctx.lista(rng, 20), "dias": 3}),
+    "perfil": lambda ctx, rng: _get("/vendas/perfil", codigos=",".join(map(str, ctx.lista(rng, 20)))),
+    "watchlist": lambda ctx, rng: _get("/vendas/watchlist/rotisseria"),
+    "exportar": _exportar,
+    "changes": lambda ctx, rng: _get("/vendas/changes"),
+    "metrics": lambda ctx, rng: _get("/metrics"),
+    "debug_slow": lambda ctx, rng: _get("/debug/slow"),
+}
+
+# ============================================
+# EXECUÇÃO
+# ============================================
+
+def percentile(ordenados, p):
+    """Percentil p (0-100) pelo posto mais próximo"""
+    if not ordenados:
+        return None
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def scrape(base_url):
+    """Totais do /metrics usados nas diferenças: consultas ao banco e eventos do cache"""
+    with urlopen(base_url + "/metrics", timeout=30) as resp:
+        texto = resp.read().decode()
+    totais = Counter()
+    for linha in texto.splitlines():
+        nome, _, valor = linha.rpartition(" ")
+        if nome.startswith("bridge_db_query_duration_seconds_count"):
+            totais["consultas"] += float(valor)
+        elif nome == 'bridge_cache_events_total{kind="hits"}':
+            totais["cache_hits"] += float(valor)
+        elif nome == 'bridge_cache_events_total{kind="misses"}':
+            totais["cache_misses"] += float(valor)
+    return totais
+
+def run_phase(base_url, nome, ctx, concorrencia, duracao, seed):
+    """Dispara o cenário com `concorrencia` clientes por `duracao` segundos"""
+    alvo = urlsplit(base_url)
+    cenario = CENARIOS[nome]
+    latencias = [[] for _ in range(concorrencia)]
+    status = [Counter() for _ in range(concorrencia)]
+    fim = time.perf_counter() + duracao
+
+    def cliente(i):
+        rng = random.Random(f"{seed}:{nome}:{i}")
+        conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=300)
+        while time.perf_counter() < fim:
+            metodo, caminho, corpo = cenario(ctx, rng)
+            headers = {"Accept-Encoding": "gzip"}
+            if corpo is not None:
+                headers["Content-Type"] = "application/json"
+            inicio = time.perf_counter()
+            try:
+                conn.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                codigo = str(resp.status)
+            except Exception as e:
+                codigo = type(e).__name__
+                conn.close()
+            latencias[i].append(time.perf_counter() - inicio)
+            status[i][codigo] += 1
+        conn.close()
+
+    antes = scrape(base_url)
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=cliente, args=(i,), daemon=True) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+    depois = scrape(base_url)
+
+    todas = sorted(x for lista in latencias for x in lista)
+    contagem = sum(status, Counter())
+    n = len(todas)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "rota": nome,
+        "concorrencia": concorrencia,
+        "requisicoes": n,
+        "erros": sum(v for k, v in contagem.items() if not k.startswith(("2", "3"))),
+        "status": dict(sorted(contagem.items())),
+        "duracao_s": round(decorrido, 2),
+        "vazao_rps": round(n / decorrido, 2) if decorrido else None,
+        "media_ms": ms(sum(todas) / n) if n else None,
+        "p50_ms": ms(percentile(todas, 50)),
+        "p95_ms": ms(percentile(todas, 95)),
+        "p99_ms": ms(percentile(todas, 99)),
+        "max_ms": ms(todas[-1]) if todas else None,
+        # /metrics também conta as consultas de refresh em segundo plano que caírem na rodada
+        "consultas_por_requisicao": round((depois["consultas"] - antes["consultas"]) / n, 2) if n else None,
+        "cache_hits": int(depois["cache_hits"] - antes["cache_hits"]),
+        "cache_misses": int(depois["cache_misses"] - antes["cache_misses"]),
+    }
+
+def serve_in_process(db, jobs, data_dir):
+    """
+    Importa o server.py apontado para o banco de benchmark e o serve numa porta livre.
+    Os arquivos de estado (espelho, perfis, listas, log, cache compartilhado) ficam
+    em data_dir, e o lojas.json de produção não é lido: nada do bridge real é tocado.
+    """
+    from werkzeug.serving import make_server
+    os.environ["BRIDGE_DATA_DIR"] = data_dir  # lido na importação do server.py
+    sys.path.insert(0, BASE_DIR)
+    import server
+    server.DB.update(db)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # sem uma linha de log por requisição
+    if jobs:
+        server.start_background_jobs()
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="benchmark-http", daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}", httpd
+
+def run(args):
+    db = db_from_args(args)
+    ctx = Contexto(db)
+    rotas = args.rotas.split(",") if args.rotas else list(CENARIOS)
+    desconhecidas = [r for r in rotas if r not in CENARIOS]
+    if desconhecidas:
+        sys.exit(f"Rota desconhecida: {', '.join(desconhecidas)} (disponíveis: {', '.join(CENARIOS)})")
+    niveis = [int(c) for c in args.concorrencia.split(",")]
+
+    httpd = None
+    data_dir = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        data_dir = tempfile.mkdtemp(prefix="bridge-benchmark-")
+        base_url, httpd = serve_in_process(db, args.jobs, data_dir)
+    with urlopen(base_url + "/", timeout=30) as resp:
+        versao = json.loads(resp.read()).get("version")
+
+    resultados = []
+    print(f"{'rota':<16} {'conc':>4} {'req':>7} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'cons/req':>8} erros")
+    try:
+        for nome in rotas:
+            for concorrencia in niveis:
+                r = run_phase(base_url, nome, ctx, concorrencia, args.duracao, args.seed)
+                resultados.append(r)
+                print(f"{nome:<16} {concorrencia:>4} {r['requisicoes']:>7} {r['vazao_rps'] or 0:>8} "
+                      f"{r['p50_ms'] or 0:>9} {r['p95_ms'] or 0:>9} {r['p99_ms'] or 0:>9} "
+                      f"{r['consultas_por_requisicao'] if r['consultas_por_requisicao'] is not None else '-':>8} "
+                      f"{r['erros'] or ''}")
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)  # no Windows o SQLite ainda aberto pode ficar para trás
+
+    saida = args.saida or os.path.join(BASE_DIR, "benchmarks", f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump({
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "versao_api": versao,
+            "alvo": args.url or "em processo",
+            "banco": {"database": db["database"], "tabelas_venda": ctx.tabelas, "linhas_venda": ctx.linhas},
+            "config": {"concorrencia": niveis, "duracao_s": args.duracao, "seed": args.seed, "rotas": rotas},
+            "resultados": resultados,
+        }, f, indent=1, ensure_ascii=False)
+    print(f"Resultado em {saida}")
+
+def compare(args):
+    with open(args.antes, encoding="utf-8") as f:
+        antes = {(r["rota"], r["concorrencia"]): r for r in json.load(f)["resultados"]}
+    with open(args.depois, encoding="utf-8") as f:
+        depois = {(r["rota"], r["concorrencia"]): r for r in json.load(f)["resultados"]}
+
+    def delta(a, b):
+        if a is None or b is None:
+            return "-"
+        return f"{a}→{b}" + (f" ({(b - a) / a:+.0%})" if a else "")
+
+    for chave in [k for k in antes if k in depois]:
+        a, b = antes[chave], depois[chave]
+        print(f"{chave[0]:<16} x{chave[1]:<3} rps {delta(a['vazao_rps'], b['vazao_rps'])}  "
+              f"p50 {delta(a['p50_ms'], b['p50_ms'])}  p95 {delta(a['p95_ms'], b['p95_ms'])}  "
+              f"p99 {delta(a['p99_ms'], b['p99_ms'])}  "
+              f"consultas/req {delta(a['consultas_por_requisicao'], b['consultas_por_requisicao'])}")
+    for chave in sorted(set(antes) ^ set(depois)):
+        print(f"{chave[0]:<16} x{chave[1]:<3} só em {'antes' if chave in antes else 'depois'}")
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def db_from_args(args):
+    return {"host": args.host, "port": str(args.port), "database": args.database,
+            "user": args.user, "password": args.password}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do bridge de vendas contra um Postgres local")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    def banco(p):
+        p.add_argument("--host", default=BENCH_DB["host"])
+        p.add_argument("--port", default=BENCH_DB["port"])
+        p.add_argument("--database", default=BENCH_DB["database"])
+        p.add_argument("--user", default=BENCH_DB["user"])
+        p.add_argument("--password", default=BENCH_DB["password"])
+
+    p = sub.add_parser("setup", help="sobe o Postgres local e gera os dados")
+    banco(p)
+    p.add_argument("--pgdata", help="diretório do cluster local (sem ele, usa um Postgres já rodando)")
+    p.add_argument("--pg-bin", help="pasta com initdb/pg_ctl, se não estiverem no PATH")
+    p.add_argument("--produtos", type=int, default=20000)
+    p.add_argument("--meses", type=int, default=24)
+    p.add_argument("--linhas-dia", type=int, default=40000, help="linhas num dia típico")
+    p.add_argument("--indice", action="store_true", help="cria índice (data, id_produto) em cada tabela")
+    p.add_argument("--processos", type=int, help="meses gerados ao mesmo tempo (padrão: núcleos)")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(fn=setup)
+
+    p = sub.add_parser("run", help="mede as rotas")
+    banco(p)
+    p.add_argument("--url", help="bridge já rodando (ex.: http://127.0.0.1:5005); sem ele, sobe o app em processo")
+    p.add_argument("--rotas", help=f"lista separada por vírgula (padrão: todas): {', '.join(CENARIOS)}")
+    p.add_argument("--concorrencia", default="1,8", help="clientes simultâneos, ex.: 1,8,32")
+    p.add_argument("--duracao", type=float, default=10, help="segundos por rota e nível de concorrência")
+    p.add_argument("--jobs", action="store_true", help="inicia espelho, perfis e watchlists (só em processo)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--saida", help="arquivo JSON do resultado (padrão: benchmarks/<data>.json)")
+    p.set_defaults(fn=run)
+
+    p = sub.add_parser("compare", help="compara dois resultados")
+    p.add_argument("antes")
+    p.add_argument("depois")
+    p.set_defaults(fn=compare)
+
+    p = sub.add_parser("stop", help="para o Postgres local")
+    p.add_argument("--pgdata", required=True)
+    p.add_argument("--pg-bin")
+    p.set_defaults(fn=lambda a: stop_postgres(a.pgdata, a.pg_bin))
+
+    args = parser.parse_args()
+    args.fn(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Previsão de produção a partir do histórico diário de vendas.
+
+Entrada: a matriz densa de fetch_vendas_serie (eixo de dias consecutivos e
+uma lista de quantidades por produto, alinhada ao eixo). Para cada dia a
+prever, a série do produto naquele mesmo dia da semana é resumida por:
+- média móvel das últimas `janela` ocorrências;
+- suavização exponencial de Holt (nível + tendência amortecida por phi).
+A sugestão combina as duas (peso_media) e aplica a margem de segurança.
+
+Tudo é calculado coluna a coluna sobre a matriz inteira: os índices de cada
+dia da semana são resolvidos uma vez e reaproveitados para todos os produtos.
+"""
+
+def weekday_columns(eixo, weekday):
+    """Posições do eixo que caem no dia da semana (0 = segunda)"""
+    return [i for i, d in enumerate(eixo) if d.weekday() == weekday]
+
+def moving_average(valores, janela):
+    ultimos = valores[-janela:]
+    return sum(ultimos) / len(ultimos) if ultimos else 0.0
+
+def holt(valores, alpha, beta, phi):
+    """(nível, tendência) finais da suavização de Holt com tendência amortecida"""
+    if not valores:
+        return 0.0, 0.0
+    # Tendência começa em zero: com poucas semanas a primeira diferença é só ruído
+    nivel, tendencia = valores[0], 0.0
+    for x in valores[1:]:
+        anterior = nivel
+        nivel = alpha * x + (1 - alpha) * (anterior + phi * tendencia)
+        tendencia = beta * (nivel - anterior) + (1 - beta) * phi * tendencia
+    return nivel, tendencia
+
+def damped_steps(passos, phi):
+    """phi + phi² + ... + phi^passos: peso da tendência a `passos` semanas à frente"""
+    return sum(phi ** k for k in range(1, passos + 1))
+
+def forecast(eixo, quantidades, datas, janela=4, alpha=0.3, beta=0.1, phi=0.9,
+             peso_media=0.5, margem=0.1):
+    """
+    Previsão de cada produto (linha de quantidades) para cada dia de datas.
+    Retorna uma lista por produto de {"media", "suavizada", "tendencia", "sugestao"},
+    cada campo uma lista alinhada a datas.
+    """
+    dias_semana = sorted({d.weekday() for d in datas})
+    colunas = {w: weekday_columns(eixo, w) for w in dias_semana}
+    # Semanas entre a última ocorrência do dia da semana no histórico e o dia previsto
+    passos = []
+    for d in datas:
+        cols = colunas[d.weekday()]
+        passos.append(max(1, (d - eixo[cols[-1]]).days // 7) if cols else 1)
+
+    resultado = []
+    for serie in quantidades:
+        por_dia = {w: [serie[i] for i in cols] for w, cols in colunas.items()}
+        medias = {w: moving_average(v, janela) for w, v in por_dia.items()}
+        ajustes = {w: holt(v, alpha, beta, phi) for w, v in por_dia.items()}
+        item = {"media": [], "suavizada": [], "tendencia": [], "sugestao": []}
+        for d, h in zip(datas, passos):
+            w = d.weekday()
+            nivel, tendencia = ajustes[w]
+            suavizada = max(0.0, nivel + damped_steps(h, phi) * tendencia)
+            base = peso_media * medias[w] + (1 - peso_media) * suavizada
+            item["media"].append(round(medias[w], 3))
+            item["suavizada"].append(round(suavizada, 3))
+            item["tendencia"].append(round(tendencia, 3))
+            item["sugestao"].append(round(base * (1 + margem), 3))
+        resultado.append(item)
+    return resultado
@@ -0,0 +1,130 @@
+"""
+Métricas no formato texto do Prometheus, sem dependências externas.
+
+Contadores e histogramas com rótulos, mais gauges e contadores calculados
+na hora da coleta (a partir dos stats() que o bridge já expõe). render()
+devolve o texto servido em /metrics.
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _number(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            itens = sorted(self._values.items())
+        for labels, v in itens:
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(v)}"
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # rótulos -> [contagens por bucket..., soma, total]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            serie = self._values.get(labels)
+            if serie is None:
+                serie = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    serie[i] += 1
+            serie[-2] += value
+            serie[-1] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            itens = sorted((k, list(v)) for k, v in self._values.items())
+        nomes = self.labels + ("le",)
+        for labels, serie in itens:
+            for limite, n in zip(self.buckets, serie):
+                yield f"{self.name}_bucket{_labels(nomes, labels + (_number(float(limite)),))} {n}"
+            yield f"{self.name}_bucket{_labels(nomes, labels + ('+Inf',))} {serie[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(serie[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {serie[-1]}"
+
+class Gauge:
+    """Valor lido na hora da coleta: fn() -> número ou {(rótulos,): número}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+
+    def collect(self):
+        try:
+            valor = self.fn()
+        except Exception:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        itens = sorted(valor.items()) if isinstance(valor, dict) else [((), valor)]
+        for labels, v in itens:
+            if v is not None:
+                yield f"{self.name}{_labels(self.labels, labels)} {_number(v)}"
+
+class CounterFunc(Gauge):
+    """Contador lido na hora da coleta (total que só cresce desde o início do processo); nome terminado em _total"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, fn, labels=()):
+        if not name.endswith("_total"):
+            raise ValueError(f"Contador deve terminar em _total: {name}")
+        super().__init__(name, help, fn, labels)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()):
+        return self.register(Gauge(name, help, fn, labels))
+
+    def counter_func(self, name, help, fn, labels=()):
+        return self.register(CounterFunc(name, help, fn, labels))
+
+    def render(self):
+        return "\n".join(linha for m in self._metrics for linha in m.collect()) + "\n"
@@ -0,0 +1,280 @@
+"""
+Perfis de venda por produto e dia da semana, recalculados toda madrugada.
+
+Para cada produto e dia da semana: quantos desses dias houve desde a
+primeira venda do produto, em quantos ele vendeu, e média, mediana e
+percentis da quantidade diária (dias sem venda contam como zero).
+
+Sazonalidade: o mesmo perfil também por mês do ano (dia da semana dentro de
+cada mês), só para os meses com pelo menos min_month_days desses dias no
+histórico do produto; nos outros a consulta usa o perfil de todos os meses.
+
+A fonte é o espelho local (vendas_dia, já somado por produto e dia); o
+resultado vai para um SQLite próprio, indexado por (produto, mês, dia da
+semana), com mês 0 para todos os meses, e fica inteiro em memória para as
+consultas.
+
+Uso avulso (recalcula e sai):
+    python profiles.py
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perfil (
+    id_produto INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    dia_semana INTEGER NOT NULL,
+    dias INTEGER NOT NULL,
+    dias_com_venda INTEGER NOT NULL,
+    media REAL NOT NULL,
+    mediana REAL NOT NULL,
+    p10 REAL NOT NULL,
+    p25 REAL NOT NULL,
+    p75 REAL NOT NULL,
+    p90 REAL NOT NULL,
+    PRIMARY KEY (id_produto, mes, dia_semana)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+FIELDS = ("dias", "dias_com_venda", "media", "mediana", "p10", "p25", "p75", "p90")
+
+def weekday_count(inicio, fim, weekday):
+    """Quantas datas entre inicio e fim (inclusive) caem no dia da semana"""
+    if fim < inicio:
+        return 0
+    primeiro = inicio + timedelta(days=(weekday - inicio.weekday()) % 7)
+    return 0 if primeiro > fim else (fim - primeiro).days // 7 + 1
+
+def percentile(ordenados, p):
+    """Percentil p (0-100) com interpolação linear entre vizinhos"""
+    if not ordenados:
+        return 0.0
+    pos = (len(ordenados) - 1) * p / 100
+    i = int(pos)
+    if i + 1 >= len(ordenados):
+        return ordenados[-1]
+    return ordenados[i] + (ordenados[i + 1] - ordenados[i]) * (pos - i)
+
+def month_weekday_count(inicio, fim):
+    """{(mes, dia_semana): quantas datas entre inicio e fim (inclusive)}"""
+    contagem = {}
+    dia = inicio
+    while dia <= fim:
+        chave = (dia.month, dia.weekday())
+        contagem[chave] = contagem.get(chave, 0) + 1
+        dia += timedelta(days=1)
+    return contagem
+
+def bucket_stats(valores, dias):
+    """(dias, dias_com_venda, media, mediana, p10, p25, p75, p90) de `dias` dias com `valores` vendidos"""
+    ordenados = [0.0] * (dias - len(valores)) + sorted(valores)
+    return (
+        dias, len(valores), round(sum(valores) / dias, 3),
+        *(round(percentile(ordenados, p), 3) for p in (50, 10, 25, 75, 90)),
+    )
+
+def weekday_profile(vendas, primeira, ultima):
+    """
+    vendas: [(data, quantidade)] de um produto com venda; primeira/ultima: período considerado.
+    Retorna {dia_semana: (dias, dias_com_venda, media, mediana, p10, p25, p75, p90)}
+    """
+    por_dia = {w: [] for w in range(7)}
+    for data, quantidade in vendas:
+        por_dia[data.weekday()].append(quantidade)
+    perfil = {}
+    for w, valores in por_dia.items():
+        dias = weekday_count(primeira, ultima, w)
+        if dias:
+            perfil[w] = bucket_stats(valores, dias)
+    return perfil
+
+def month_weekday_profile(vendas, contagem, min_dias):
+    """
+    Como weekday_profile, por (mes, dia_semana); contagem vem de month_weekday_count
+    do mesmo período. Fica de fora o que tem menos de min_dias dias no período.
+    """
+    por_chave = {}
+    for data, quantidade in vendas:
+        por_chave.setdefault((data.month, data.weekday()), []).append(quantidade)
+    return {chave: bucket_stats(por_chave.get(chave, []), dias)
+            for chave, dias in contagem.items() if dias >= min_dias}
+
+class ProfileStore:
+    """
+    Perfis por (produto, mês, dia da semana) num SQLite próprio; mês 0 = todos os meses.
+    source(ate) deve devolver (id_produto, data, quantidade) dos dias até `ate`,
+    ordenado por id_produto e data; ready() diz se a fonte já pode ser lida.
+    """
+
+    def __init__(self, path, source, ready=lambda: True, hour=3, check_interval=600, min_month_days=8):
+        self.path = path
+        self.source = source
+        self.ready = ready
+        self.hour = hour                      # recalcula a partir desta hora, uma vez por dia
+        self.check_interval = check_interval  # segundos entre verificações
+        self.min_month_days = min_month_days  # dias mínimos de um dia da semana num mês para o perfil do mês
+        self._lock = threading.Lock()
+        self._thread = None
+        self._perfis = {}                     # id_produto -> {(mes, dia_semana): tupla de FIELDS}
+        self._meta = {}
+        self._last_error = None
+        self._last_duration = None
+        with self._db() as db:
+            # Arquivo de antes do mês na chave: descarta e recalcula
+            colunas = {r[1] for r in db.execute("PRAGMA table_info(perfil)")}
+            if colunas and "mes" not in colunas:
+                db.execute("DROP TABLE perfil")
+                db.execute("DROP TABLE IF EXISTS meta")
+            db.executescript(SCHEMA)
+        self.load()
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def load(self):
+        """Lê o arquivo inteiro para a memória"""
+        perfis = {}
+        with self._db() as db:
+            for row in db.execute(f"SELECT id_produto, mes, dia_semana, {', '.join(FIELDS)} FROM perfil"):
+                perfis.setdefault(row[0], {})[(row[1], row[2])] = row[3:]
+            meta = dict(db.execute("SELECT chave, valor FROM meta"))
+        self._perfis, self._meta = perfis, meta
+        return len(perfis)
+
+    def build(self):
+        """Recalcula todos os perfis com os dias fechados (até ontem) e troca o arquivo de uma vez"""
+        with self._lock:
+            started = time.monotonic()
+            ate = date.today() - timedelta(days=1)
+            linhas = []
+            atual, vendas = None, []
+            contagens = {}  # primeira venda -> month_weekday_count até ontem (muitos produtos a repetem)
+
+            def fechar():
+                if atual is None:
+                    return
+                primeira = vendas[0][0]
+                for w, valores in weekday_profile(vendas, primeira, ate).items():
+                    linhas.append((atual, 0, w, *valores))
+                if primeira not in contagens:
+                    contagens[primeira] = month_weekday_count(primeira, ate)
+                for (mes, w), valores in month_weekday_profile(vendas, contagens[primeira], self.min_month_days).items():
+                    linhas.append((atual, mes, w, *valores))
+
+            inicio = None
+            for cod, data, quantidade in self.source(ate):
+                inicio = data if inicio is None else min(inicio, data)
+                if cod != atual:
+                    fechar()
+                    atual, vendas = cod, []
+                vendas.append((data, quantidade))
+            fechar()
+
+            with self._db() as db:
+                db.execute("DELETE FROM perfil")
+                db.executemany(f"INSERT INTO perfil VALUES ({', '.join(['?'] * (3 + len(FIELDS)))})", linhas)
+                db.execute("DELETE FROM meta")
+                db.executemany("INSERT INTO meta VALUES (?, ?)", [
+                    ("gerado_em", datetime.now().isoformat(timespec="seconds")),
+                    ("inicio", inicio.isoformat() if inicio else ""),
+                    ("fim", ate.isoformat()),
+                ])
+            self._last_duration = round(time.monotonic() - started, 3)
+            return self.load()
+
+    def _due(self):
+        gerado = self._meta.get("gerado_em")
+        if gerado is None:
+            return True
+        return date.fromisoformat(gerado[:10]) < date.today() and datetime.now().hour >= self.hour
+
+    def _run(self):
+        while True:
+            try:
+                if self.ready() and self._due():
+                    self.build()
+                    self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"Perfis de venda: falha ao recalcular ({e})")
+            time.sleep(self.check_interval)
+
+    def start(self):
+        """Recalcula em segundo plano uma vez por dia, a partir de hour"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sales-profiles", daemon=True)
+            self._thread.start()
+
+    def _follow(self):
+        while True:
+            try:
+                with self._db() as db:
+                    row = db.execute("SELECT valor FROM meta WHERE chave = 'gerado_em'").fetchone()
+                if row is not None and row[0] != self._meta.get("gerado_em"):
+                    self.load()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+            time.sleep(self.check_interval)
+
+    def follow(self):
+        """Só relê o arquivo quando outro processo recalcula (sem build neste processo)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name="sales-profiles-follow", daemon=True)
+            self._thread.start()
+
+    @property
+    def loaded(self):
+        return "gerado_em" in self._meta
+
+    @property
+    def meta(self):
+        return dict(self._meta)
+
+    def get(self, codigo, mes=None):
+        """
+        {dia_semana: {dias, dias_com_venda, media, ...}} ou None se o produto não tem perfil.
+        Com mes (1-12), cada dia da semana vem do perfil daquele mês quando há
+        amostra suficiente (sazonal: true) e do perfil de todos os meses senão.
+        """
+        perfil = self._perfis.get(codigo)
+        if perfil is None:
+            return None
+        if mes is None:
+            return {w: dict(zip(FIELDS, valores)) for (m, w), valores in sorted(perfil.items()) if m == 0}
+        resultado = {}
+        for (m, w), valores in sorted(perfil.items()):
+            if m == 0:
+                sazonal = (mes, w) in perfil
+                resultado[w] = dict(zip(FIELDS, perfil[(mes, w)] if sazonal else valores), sazonal=sazonal)
+        return resultado
+
+    def codigos(self):
+        return sorted(self._perfis)
+
+    def stats(self):
+        return {
+            "products": len(self._perfis),
+            "generated_at": self._meta.get("gerado_em"),
+            "last_duration": self._last_duration,
+            "last_error": self._last_error,
+        }
+
+if __name__ == '__main__':
+    from server import perfis
+    print(f"{perfis.build()} produtos com perfil em {perfis.path}")
+    print(perfis.stats())
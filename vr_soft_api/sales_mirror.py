@@ -0,0 +1,368 @@
+"""
+Espelho local das vendas do VR, agregado por (produto, dia).
+
+Copia as tabelas vendaMMYYYY do ERP para um SQLite local de forma incremental:
+o maior id já lido de cada tabela é a marca d'água, e cada ciclo só traz do
+ERP as linhas novas, já somadas por produto e dia. Os endpoints de período
+do server.py leem daqui e deixam de varrer o banco de produção.
+
+Como ids de transações concorrentes podem ser gravados fora de ordem, os
+últimos dias do mês corrente são recalculados periodicamente e cada mês é
+recalculado inteiro uma última vez close_after segundos depois de terminar.
+Um dia já passado só é respondido pelo espelho depois que a tabela foi
+recalculada pelo menos settle segundos após o fim dele (o incremental não
+vê linhas de id menor gravadas depois) ou fechada.
+
+Uso avulso (uma sincronização e sai):
+    python sales_mirror.py
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vendas_dia (
+    id_produto INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    quantidade REAL NOT NULL,
+    valor_total REAL NOT NULL,
+    numero_vendas INTEGER NOT NULL,
+    PRIMARY KEY (id_produto, data)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vendas_dia_data ON vendas_dia (data, id_produto);
+CREATE TABLE IF NOT EXISTS marcas (
+    tabela TEXT PRIMARY KEY,
+    max_id INTEGER NOT NULL,
+    fechada INTEGER NOT NULL DEFAULT 0,
+    sincronizada_em TEXT,
+    recalculada_em TEXT
+);
+"""
+
+UPSERT_SQL = """
+    INSERT INTO vendas_dia (id_produto, data, quantidade, valor_total, numero_vendas)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (id_produto, data) DO UPDATE SET
+        quantidade = quantidade + excluded.quantidade,
+        valor_total = valor_total + excluded.valor_total,
+        numero_vendas = numero_vendas + excluded.numero_vendas
+"""
+
+def table_month(tabela):
+    """Primeiro dia do mês de uma tabela vendaMMYYYY"""
+    return date(int(tabela[-4:]), int(tabela[-6:-4]), 1)
+
+def quantity(valor):
+    """Soma em REAL do SQLite de volta para Decimal, como o psycopg2 entrega numeric"""
+    return Decimal(f"{valor:.3f}")
+
+def month_end(inicio):
+    return (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+def day_end(dia):
+    """Fim do dia (hora local) em segundos desde a época"""
+    return datetime.combine(dia + timedelta(days=1), datetime.min.time()).timestamp()
+
+def utc_timestamp(texto):
+    """datetime('now') do SQLite (UTC, sem fuso) em segundos desde a época"""
+    return datetime.fromisoformat(texto).replace(tzinfo=timezone.utc).timestamp() if texto else None
+
+class SalesMirror:
+    """
+    Agregados diários (produto, dia) das tabelas vendaMMYYYY em SQLite.
+    connect() deve devolver uma conexão do ERP usável com with;
+    list_tables() devolve os nomes das tabelas vendaMMYYYY existentes.
+    """
+
+    def __init__(self, path, connect, list_tables, months=24, interval=60,
+                 reconcile_days=2, reconcile_interval=3600, settle=900, close_after=3600):
+        self.path = path
+        self.connect = connect
+        self.list_tables = list_tables
+        self.months = months                          # quantas tabelas (meses) manter no espelho
+        self.interval = interval                      # segundos entre sincronizações
+        self.reconcile_days = reconcile_days          # dias recentes recalculados no mês corrente
+        self.reconcile_interval = reconcile_interval  # segundos entre recálculos
+        self.settle = settle                          # segundos após o fim de um dia até suas vendas contarem como completas
+        self.close_after = close_after                # segundos após o fim do mês até o recálculo final
+        self._lock = threading.Lock()                 # uma sincronização por vez
+        self._thread = None
+        self._marcas = {}                             # tabela -> (max_id, fechada)
+        self._rebuilt = {}                            # tabela -> último recálculo (segundos desde a época)
+        self._last_sync = None
+        self._last_reconcile = None
+        self._last_error = None
+        self._last_duration = None
+        self._rows_pulled = 0
+        self._syncs = 0
+        with self._db() as db:
+            db.executescript(SCHEMA)
+            colunas = {r[1] for r in db.execute("PRAGMA table_info(marcas)")}
+            if "recalculada_em" not in colunas:
+                db.execute("ALTER TABLE marcas ADD COLUMN recalculada_em TEXT")
+            self._load_marcas(db)
+
+    @contextmanager
+    def _db(self):
+        """Conexão SQLite curta (uma por operação, segura entre threads)"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _load_marcas(self, db):
+        rows = db.execute("SELECT tabela, max_id, fechada, recalculada_em FROM marcas").fetchall()
+        self._marcas = {t: (m, bool(f)) for t, m, f, _ in rows}
+        self._rebuilt = {t: utc_timestamp(em) for t, _, _, em in rows}
+
+    # ----------------------------------------
+    # Sincronização
+    # ----------------------------------------
+
+    def _save(self, db, tabela, max_id, fechada=False, recalculada=False):
+        db.execute("""
+            INSERT INTO marcas (tabela, max_id, fechada, sincronizada_em, recalculada_em)
+            VALUES (?, ?, ?, datetime('now'), CASE WHEN ? THEN datetime('now') END)
+            ON CONFLICT (tabela) DO UPDATE SET
+                max_id = excluded.max_id,
+                fechada = excluded.fechada,
+                sincronizada_em = excluded.sincronizada_em,
+                recalculada_em = COALESCE(excluded.recalculada_em, recalculada_em)
+        """, (tabela, max_id, int(fechada), int(recalculada)))
+
+    def _pull(self, conn, tabela, fechada=False):
+        """Traz do ERP as linhas com id acima da marca d'água, somadas por produto e dia"""
+        max_id, _ = self._marcas.get(tabela, (0, False))
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id_produto, data, SUM(quantidade), SUM(quantidade * precovenda), COUNT(*), MAX(id)
+                FROM {tabela}
+                WHERE id > %s
+                GROUP BY id_produto, data
+            """, (max_id,))
+            rows = cur.fetchall()
+        novo_max = max([r[5] for r in rows], default=max_id)
+        with self._db() as db:
+            db.executemany(UPSERT_SQL, [
+                (r[0], r[1].isoformat(), float(r[2] or 0), float(r[3] or 0), r[4]) for r in rows
+            ])
+            self._save(db, tabela, novo_max, fechada)
+        self._marcas[tabela] = (novo_max, fechada)
+        return len(rows)
+
+    def _rebuild(self, conn, tabela, desde=None, fechada=False):
+        """
+        Recalcula do zero os agregados da tabela (ou só de desde em diante),
+        limitado à marca d'água atual para não pular linhas ainda não puxadas.
+        """
+        max_id, _ = self._marcas.get(tabela, (0, False))
+        inicio = table_month(tabela)
+        if desde is not None and desde > inicio:
+            inicio = desde
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id_produto, data, SUM(quantidade), SUM(quantidade * precovenda), COUNT(*)
+                FROM {tabela}
+                WHERE id <= %s AND data >= %s
+                GROUP BY id_produto, data
+            """, (max_id, inicio))
+            rows = cur.fetchall()
+        with self._db() as db:
+            db.execute("DELETE FROM vendas_dia WHERE data >= ? AND data <= ?",
+                       (inicio.isoformat(), month_end(table_month(tabela)).isoformat()))
+            db.executemany(UPSERT_SQL, [
+                (r[0], r[1].isoformat(), float(r[2] or 0), float(r[3] or 0), r[4]) for r in rows
+            ])
+            self._save(db, tabela, max_id, fechada, recalculada=True)
+        self._marcas[tabela] = (max_id, fechada)
+        self._rebuilt[tabela] = time.time()
+        return len(rows)
+
+    def sync(self):
+        """Um ciclo de sincronização; retorna o número de agregados gravados"""
+        with self._lock:
+            started = time.monotonic()
+            tabelas = sorted(self.list_tables(), key=table_month)[-self.months:]
+            reconcile = (self._last_reconcile is None
+                         or started - self._last_reconcile >= self.reconcile_interval)
+            gravados = 0
+            try:
+                with self.connect() as conn:
+                    for tabela in tabelas:
+                        max_id, fechada = self._marcas.get(tabela, (0, False))
+                        if fechada:
+                            continue
+                        if time.time() >= day_end(month_end(table_month(tabela))) + self.close_after:
+                            # Mês encerrado há close_after segundos (vendas atrasadas já gravadas):
+                            # carga completa ou recálculo final, depois nunca mais
+                            if max_id == 0:
+                                gravados += self._pull(conn, tabela, fechada=True)
+                            else:
+                                self._pull(conn, tabela)
+                                gravados += self._rebuild(conn, tabela, fechada=True)
+                            continue
+                        gravados += self._pull(conn, tabela)
+                        if reconcile:
+                            desde = date.today() - timedelta(days=self.reconcile_days)
+                            gravados += self._rebuild(conn, tabela, desde=desde)
+                if reconcile:
+                    self._last_reconcile = started
+                self._last_sync = time.monotonic()
+                self._last_error = None
+                self._syncs += 1
+                self._rows_pulled += gravados
+                return gravados
+            except Exception as e:
+                self._last_error = str(e)
+                raise
+            finally:
+                self._last_duration = round(time.monotonic() - started, 3)
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Espelho de vendas: falha na sincronização ({e})")
+            time.sleep(self.interval)
+
+    def start(self):
+        """Sincroniza em segundo plano a cada interval segundos"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sales-mirror", daemon=True)
+            self._thread.start()
+
+    def reload(self):
+        """
+        Relê marcas e hora da última sincronização do arquivo: para processos
+        que só leem o espelho enquanto outro processo sincroniza.
+        """
+        with self._db() as db:
+            self._load_marcas(db)
+            idade = db.execute(
+                "SELECT (julianday('now') - julianday(MAX(sincronizada_em))) * 86400 FROM marcas").fetchone()[0]
+        if idade is not None:
+            self._last_sync = time.monotonic() - max(0.0, idade)
+
+    def _follow(self):
+        while True:
+            try:
+                self.reload()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+            time.sleep(self.interval / 2)
+
+    def follow(self):
+        """Acompanha em segundo plano a sincronização feita por outro processo (ver reload)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name="sales-mirror-follow", daemon=True)
+            self._thread.start()
+
+    # ----------------------------------------
+    # Consultas
+    # ----------------------------------------
+
+    def covers(self, tabelas, data_fim):
+        """
+        True se o espelho pode responder pelo período: todas as tabelas já
+        foram carregadas; cada uma está fechada ou foi recalculada settle
+        segundos depois do último dia do período que ela guarda; e, se o
+        período chega a hoje, a última sincronização é recente.
+        """
+        hoje = date.today()
+        for tabela in tabelas:
+            if tabela not in self._marcas:
+                return False
+            if self._marcas[tabela][1]:
+                continue
+            ultimo = min(data_fim, month_end(table_month(tabela)))
+            if ultimo >= hoje:
+                continue
+            recalculada = self._rebuilt.get(tabela)
+            if recalculada is None or recalculada < day_end(ultimo) + self.settle:
+                return False
+        if data_fim >= hoje:
+            return self._last_sync is not None and time.monotonic() - self._last_sync <= 3 * self.interval
+        return True
+
+    def periodo(self, codigos, data_inicio, data_fim):
+        """{id_produto: {quantidade_total, numero_vendas, primeira_venda, ultima_venda}} no período"""
+        placeholders = ','.join(['?'] * len(codigos))
+        with self._db() as db:
+            rows = db.execute(f"""
+                SELECT id_produto, SUM(quantidade), SUM(numero_vendas), MIN(data), MAX(data)
+                FROM vendas_dia
+                WHERE id_produto IN ({placeholders})
+                AND data >= ? AND data <= ?
+                GROUP BY id_produto
+            """, (*codigos, data_inicio.isoformat(), data_fim.isoformat())).fetchall()
+        return {r[0]: {
+            "quantidade_total": quantity(r[1]),
+            "numero_vendas": r[2],
+            "primeira_venda": date.fromisoformat(r[3]),
+            "ultima_venda": date.fromisoformat(r[4]),
+        } for r in rows}
+
+    def serie(self, codigos, data_inicio, data_fim, granularidade):
+        """[(id_produto, início do intervalo, quantidade)] agrupado por dia, semana (segunda) ou mês"""
+        bucket = {
+            "dia": "data",
+            "semana": "date(data, '-6 days', 'weekday 1')",
+            "mes": "substr(data, 1, 7) || '-01'",
+        }[granularidade]
+        placeholders = ','.join(['?'] * len(codigos))
+        with self._db() as db:
+            rows = db.execute(f"""
+                SELECT id_produto, {bucket} AS inicio, SUM(quantidade)
+                FROM vendas_dia
+                WHERE id_produto IN ({placeholders})
+                AND data >= ? AND data <= ?
+                GROUP BY id_produto, inicio
+            """, (*codigos, data_inicio.isoformat(), data_fim.isoformat())).fetchall()
+        return [(r[0], date.fromisoformat(r[1]), round(r[2], 3)) for r in rows]
+
+    def dia(self, data):
+        """Totais por produto vendidos em um dia, do mais vendido ao menos vendido"""
+        with self._db() as db:
+            rows = db.execute("""
+                SELECT id_produto, quantidade, numero_vendas
+                FROM vendas_dia
+                WHERE data = ?
+                ORDER BY quantidade DESC
+            """, (data.isoformat(),)).fetchall()
+        return [{"id_produto": r[0], "quantidade_total": quantity(r[1]), "numero_vendas": r[2]} for r in rows]
+
+    def daily(self, ate):
+        """(id_produto, data, quantidade) de todos os dias até `ate`, por produto e data"""
+        with self._db() as db:
+            for cod, data, quantidade in db.execute("""
+                SELECT id_produto, data, quantidade
+                FROM vendas_dia
+                WHERE data <= ?
+                ORDER BY id_produto, data
+            """, (ate.isoformat(),)):
+                yield cod, date.fromisoformat(data), quantidade
+
+    def stats(self):
+        return {
+            "tables": len(self._marcas),
+            "closed_tables": sum(1 for _, fechada in self._marcas.values() if fechada),
+            "syncs": self._syncs,
+            "rows_pulled": self._rows_pulled,
+            "last_sync_age": round(time.monotonic() - self._last_sync, 1) if self._last_sync else None,
+            "last_duration": self._last_duration,
+            "last_error": self._last_error,
+        }
+
+if __name__ == '__main__':
+    from server import mirror
+    print(f"{mirror.sync()} agregados gravados em {mirror.path}")
+    print(mirror.stats())
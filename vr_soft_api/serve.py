@@ -0,0 +1,273 @@
+"""
+Modo de produção do bridge: processos (workers) com um número fixo de
+threads cada, todos atendendo no mesmo socket.
+
+- O supervisor abre a porta e inicia os workers. Um worker com todas as
+  threads ocupadas para de aceitar conexões, que ficam para os outros:
+  uma ruptura lenta não segura as requisições dos demais tablets.
+- O limite de conexões com o ERP (POOL_CONFIG["maxconn"]) é dividido entre
+  os workers; com mais de um, o cache de resultados ganha um nível em
+  SQLite compartilhado entre eles (shared_cache.py).
+- Só o worker principal sincroniza o espelho e recalcula os perfis e as
+  listas salvas; os outros releem os arquivos (server.start_follower_jobs).
+- Worker que cai é reiniciado. Reinício gracioso, um worker por vez (sobe
+  o novo, espera ficar pronto, o antigo termina o que está atendendo):
+  python serve.py --reiniciar (cria reiniciar.flag), ou SIGHUP fora do Windows.
+- Ctrl+C / SIGTERM param tudo, terminando as requisições em andamento.
+
+/metrics e /debug/slow mostram só o worker que atendeu a requisição.
+
+Uso:
+    python serve.py                              (porta 5005, 1 worker, 32 threads)
+    python serve.py --workers 2 --threads 16
+    python serve.py --reiniciar
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVE_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 5005,
+    "workers": 1,
+    "threads": 32,          # requisições simultâneas por worker (cada cliente de /vendas/stream ocupa uma)
+    "timeout": 15,          # segundos sem conseguir ler ou enviar antes de fechar a conexão (inclui keep-alive ocioso)
+    "drain_timeout": 30,    # segundos para terminar as requisições em andamento ao parar um worker
+    "ready_timeout": 120,   # segundos esperando um worker novo ficar pronto no reinício
+    "restart_file": os.path.join(BASE_DIR, "reiniciar.flag"),
+    "access_log": False,    # uma linha por requisição no console
+}
+
+# ============================================
+# WORKER
+# ============================================
+
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = SERVE_CONFIG["timeout"]
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Servidor WSGI do werkzeug sobre um socket já aberto, com `threads` threads fixas.
+    Só aceita uma conexão quando há thread livre para ela.
+    """
+
+    multithread = True
+
+    def __init__(self, sock, app, threads, handler=RequestHandler):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=handler, fd=sock.fileno())
+        # Socket compartilhado entre processos: outro worker pode aceitar a conexão antes
+        self.socket.setblocking(False)
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="http")
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        if not self._slots.acquire(timeout=0.5):
+            raise BlockingIOError("todas as threads ocupadas")
+        try:
+            conn, addr = self.socket.accept()
+        except BaseException:
+            self._slots.release()
+            raise
+        conn.setblocking(True)
+        return conn, addr
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self, timeout):
+        """Para de aceitar e espera as requisições em andamento (até timeout segundos)"""
+        self.shutdown()
+        deadline = time.monotonic() + timeout
+        ocupadas = 0
+        for _ in range(self.threads):
+            if not self._slots.acquire(timeout=max(0, deadline - time.monotonic())):
+                ocupadas += 1
+        self.server_close()
+        return ocupadas
+
+def run_worker(sock, indice, config, pronto, parar, liberar_jobs):
+    """Processo worker: importa o server.py, atende até `parar` e termina o que estiver em andamento"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C é tratado pelo supervisor
+    if not config["access_log"]:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    RequestHandler.timeout = config["timeout"]
+
+    import server
+    server.configure_worker(config["workers"])
+    try:
+        server.db_pool.warmup()
+    except Exception as e:
+        print(f"[worker {indice}] Aviso: ERP indisponível na inicialização ({e})", flush=True)
+
+    httpd = PooledWSGIServer(sock, server.app, config["threads"])
+    sock.close()
+    threading.Thread(target=httpd.serve_forever, name="http-accept", daemon=True).start()
+
+    if indice == 0:
+        # Principal: começa as tarefas só quando o principal anterior (reinício) já parou
+        def jobs():
+            liberar_jobs.wait()
+            server.start_background_jobs()
+        threading.Thread(target=jobs, name="jobs", daemon=True).start()
+    else:
+        server.start_follower_jobs()
+
+    pronto.set()
+    print(f"[worker {indice}] pid {os.getpid()} pronto ({config['threads']} threads)", flush=True)
+    parar.wait()
+    restantes = httpd.drain(config["drain_timeout"])
+    if restantes:
+        print(f"[worker {indice}] {restantes} requisições interrompidas após {config['drain_timeout']}s", flush=True)
+    print(f"[worker {indice}] encerrado", flush=True)
+
+# ============================================
+# SUPERVISOR
+# ============================================
+
+class Worker:
+    def __init__(self, ctx, sock, indice, config, liberar=True):
+        self.indice = indice
+        self.pronto = ctx.Event()
+        self.parar = ctx.Event()
+        self.liberar_jobs = ctx.Event()
+        if liberar:
+            self.liberar_jobs.set()
+        self.iniciado_em = time.monotonic()
+        self.process = ctx.Process(target=run_worker, name=f"bridge-worker-{indice}",
+                                   args=(sock, indice, config, self.pronto, self.parar, self.liberar_jobs))
+        self.process.start()
+
+    def stop(self, timeout):
+        self.parar.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+class Supervisor:
+    """Mantém `workers` processos atendendo no mesmo socket; reinicia os que caem"""
+
+    def __init__(self, config):
+        self.config = config
+        self.ctx = multiprocessing.get_context("spawn")
+        self.sock = socket.create_server((config["host"], config["port"]), backlog=128)
+        self.workers = {}
+        # Flags simples: Event.set() num signal handler pode travar no lock do próprio Event
+        self._parar = False
+        self._reiniciar = False
+
+    def _spawn(self, indice, liberar=True):
+        return Worker(self.ctx, self.sock, indice, self.config, liberar)
+
+    def restart(self):
+        """Troca um worker por vez; se o novo não ficar pronto, mantém o antigo e desiste"""
+        print("[serve] reinício gracioso", flush=True)
+        for indice in sorted(self.workers):
+            antigo = self.workers[indice]
+            novo = self._spawn(indice, liberar=False)
+            if not novo.pronto.wait(self.config["ready_timeout"]):
+                print(f"[serve] worker {indice} novo não ficou pronto; reinício cancelado", flush=True)
+                novo.liberar_jobs.set()
+                novo.stop(0)
+                return
+            self.workers[indice] = novo
+            antigo.stop(self.config["drain_timeout"] + 5)
+            novo.liberar_jobs.set()
+        print("[serve] reinício concluído", flush=True)
+
+    def _check_workers(self):
+        for indice, worker in list(self.workers.items()):
+            if worker.process.is_alive():
+                continue
+            # Caiu logo após subir (ex.: erro de importação): espera antes de tentar de novo
+            if time.monotonic() - worker.iniciado_em < 5:
+                continue
+            print(f"[serve] worker {indice} terminou (código {worker.process.exitcode}); reiniciando", flush=True)
+            self.workers[indice] = self._spawn(indice)
+
+    def run(self):
+        def parar(*_):
+            self._parar = True
+
+        def reiniciar(*_):
+            self._reiniciar = True
+
+        signal.signal(signal.SIGINT, parar)
+        signal.signal(signal.SIGTERM, parar)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, reiniciar)
+        restart_file = self.config["restart_file"]
+        if os.path.exists(restart_file):
+            os.remove(restart_file)
+
+        print(f"[serve] {self.config['host']}:{self.config['port']} com {self.config['workers']} "
+              f"worker(s) de {self.config['threads']} threads", flush=True)
+        for indice in range(self.config["workers"]):
+            self.workers[indice] = self._spawn(indice)
+        try:
+            while not self._parar:
+                time.sleep(1)
+                if os.path.exists(restart_file):
+                    os.remove(restart_file)
+                    self._reiniciar = True
+                if self._reiniciar and not self._parar:
+                    self._reiniciar = False
+                    self.restart()
+                self._check_workers()
+        finally:
+            print("[serve] parando", flush=True)
+            for worker in self.workers.values():
+                worker.parar.set()
+            for worker in self.workers.values():
+                worker.stop(self.config["drain_timeout"] + 5)
+            self.sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge de vendas em modo de produção")
+    parser.add_argument("--host", default=SERVE_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=SERVE_CONFIG["port"])
+    parser.add_argument("--workers", type=int, default=SERVE_CONFIG["workers"])
+    parser.add_argument("--threads", type=int, default=SERVE_CONFIG["threads"])
+    parser.add_argument("--timeout", type=float, default=SERVE_CONFIG["timeout"])
+    parser.add_argument("--drain-timeout", type=float, default=SERVE_CONFIG["drain_timeout"])
+    parser.add_argument("--access-log", action="store_true", default=SERVE_CONFIG["access_log"])
+    parser.add_argument("--reiniciar", action="store_true", help="pede reinício gracioso ao serve.py em execução")
+    args = parser.parse_args()
+
+    if args.reiniciar:
+        with open(SERVE_CONFIG["restart_file"], "w") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S"))
+        print("Reinício solicitado")
+        return
+    if args.workers < 1 or args.threads < 1:
+        sys.exit("workers e threads devem ser pelo menos 1")
+
+    config = dict(SERVE_CONFIG, host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+                  timeout=args.timeout, drain_timeout=args.drain_timeout, access_log=args.access_log)
+    Supervisor(config).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,405 +1,3525 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime, timedelta
 import decimal
+import gzip
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import select
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from functools import lru_cache, partial, reduce
+from sales_mirror import SalesMirror
+from forecast import forecast
+from stockout import detect as detect_stockouts
+from profiles import ProfileStore
+from metrics import Registry
+from slow_queries import SlowQueryLog
+from shared_cache import SharedCache
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 app = Flask(__name__)
 # Enable CORS for all domains on all routes, allowing JSON headers
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["ETag"])
+
+API_VERSION = "3.2"
 
 @app.route('/', methods=['GET'])
 def home():
-    return jsonify({"status": "online", "version": "3.1", "endpoints": [
+    return jsonify({"status": "online", "version": API_VERSION, "endpoints": [
         "/produto/<codigo>",
         "/vendas/produto/<codigo>",
-        "/vendas/produtos/periodo (POST)",
-        "/vendas/ruptura/<data>"
-    ]})
+        "/vendas/produtos/periodo (POST, lojas opcional)",
+        "/vendas/ruptura/<data>?lojas=<l1,l2|todas>",
+        "/vendas/ruptura/<data>/alertas?semanas=<n>",
+        "/vendas/ranking?data_inicio=&data_fim=&metrica=quantidade|receita&top=<n>&lojas=<l1,l2|todas>",
+        "/vendas/serie (POST, lojas opcional)",
+        "/vendas/comparativo (POST)",
+        "/previsao (POST)",
+        "/vendas/perfil?codigos=<c1,c2>&mes=<1-12>",
+        "/vendas/watchlist/<nome> (GET, PUT, DELETE)",
+        "/vendas/exportar/<YYYY-MM>?formato=csv|ndjson",
+        "/vendas/changes?since=<marca>",
+        "/vendas/stream?codigos=<c1,c2> (SSE)",
+        "/metrics",
+        "/debug/slow?ordem=total|max|ocorrencias&limite=<n>"
+    ], "pool": db_pool.stats(), "cache": result_cache.stats(),
+        "coalescing": sales_flight.stats(),
+        "breaker": erp_breaker.stats(),
+        "lojas": {loja_id: loja.stats() for loja_id, loja in LOJAS.items() if not loja.principal},
+        "mirror": mirror.stats(),
+        "stream": sales_stream.stats(),
+        "produtos": produto_index.stats(),
+        "perfis": perfis.stats(),
+        "watchlists": watchlists.stats(),
+        "respostas": response_stats(),
+        "consultas_lentas": slow_log.stats()})
 
 DB = {"host": "10.110.65.232", "port": "8745", "database": "vr", "user": "postgres", "password": "VrPost@Server"}
 
-def get_db_connection():
-    return psycopg2.connect(**DB)
+# Pasta dos arquivos de estado (espelho, perfis, listas, log de consultas lentas,
+# cache compartilhado) e do lojas.json; BRIDGE_DATA_DIR troca (o benchmark usa uma temporária)
+DATA_DIR = os.environ.get("BRIDGE_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
+
+# Pool de conexões com o ERP (uma instância por processo)
+POOL_CONFIG = {
+    "minconn": 2,          # conexões mantidas abertas mesmo sem uso
+    "maxconn": 10,         # limite de conexões simultâneas com o ERP
+    "wait_timeout": 15,    # segundos aguardando uma conexão livre
+    "validate_after": 30,  # segundos ociosa antes de validar com SELECT 1
+    "max_idle": 600,       # segundos ociosa antes de fechar (acima do mínimo)
+    "max_lifetime": 3600,  # segundos de vida antes de reciclar a conexão
+    "statement_timeout": 20000,  # ms por consulta antes de o ERP cancelá-la
+}
+
+# Disjuntor: com o ERP fora do ar, falha na hora em vez de esperar timeouts
+BREAKER_CONFIG = {
+    "failure_threshold": 5,  # falhas seguidas do ERP até abrir o circuito
+    "reset_timeout": 30,     # segundos com o circuito aberto até uma nova tentativa
+}
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera"""
+
+class TimedCursor:
+    """
+    Cursor que mede cada execute/copy_expert e chama
+    on_query(sql, params, segundos, linhas, erro, conn) ao terminar.
+    """
+
+    def __init__(self, cursor, on_query):
+        self._cursor = cursor
+        self._on_query = on_query
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def _timed(self, fn, sql, params, *args, **kwargs):
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            return fn(sql, *args, **kwargs)
+        except Exception as e:
+            erro = e
+            raise
+        finally:
+            linhas = self._cursor.rowcount if erro is None else 0
+            self._on_query(sql, params, time.perf_counter() - inicio, linhas, erro, self._cursor.connection)
+
+    def execute(self, sql, params=None):
+        return self._timed(self._cursor.execute, sql, params, params)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(self._cursor.copy_expert, sql, None, file, size)
+
+class PooledConnection:
+    """
+    Conexão emprestada do pool.
+    close() (ou o fim do bloco with) devolve a conexão ao pool em vez de fechá-la.
+    """
+
+    def __init__(self, pool, conn, reset_timeout=False, on_close=None):
+        self._pool = pool
+        self._conn = conn
+        self._reset_timeout = reset_timeout  # statement_timeout alterado só neste empréstimo
+        self._on_close = on_close            # on_close(exceção ou None) ao devolver
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cur = self._conn.cursor(*args, **kwargs)
+        if self._pool.on_query is not None:
+            return TimedCursor(cur, self._pool.on_query)
+        return cur
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(exc)
+        return False
+
+    def close(self, error=None):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            discard = False
+            if self._reset_timeout and not conn.closed:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("RESET statement_timeout")
+                except psycopg2.Error:
+                    discard = True
+            self._pool.release(conn, discard=discard)
+            if self._on_close is not None:
+                self._on_close(error)
+
+    def discard(self, error=None):
+        """
+        Fecha de vez a conexão (estado incerto, ex.: COPY interrompido) sem devolvê-la ao pool.
+        on_close(error) é chamado como em close(): o disjuntor precisa saber como terminou a chamada.
+        """
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                if self._on_close is not None:
+                    self._on_close(error)
+            finally:
+                self._pool.release(conn, discard=True)
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe para o banco do VR.
+    - Mantém entre minconn e maxconn conexões abertas
+    - Valida conexões ociosas com SELECT 1 antes de entregá-las
+    - Descarta conexões quebradas e reconecta sozinho quando o ERP reinicia
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, wait_timeout=15,
+                 validate_after=30, max_idle=600, max_lifetime=3600, statement_timeout=None,
+                 on_query=None):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self.validate_after = validate_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.statement_timeout = statement_timeout
+        self.on_query = on_query  # on_query(sql, params, segundos, linhas, erro, conn) após cada consulta
+        self._cond = threading.Condition()
+        self._idle = []     # [(conn, criada_em, ociosa_desde)] - topo = mais recente
+        self._born = {}     # id(conn) -> criada_em, para conexões emprestadas
+        self._total = 0     # conexões abertas (ociosas + em uso)
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        self._errors = 0
+
+    def _connect(self):
+        options = {}
+        if self.statement_timeout is not None:
+            options["options"] = f"-c statement_timeout={int(self.statement_timeout)}"
+        conn = psycopg2.connect(**self.dsn, **options)
+        # Bridge só lê: autocommit evita sessões "idle in transaction" no ERP
+        conn.set_session(readonly=True, autocommit=True)
+        return conn
+
+    def _is_alive(self, conn, ping):
+        if conn.closed:
+            return False
+        try:
+            # Conexão ociosa não deveria ter nada para ler: se o socket está
+            # legível o servidor a encerrou (ex.: restart do ERP) ou mandou aviso
+            if select.select([conn.fileno()], [], [], 0)[0]:
+                ping = True
+            if ping:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        """Fecha uma conexão (chamar com o lock adquirido)"""
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._total -= 1
+        self._recycled += 1
+        self._cond.notify()
+
+    def _flush_idle(self):
+        """Fecha todas as conexões ociosas (ERP provavelmente reiniciou)"""
+        while self._idle:
+            conn, _, _ = self._idle.pop()
+            self._discard(conn)
+
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._total >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"Nenhuma conexão livre após {self.wait_timeout}s")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, born, idle_since = self._idle.pop()
+                else:
+                    self._total += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._errors += 1
+                        self._cond.notify()
+                    raise
+                born = time.monotonic()
+                with self._cond:
+                    self._created += 1
+                    self._born[id(conn)] = born
+                return conn
+
+            # Conexão reaproveitada: valida (com SELECT 1 se ficou muito tempo parada)
+            ping = time.monotonic() - idle_since >= self.validate_after
+            if not self._is_alive(conn, ping):
+                with self._cond:
+                    self._errors += 1
+                    self._discard(conn)
+                    self._flush_idle()
+                continue
+            with self._cond:
+                self._born[id(conn)] = born
+            return conn
+
+    def release(self, conn, discard=False):
+        now = time.monotonic()
+        with self._cond:
+            born = self._born.pop(id(conn), now)
+            if discard:
+                self._discard(conn)
+                return
+            if conn.closed:
+                # Conexão caiu durante o uso: as ociosas também devem estar mortas
+                self._errors += 1
+                self._discard(conn)
+                self._flush_idle()
+                return
+            if now - born >= self.max_lifetime:
+                self._discard(conn)
+                return
+            self._idle.append((conn, born, now))
+            # Fecha conexões paradas há muito tempo, preservando o mínimo
+            while self._total > self.minconn and self._idle and now - self._idle[0][2] >= self.max_idle:
+                old, _, _ = self._idle.pop(0)
+                self._discard(old)
+            self._cond.notify()
+
+    def connection(self, statement_timeout=None, on_close=None):
+        """
+        Conexão para usar com with.
+        statement_timeout (ms, 0 = sem limite) vale só até a devolução.
+        """
+        conn = self.getconn()
+        if statement_timeout is not None:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SET statement_timeout = %s", (int(statement_timeout),))
+            except Exception:
+                self.release(conn, discard=True)
+                raise
+        return PooledConnection(self, conn, statement_timeout is not None, on_close)
+
+    def warmup(self):
+        """Abre conexões até o mínimo configurado"""
+        conns = []
+        try:
+            while len(conns) < self.minconn and self._total < self.minconn:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_use": self._total - len(self._idle),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+                "errors": self._errors,
+                "min": self.minconn,
+                "max": self.maxconn,
+            }
+
+db_pool = ConnectionPool(DB, **POOL_CONFIG)
+
+class CircuitOpen(Exception):
+    """ERP marcado como fora do ar: a consulta nem foi tentada"""
+
+class CallCancelled(Exception):
+    """Chamada interrompida pelo bridge (ex.: cliente desconectou): não conta como sucesso nem como falha do ERP"""
+
+# Falhas que indicam ERP lento ou fora do ar (timeout de consulta é OperationalError)
+ERP_ERRORS = (psycopg2.OperationalError, PoolTimeout, CircuitOpen)
+
+class CircuitBreaker:
+    """
+    Disjuntor em volta das conexões com o ERP.
+    - closed: tudo passa; failure_threshold falhas seguidas abrem o circuito
+    - open: falha na hora com CircuitOpen durante reset_timeout segundos
+    - half_open: uma única chamada de teste passa; sucesso fecha, falha reabre
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0      # falhas seguidas
+        self._opened_at = None
+        self._trial = False     # chamada de teste em andamento (half_open)
+        self._opened = 0
+        self._rejected = 0
+        self._last_error = None
+
+    def before(self):
+        """Chamar antes de usar o ERP; levanta CircuitOpen se não deve tentar"""
+        with self._lock:
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    raise CircuitOpen(f"ERP indisponível ({self._last_error})")
+                self._state = "half_open"
+                self._trial = False
+            if self._state == "half_open":
+                if self._trial:
+                    self._rejected += 1
+                    raise CircuitOpen("ERP indisponível (nova tentativa em andamento)")
+                self._trial = True
+
+    def record(self, error=None):
+        """Resultado de uma chamada: só erros de conexão/timeout contam como falha"""
+        with self._lock:
+            self._trial = False
+            if isinstance(error, (CircuitOpen, CallCancelled)):
+                return
+            if not isinstance(error, ERP_ERRORS):
+                self._failures = 0
+                self._state = "closed"
+                return
+            self._failures += 1
+            self._last_error = str(error).strip() or type(error).__name__
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._opened += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            retry_in = None
+            if self._state == "open":
+                retry_in = round(max(0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self._opened,
+                "rejected": self._rejected,
+                "retry_in": retry_in,
+                "last_error": self._last_error,
+            }
+
+erp_breaker = CircuitBreaker(**BREAKER_CONFIG)
+
+def guarded_connection(pool, breaker, statement_timeout=None):
+    """Conexão de pool passando pelo disjuntor: o resultado do uso é registrado na devolução"""
+    breaker.before()
+    try:
+        return pool.connection(statement_timeout, on_close=breaker.record)
+    except Exception as e:
+        breaker.record(e)
+        raise
+
+def get_db_connection(statement_timeout=None):
+    """
+    Empresta uma conexão do pool (usar com with ou chamar close() para devolver).
+    Passa pelo disjuntor do ERP; statement_timeout (ms) substitui o padrão do pool.
+    """
+    return guarded_connection(db_pool, erp_breaker, statement_timeout)
+
+def get_venda_table_name(target_date=None):
+    """Retorna o nome da tabela de vendas para a data especificada"""
+    if target_date is None:
+        target_date = date.today()
+    return f"venda{target_date.month:02d}{target_date.year}"
+
+def month_starts(data_inicio, data_fim):
+    """Primeiro dia de cada mês entre as duas datas (inclusive)"""
+    d = data_inicio.replace(day=1)
+    while d <= data_fim:
+        yield d
+        d = (d + timedelta(days=32)).replace(day=1)
+
+# ============================================
+# CONSULTAS LENTAS (ver slow_queries.py)
+# ============================================
+
+SLOW_QUERY_CONFIG = {
+    "path": os.path.join(DATA_DIR, "consultas_lentas.log"),
+    "threshold": 1.0,                 # segundos a partir dos quais a consulta vai para o log
+    "max_bytes": 5 * 1024 * 1024,     # tamanho de cada arquivo antes de rotacionar
+    "backups": 3,                     # arquivos antigos mantidos (.1, .2, .3)
+    "max_shapes": 500,                # formas de consulta agregadas em memória
+    "explain": True,                  # EXPLAIN (ANALYZE OFF) na primeira ocorrência de cada forma
+    "ignore": ("sessao", "exportacao"),  # COPY da exportação é longo por natureza
+}
+
+slow_log = SlowQueryLog(**SLOW_QUERY_CONFIG)
+
+def fetch_indices_data_produto(loja, tabelas):
+    """{tabela: True/False} se a tabela tem índice começando por (data, id_produto)"""
+    with loja.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT t.relname,
+                       COALESCE(bool_or(a1.attname = 'data' AND a2.attname = 'id_produto'), false)
+                FROM pg_class t
+                LEFT JOIN pg_index i ON i.indrelid = t.oid
+                LEFT JOIN pg_attribute a1 ON a1.attrelid = t.oid AND a1.attnum = i.indkey[0]
+                LEFT JOIN pg_attribute a2 ON a2.attrelid = t.oid AND a2.attnum = i.indkey[1]
+                WHERE t.relkind = 'r' AND t.relname = ANY(%s)
+                GROUP BY t.relname
+            """, (list(tabelas),))
+            return dict(cur.fetchall())
+
+@app.route('/debug/slow')
+def get_slow_queries():
+    """
+    Consultas mais lentas desde o início do processo, com o plano capturado,
+    e por tabela vendaMMYYYY: quantas consultas lentas, se o plano fez Seq Scan
+    e se existe índice em (data, id_produto).
+    """
+    try:
+        ordem = request.args.get('ordem', 'total')
+        limite = int(request.args.get('limite', 20))
+        consultas = slow_log.worst(limite, ordem)
+
+        por_loja = {}
+        for (loja_id, tabela), info in slow_log.tables().items():
+            por_loja.setdefault(loja_id, {})[tabela] = info
+        tabelas = {}
+        for loja_id, itens in por_loja.items():
+            try:
+                indices = fetch_indices_data_produto(LOJAS[loja_id], itens)
+            except Exception as e:
+                indices = {}
+                print(f"Consultas lentas: índices da loja {loja_id} indisponíveis ({e})")
+            for tabela, info in sorted(itens.items()):
+                info["indice_data_produto"] = indices.get(tabela)
+            tabelas[loja_id] = dict(sorted(itens.items()))
+
+        return jsonify({
+            "threshold_ms": round(slow_log.threshold * 1000),
+            "ordem": ordem,
+            "consultas": consultas,
+            "tabelas": tabelas,
+            "sem_indice": {loja_id: [t for t, info in itens.items() if info["indice_data_produto"] is False]
+                           for loja_id, itens in tabelas.items()},
+            "stats": slow_log.stats(),
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# MÉTRICAS (formato Prometheus, ver metrics.py)
+# ============================================
+
+metrics = Registry()
+http_requests = metrics.counter("bridge_http_requests_total", "Requisições por rota, método e status",
+                                ("route", "method", "status"))
+http_latency = metrics.histogram("bridge_http_request_duration_seconds", "Tempo de resposta por rota",
+                                 ("route", "method"))
+http_bytes = metrics.counter("bridge_http_response_bytes_total", "Bytes enviados por rota (após compressão)",
+                             ("route",))
+http_errors = metrics.counter("bridge_http_errors_total", "Respostas 5xx por rota", ("route",))
+db_latency = metrics.histogram("bridge_db_query_duration_seconds", "Tempo das consultas ao ERP por tipo",
+                               ("query",))
+db_rows = metrics.counter("bridge_db_rows_total", "Linhas devolvidas pelo ERP por tipo de consulta", ("query",))
+db_errors = metrics.counter("bridge_db_errors_total", "Consultas ao ERP que falharam, por tipo", ("query",))
+
+# Tipo lógico de cada consulta, pelo texto do SQL (primeira regra que casar)
+QUERY_LABELS = [(label, re.compile(padrao, re.IGNORECASE)) for label, padrao in [
+    ("sessao", r"^\s*(SET|RESET|BEGIN|COMMIT|ROLLBACK)\b"),
+    ("exportacao", r"^\s*COPY\b"),
+    ("nomes_produto", r"\bFROM produto WHERE\b"),
+    ("indice_produto", r"\bFROM produto\b|pg_stat_user_tables|information_schema\.columns"),
+    ("catalogo", r"pg_catalog\.pg_tables"),
+    ("marca_dagua", r"MAX\(id\), 0\)"),
+    ("historico", r"ORDER BY data DESC, id DESC"),
+    ("changes", r"\bid (>|<=) %\((desde|piso|ate)\)s"),
+    ("espelho", r"\bid (>|<=) %s"),
+    ("ranking", r"ROW_NUMBER\(\) OVER"),
+    ("agregacao", r"\bFROM venda\d{6}\b"),
+]]
+
+@lru_cache(maxsize=512)
+def query_label(sql):
+    for label, padrao in QUERY_LABELS:
+        if padrao.search(sql):
+            return label
+    return "outras"
+
+def record_query(sql, params, segundos, linhas, erro, conn=None, loja=None):
+    label = query_label(sql)
+    db_latency.observe(segundos, label)
+    if erro is None:
+        db_rows.inc(label, amount=max(linhas, 0))
+    else:
+        db_errors.inc(label)
+    slow_log.observe(loja or LOJA_PADRAO, label, sql, params, segundos, linhas, erro, conn)
+
+db_pool.on_query = record_query
+
+def route_label():
+    """Regra da rota (ex.: /vendas/ruptura/<data_consulta>), não a URL: mantém poucas séries"""
+    return request.url_rule.rule if request.url_rule is not None else "<nao_encontrada>"
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-def serialize_value(val):
-    """Convert non-JSON-serializable types"""
+@app.after_request
+def record_request(response):
+    """Registrado antes da compressão: roda por último e mede os bytes que de fato saem"""
+    inicio = g.get("request_started")
+    if inicio is None:
+        return response
+    rota = route_label()
+    http_latency.observe(time.perf_counter() - inicio, rota, request.method)
+    http_requests.inc(rota, request.method, str(response.status_code))
+    if response.status_code >= 500:
+        http_errors.inc(rota)
+    if not response.is_streamed:
+        http_bytes.inc(rota, amount=response.calculate_content_length() or 0)
+    return response
+
+# Estado atual dos componentes, lido na hora da coleta
+BREAKER_STATES = {"closed": 0, "half_open": 0.5, "open": 1}
+metrics.gauge("bridge_pool_connections", "Conexões com o ERP por loja e estado",
+              lambda: {(loja_id, k): loja.pool.stats()[k]
+                       for loja_id, loja in LOJAS.items() for k in ("in_use", "idle", "waiting")},
+              ("loja", "state"))
+metrics.gauge("bridge_breaker_open", "Disjuntor do ERP: 0 fechado, 0.5 em teste, 1 aberto",
+              lambda: {(loja_id,): BREAKER_STATES[loja.breaker.stats()["state"]] for loja_id, loja in LOJAS.items()},
+              ("loja",))
+metrics.counter_func("bridge_cache_events_total", "Eventos do cache de resultados desde o início",
+                     lambda: {(k,): result_cache.stats()[k] for k in ("hits", "misses", "evictions", "stale_served")},
+                     ("kind",))
+metrics.gauge("bridge_cache_rows", "Linhas guardadas no cache de resultados", lambda: result_cache.stats()["rows"])
+metrics.counter_func("bridge_coalesced_requests_total", "Consultas pelo single-flight: executadas e agrupadas",
+                     lambda: {(k,): sales_flight.stats()[k] for k in ("executed", "collapsed")}, ("kind",))
+metrics.gauge("bridge_coalesced_in_flight", "Consultas do single-flight em andamento",
+              lambda: sales_flight.stats()["in_flight"])
+metrics.gauge("bridge_mirror_last_sync_age_seconds", "Segundos desde a última sincronização do espelho",
+              lambda: mirror.stats()["last_sync_age"])
+metrics.gauge("bridge_stream_clients", "Clientes conectados em /vendas/stream",
+              lambda: sales_stream.stats()["subscribers"])
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ============================================
+# RESPOSTAS JSON (serialização e compressão)
+# ============================================
+
+try:
+    import orjson
+except ImportError:  # não vem no Python embutido; cai no json da stdlib
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_CONFIG = {
+    "min_size": 1024,     # bytes; respostas menores vão sem compressão
+    "gzip_level": 6,
+    "brotli_quality": 4,  # qualidades altas custam CPU demais por requisição
+}
+
+def json_default(val):
+    """Tipos do psycopg2 que o encoder não conhece, convertidos durante a própria codificação"""
     if isinstance(val, decimal.Decimal):
         return float(val)
     if isinstance(val, (datetime, date)):
         return val.isoformat()
     if isinstance(val, timedelta):
         return str(val)
-    return val
+    raise TypeError(f"Tipo não serializável: {type(val).__name__}")
 
-def serialize_row(row):
-    """Convert a row dict to JSON-serializable format"""
-    if row is None:
-        return None
-    return {k: serialize_value(v) for k, v in row.items()}
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify em uma passada só: Decimal/datas vão direto para o encoder
+    (json_default), sem converter as linhas antes. Usa orjson quando instalado;
+    não ordena chaves.
+    """
 
-def get_venda_table_name(target_date=None):
-    """Retorna o nome da tabela de vendas para a data especificada"""
-    if target_date is None:
-        target_date = date.today()
-    return f"venda{target_date.month:02d}{target_date.year}"
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+        kwargs.pop("default", None)
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(obj, default=json_default, **kwargs)
+
+app.json = FastJSONProvider(app)
+
+def as_columns(rows):
+    """[{a: 1, b: 2}, {a: 3, b: 4}] -> {a: [1, 3], b: [2, 4]} (chaves repetidas uma vez só)"""
+    if not rows:
+        return {}
+    return {col: [r.get(col) for r in rows] for col in rows[0]}
+
+def response_shape():
+    """Formato pedido em ?formato=: "linhas" (padrão, lista de objetos) ou "colunas" """
+    formato = request.args.get("formato", "linhas")
+    if formato not in ("linhas", "colunas"):
+        raise ValueError("Formato deve ser linhas ou colunas")
+    return formato
+
+def shaped(rows):
+    return as_columns(rows) if response_shape() == "colunas" else rows
+
+_compress_lock = threading.Lock()
+_compress_stats = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli negociado por Accept-Encoding nas respostas JSON (nunca em streams)"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype != "application/json"
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    corpo = response.get_data()
+    if len(corpo) < COMPRESS_CONFIG["min_size"]:
+        return response
+    aceitos = request.accept_encodings
+    if brotli is not None and aceitos["br"]:
+        comprimido, encoding = brotli.compress(corpo, quality=COMPRESS_CONFIG["brotli_quality"]), "br"
+    elif aceitos["gzip"]:
+        comprimido, encoding = gzip.compress(corpo, compresslevel=COMPRESS_CONFIG["gzip_level"]), "gzip"
+    else:
+        return response
+    response.set_data(comprimido)
+    response.headers["Content-Encoding"] = encoding
+    with _compress_lock:
+        _compress_stats["responses"] += 1
+        _compress_stats["bytes_in"] += len(corpo)
+        _compress_stats["bytes_out"] += len(comprimido)
+    return response
+
+def response_stats():
+    with _compress_lock:
+        contadores = dict(_compress_stats)
+    return {
+        "encoder": "orjson" if orjson is not None else "json",
+        "encodings": ["br", "gzip"] if brotli is not None else ["gzip"],
+        **contadores,
+    }
+
+# ============================================
+# CATÁLOGO DE TABELAS vendaMMYYYY
+# ============================================
+
+VENDA_TABLE_RE = re.compile(r'^venda(\d{2})(\d{4})$')
+
+class VendaCatalog:
+    """
+    Cache das tabelas vendaMMYYYY que existem no ERP.
+    Evita consultar tabelas inexistentes (antes era try/except por tabela).
+    """
+
+    def __init__(self, ttl=600, retry_current=60, connect=None):
+        self.ttl = ttl                      # segundos até reler o catálogo
+        self.retry_current = retry_current  # releitura mais cedo se o mês atual ainda não apareceu
+        self.connect = connect              # conexão do banco da loja (padrão: get_db_connection)
+        self._lock = threading.Lock()
+        self._tables = set()
+        self._loaded_at = None
+
+    def _expired(self):
+        if self._loaded_at is None:
+            return True
+        age = time.monotonic() - self._loaded_at
+        if age >= self.ttl:
+            return True
+        # Virada de mês: a tabela nova é criada pelo ERP na primeira venda
+        return get_venda_table_name() not in self._tables and age >= self.retry_current
+
+    def refresh(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT tablename FROM pg_catalog.pg_tables
+                WHERE schemaname = ANY(current_schemas(false))
+                AND tablename LIKE 'venda%'
+            """)
+            tables = {r[0] for r in cur.fetchall() if VENDA_TABLE_RE.match(r[0])}
+        with self._lock:
+            self._tables = tables
+            self._loaded_at = time.monotonic()
+        return tables
+
+    def tables(self, conn=None):
+        """Nomes das tabelas vendaMMYYYY (usa conn ou empresta uma do pool se precisar reler)"""
+        with self._lock:
+            if not self._expired():
+                return set(self._tables)
+        if conn is None:
+            with (self.connect or get_db_connection)() as conn:
+                return set(self.refresh(conn))
+        return set(self.refresh(conn))
+
+    def tables_between(self, data_inicio, data_fim, conn=None):
+        """Tabelas existentes que cobrem o período, em ordem cronológica"""
+        existentes = self.tables(conn)
+        return [t for t in (get_venda_table_name(d) for d in month_starts(data_inicio, data_fim))
+                if t in existentes]
+
+venda_catalog = VendaCatalog()
+
+# ============================================
+# LOJAS (um banco VR por loja)
+# ============================================
+
+# A loja padrão usa o DB acima; as demais vêm de lojas.json (ver lojas.exemplo.json):
+# {"<id>": {"nome": "...", "db": {"host": ..., "port": ..., "database": ..., "user": ..., "password": ...}}}
+LOJAS_FILE = os.path.join(DATA_DIR, "lojas.json")
+LOJA_PADRAO = "principal"
+
+FANOUT_CONFIG = {
+    "max_workers": 4,  # lojas consultadas ao mesmo tempo
+    "timeout": 30,     # segundos esperando todas as lojas responderem
+}
+
+class Loja:
+    """Banco VR de uma loja, com pool, disjuntor e catálogo de tabelas próprios"""
+
+    def __init__(self, id, nome, db, pool=None, breaker=None, catalog=None):
+        self.id = id
+        self.nome = nome
+        self.pool = pool or ConnectionPool(db, on_query=partial(record_query, loja=id), **POOL_CONFIG)
+        self.breaker = breaker or CircuitBreaker(**BREAKER_CONFIG)
+        self.catalog = catalog or VendaCatalog(connect=self.connection)
+
+    @property
+    def principal(self):
+        return self.id == LOJA_PADRAO
+
+    def connection(self, statement_timeout=None):
+        return guarded_connection(self.pool, self.breaker, statement_timeout)
+
+    def stats(self):
+        return {"nome": self.nome, "pool": self.pool.stats(), "breaker": self.breaker.stats()}
+
+def load_lojas():
+    lojas = {LOJA_PADRAO: Loja(LOJA_PADRAO, "Loja principal", DB,
+                               pool=db_pool, breaker=erp_breaker, catalog=venda_catalog)}
+    if os.path.exists(LOJAS_FILE):
+        with open(LOJAS_FILE, encoding="utf-8") as f:
+            for loja_id, cfg in json.load(f).items():
+                if loja_id == LOJA_PADRAO:
+                    lojas[loja_id].nome = cfg.get("nome", lojas[loja_id].nome)
+                    continue
+                lojas[loja_id] = Loja(loja_id, cfg.get("nome", loja_id), cfg["db"])
+    return lojas
+
+LOJAS = load_lojas()
+
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_CONFIG["max_workers"], thread_name_prefix="loja")
+
+def parse_lojas(valor):
+    """Lista ou "a,b" (ou "todas") -> [Loja]; ValueError para loja desconhecida"""
+    if isinstance(valor, str):
+        valor = [v.strip() for v in valor.split(",") if v.strip()]
+    if valor == ["todas"]:
+        return list(LOJAS.values())
+    desconhecidas = [v for v in valor if v not in LOJAS]
+    if desconhecidas:
+        raise ValueError(f"Loja desconhecida: {', '.join(desconhecidas)} (disponíveis: {', '.join(LOJAS)})")
+    return [LOJAS[v] for v in dict.fromkeys(valor)]
+
+def fan_out(lojas, fn):
+    """
+    Executa fn(loja) em paralelo para cada loja (no máximo max_workers ao mesmo tempo).
+    Falha ou demora de uma loja não derruba as outras.
+    Retorna {loja_id: {"status": "ok", "resultado", "tempo_ms", "stale_idade"} ou {"status": "erro", "error", "tempo_ms"}}
+    stale_idade: idade do resultado vencido entregue para a loja (ERP lento ou fora), ou None;
+    também anotada na requisição, que roda nesta thread.
+    """
+    def run(loja):
+        inicio = time.monotonic()
+        _stale_local.idades = []  # mark_stale nesta thread (sem contexto da requisição) anota aqui
+        try:
+            resultado = fn(loja)
+            return {"status": "ok", "resultado": resultado,
+                    "tempo_ms": round((time.monotonic() - inicio) * 1000, 1),
+                    "stale_idade": max(_stale_local.idades, default=None)}
+        except Exception as e:
+            return {"status": "erro", "error": str(e),
+                    "tempo_ms": round((time.monotonic() - inicio) * 1000, 1)}
+        finally:
+            _stale_local.idades = None
+
+    deadline = time.monotonic() + FANOUT_CONFIG["timeout"]
+    futures = {loja.id: fanout_executor.submit(run, loja) for loja in lojas}
+    saida = {}
+    for loja_id, future in futures.items():
+        try:
+            saida[loja_id] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            saida[loja_id] = {"status": "erro", "error": f"Sem resposta em {FANOUT_CONFIG['timeout']}s",
+                              "tempo_ms": FANOUT_CONFIG["timeout"] * 1000}
+        if saida[loja_id].get("stale_idade") is not None:
+            mark_stale(saida[loja_id]["stale_idade"])
+    return saida
+
+def fan_out_response(lojas, resultados, por_loja, consolidar):
+    """
+    Corpo padrão das respostas multi-loja.
+    por_loja(resultado) -> campos da loja; consolidar([resultados ok]) -> campos do consolidado
+    """
+    ok = [loja.id for loja in lojas if resultados[loja.id]["status"] == "ok"]
+    corpo = {"lojas": {}, "falhas": [loja.id for loja in lojas if loja.id not in ok]}
+    for loja in lojas:
+        r = resultados[loja.id]
+        item = {"nome": loja.nome, "status": r["status"], "tempo_ms": r["tempo_ms"]}
+        if r["status"] == "ok":
+            item.update(por_loja(r["resultado"]))
+            if r["stale_idade"] is not None:
+                item["stale"] = True
+                item["idade_segundos"] = round(r["stale_idade"], 1)
+        else:
+            item["error"] = r["error"]
+        corpo["lojas"][loja.id] = item
+    corpo["consolidado"] = dict(consolidar([resultados[i]["resultado"] for i in ok]), lojas=ok)
+    corpo["status"] = "ok" if not corpo["falhas"] else ("parcial" if ok else "erro")
+    return corpo
+
+# ============================================
+# ESPELHO LOCAL DE VENDAS (ver sales_mirror.py)
+# ============================================
+
+MIRROR_CONFIG = {
+    "path": os.path.join(DATA_DIR, "vendas_espelho.db"),
+    "months": 24,               # meses (tabelas vendaMMYYYY) mantidos no espelho
+    "interval": 60,             # segundos entre sincronizações incrementais
+    "reconcile_days": 2,        # dias recentes recalculados no mês corrente
+    "reconcile_interval": 3600, # segundos entre recálculos
+    "settle": 900,              # segundos após o fim de um dia até um recálculo contar como completo para ele
+    "close_after": 3600,        # segundos após o fim do mês até o recálculo final da tabela
+}
+
+# Cargas do espelho varrem meses inteiros: limite de consulta maior que o das rotas
+MIRROR_STATEMENT_TIMEOUT = 300000
+
+mirror = SalesMirror(
+    connect=lambda: get_db_connection(statement_timeout=MIRROR_STATEMENT_TIMEOUT),
+    list_tables=venda_catalog.tables,
+    **MIRROR_CONFIG,
+)
+
+# ============================================
+# PLANEJADOR DE CONSULTAS MULTI-MÊS
+# ============================================
+
+UNION_ALL = "\n            UNION ALL"
+
+def plan_periodo_query(tabelas):
+    """
+    Monta um único SELECT que agrega vendas de várias tabelas vendaMMYYYY.
+    Cada tabela é pré-agregada por produto e o UNION ALL é consolidado no
+    próprio Postgres: uma ida ao banco por período, qualquer que seja o número de meses.
+    Parâmetros nomeados: codigos (lista de ids), inicio, fim.
+    """
+    partes = [f"""
+            SELECT id_produto,
+                   SUM(quantidade) AS quantidade_total,
+                   COUNT(*) AS numero_vendas,
+                   MIN(data) AS primeira_venda,
+                   MAX(data) AS ultima_venda
+            FROM {tabela}
+            WHERE id_produto = ANY(%(codigos)s)
+            AND data >= %(inicio)s AND data <= %(fim)s
+            GROUP BY id_produto""" for tabela in tabelas]
+    return f"""
+        SELECT id_produto,
+               SUM(quantidade_total) AS quantidade_total,
+               SUM(numero_vendas)::bigint AS numero_vendas,
+               MIN(primeira_venda) AS primeira_venda,
+               MAX(ultima_venda) AS ultima_venda
+        FROM ({UNION_ALL.join(partes)}
+        ) parciais
+        GROUP BY id_produto
+    """
+
+def plan_historico_query(tabelas, limite=100):
+    """SELECT único com as vendas de um produto em várias tabelas, mais recentes primeiro"""
+    partes = [f"""
+            SELECT id, id_produto, quantidade, precovenda, data
+            FROM {tabela}
+            WHERE id_produto = %(codigo)s
+            AND data >= %(inicio)s AND data <= %(fim)s""" for tabela in tabelas]
+    return f"""
+        SELECT id_produto,
+               quantidade,
+               precovenda as valor,
+               (quantidade * precovenda) as valortotal,
+               data
+        FROM ({UNION_ALL.join(partes)}
+        ) vendas
+        ORDER BY data DESC, id DESC
+        LIMIT {int(limite)}
+    """
+
+def parse_codigos(codigos):
+    """Converte a lista de códigos recebida (números ou strings) para inteiros"""
+    return [int(c) for c in codigos]
+
+# ============================================
+# COALESCÊNCIA DE CONSULTAS IDÊNTICAS
+# ============================================
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave: só a primeira vai ao banco,
+    as demais esperam e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # chave -> _Call em andamento
+        self._executed = 0
+        self._collapsed = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self._executed += 1
+            else:
+                call.waiters += 1
+                self._collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self._executed,
+                "collapsed": self._collapsed,
+                "in_flight": len(self._calls),
+            }
+
+sales_flight = SingleFlight()
+
+# ============================================
+# CACHE DE RESULTADOS
+# ============================================
+
+CACHE_CONFIG = {
+    "max_entries": 2000,  # respostas guardadas
+    "max_rows": 500000,   # soma das linhas de todas as respostas (limita a memória)
+    "ttl_hoje": 60,       # segundos de validade quando o período inclui o dia atual
+    "stale_max": 86400,   # segundos que um resultado vencido ainda serve de reserva se o ERP falhar
+    "stale_wait": 3,      # segundos esperando o ERP antes de responder com o resultado vencido
+}
+
+_stale_local = threading.local()  # threads do fan_out: idades anotadas por loja
+
+def mark_stale(idade):
+    """
+    Anota na requisição atual que parte da resposta veio de um resultado vencido.
+    Nas threads do fan_out (sem contexto da requisição) anota na loja em execução;
+    o fan_out repassa para a requisição.
+    """
+    if has_request_context():
+        g.stale_age = max(g.get("stale_age", 0), idade)
+    elif getattr(_stale_local, "idades", None) is not None:
+        _stale_local.idades.append(idade)
+
+class ResultCache:
+    """
+    Cache LRU de resultados agregados, thread-safe.
+    Dias já fechados nunca mudam na vendaMMYYYY: ficam sem expiração.
+    Períodos que incluem hoje expiram após ttl_hoje segundos.
+    Resultados vencidos ficam guardados por mais stale_max segundos: se o ERP
+    estiver lento ou fora do ar na hora de recarregar, são entregues no lugar
+    (stale-while-revalidate) e on_stale(idade) é chamado.
+    Com shared (SharedCache, vários workers no serve.py) um miss consulta o
+    cache dos outros processos antes de ir ao ERP, e o que vem do ERP é
+    gravado lá também.
+    """
+
+    def __init__(self, max_entries=2000, max_rows=500000, ttl_hoje=60,
+                 stale_max=86400, stale_wait=3, flight=None, on_stale=None, shared=None):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl_hoje = ttl_hoje
+        self.stale_max = stale_max
+        self.stale_wait = stale_wait
+        self.flight = flight or SingleFlight()
+        self.on_stale = on_stale
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # chave -> (valor, linhas, expira_em ou None, gravado_em)
+        self._rows = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._stale_served = 0
+
+    def ttl_for(self, data_fim):
+        """None (sem expiração) para períodos fechados, ttl_hoje caso contrário"""
+        return None if data_fim < date.today() else self.ttl_hoje
+
+    def get(self, key):
+        """Retorna (True, valor) em caso de acerto ou (False, None)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, _, expires_at, _ = item
+                now = time.monotonic()
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return True, value
+                if expires_at + self.stale_max <= now:
+                    self._remove(key)
+            self._misses += 1
+            return False, None
+
+    def get_stale(self, key):
+        """(valor, idade em segundos) de um resultado vencido ainda guardado, ou None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, _, _, stored_at = item
+            return value, time.monotonic() - stored_at
+
+    def put(self, key, value, ttl=None, rows=1):
+        if rows > self.max_rows:
+            return
+        now = time.monotonic()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, rows, expires_at, now)
+            self._rows += rows
+            while len(self._data) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._data)))
+                self._evictions += 1
+
+    def get_or_load(self, key, loader, ttl=None, rows=len):
+        """
+        Busca no cache ou executa loader() e guarda o resultado.
+        Misses simultâneos da mesma chave compartilham uma única execução.
+        Havendo um resultado vencido, a recarga roda em segundo plano e o
+        vencido é entregue se o ERP falhar ou demorar mais que stale_wait.
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        def load():
+            if self.shared is not None:
+                hit, value, restante = self.shared.get(key)
+                if hit:
+                    self.put(key, value, restante, rows(value) if callable(rows) else rows)
+                    return value
+            value = loader()
+            self.put(key, value, ttl, rows(value) if callable(rows) else rows)
+            if self.shared is not None:
+                self.shared.put(key, value, ttl)
+            return value
+
+        stale = self.get_stale(key)
+        if stale is None:
+            return self.flight.do(key, load)
+
+        done = threading.Event()
+        outcome = {}
+
+        def refresh():
+            try:
+                outcome["value"] = self.flight.do(key, load)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=refresh, name="cache-refresh", daemon=True).start()
+        if done.wait(self.stale_wait):
+            if "value" in outcome:
+                return outcome["value"]
+            if not isinstance(outcome["error"], ERP_ERRORS):
+                raise outcome["error"]
+        value, age = stale
+        with self._lock:
+            self._stale_served += 1
+        if self.on_stale is not None:
+            self.on_stale(age)
+        return value
+
+    def _remove(self, key):
+        _, rows, _, _ = self._data.pop(key)
+        self._rows -= rows
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._rows = 0
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._data),
+                "rows": self._rows,
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / total, 3) if total else None,
+                "evictions": self._evictions,
+                "stale_served": self._stale_served,
+                "shared": self.shared.stats() if self.shared is not None else None,
+            }
+
+result_cache = ResultCache(flight=sales_flight, on_stale=mark_stale, **CACHE_CONFIG)
+
+@app.after_request
+def flag_stale_response(response):
+    """Resposta montada com resultado vencido (ERP fora do ar): marca stale e a idade no JSON"""
+    idade = g.get("stale_age")
+    if idade is None or response.is_streamed or response.mimetype != "application/json":
+        return response
+    dados = response.get_json(silent=True)
+    if isinstance(dados, dict):
+        dados["stale"] = True
+        dados["idade_segundos"] = round(idade, 1)
+        response.set_data(app.json.dumps(dados))
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# ============================================
+# ÍNDICE EM MEMÓRIA DA TABELA produto
+# ============================================
+
+PRODUTO_INDEX_CONFIG = {
+    # Colunas guardadas além do id (as que não existirem no ERP são ignoradas)
+    "columns": ["descricaocompleta", "descricaoreduzida", "id_tipoembalagem", "pesavel"],
+    "check_interval": 300,  # segundos entre verificações de alteração na tabela
+}
+
+class ProdutoIndex:
+    """
+    Cópia compacta da tabela produto em memória (id -> descrição e unidade).
+    Carregada na inicialização e recarregada em segundo plano quando os
+    contadores de escrita da tabela (pg_stat_user_tables) mudam.
+    """
+
+    def __init__(self, columns, check_interval=300):
+        self.columns = columns
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._rows = {}      # id -> tupla com os valores de self._fields
+        self._fields = ()
+        self._fingerprint = None
+        self._loaded_at = None
+        self._loads = 0
+        self._thread = None
+        self._last_error = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _read_fingerprint(self, cur):
+        cur.execute("""
+            SELECT n_tup_ins, n_tup_upd, n_tup_del
+            FROM pg_stat_user_tables
+            WHERE relname = 'produto'
+            AND schemaname = ANY(current_schemas(false))
+        """)
+        stats = cur.fetchone()
+        cur.execute("SELECT COUNT(*), MAX(id) FROM produto")
+        return tuple(stats or ()) + tuple(cur.fetchone())
+
+    def load(self, conn=None):
+        if conn is None:
+            with get_db_connection() as conn:
+                return self.load(conn)
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'produto'
+                AND table_schema = ANY(current_schemas(false))
+            """)
+            existentes = {r[0] for r in cur.fetchall()}
+            fields = tuple(c for c in self.columns if c in existentes)
+            fingerprint = self._read_fingerprint(cur)
+            cur.execute(f"SELECT id, {', '.join(fields) or 'NULL'} FROM produto")
+            rows = {r[0]: tuple(r[1:]) for r in cur.fetchall()}
+        with self._lock:
+            self._rows = rows
+            self._fields = fields
+            self._fingerprint = fingerprint
+            self._loaded_at = time.time()
+            self._loads += 1
+        return len(rows)
+
+    def refresh_if_changed(self):
+        """Recarrega o índice se a tabela produto foi alterada desde a última carga"""
+        with get_db_connection() as conn:
+            if self.loaded:
+                with conn.cursor() as cur:
+                    if self._read_fingerprint(cur) == self._fingerprint:
+                        return False
+            self.load(conn)
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_if_changed()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+            time.sleep(self.check_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="produto-index", daemon=True)
+            self._thread.start()
+
+    def get(self, codigo):
+        """Dicionário com as colunas indexadas do produto, ou None"""
+        row = self._rows.get(codigo)
+        return dict(zip(self._fields, row)) if row is not None else None
+
+    def nomes(self, ids):
+        i = self._fields.index('descricaocompleta') if 'descricaocompleta' in self._fields else None
+        rows = self._rows
+        return {cod: rows[cod][i] for cod in ids if cod in rows and i is not None}
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "products": len(self._rows),
+            "fields": list(self._fields),
+            "loads": self._loads,
+            "loaded_at": datetime.fromtimestamp(self._loaded_at).isoformat(timespec='seconds') if self._loaded_at else None,
+            "last_error": self._last_error,
+        }
+
+produto_index = ProdutoIndex(**PRODUTO_INDEX_CONFIG)
+
+def fetch_nomes_produtos(ids, conn=None, indice=True):
+    """
+    {id: descricaocompleta} dos produtos informados (do índice em memória quando carregado).
+    indice=False lê direto de conn (banco de outra loja, que o índice não cobre).
+    """
+    if indice and produto_index.loaded:
+        return produto_index.nomes(ids)
+    if not ids:
+        return {}
+    if conn is None:
+        with get_db_connection() as conn:
+            return fetch_nomes_produtos(ids, conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, descricaocompleta FROM produto WHERE id = ANY(%s)", (list(ids),))
+        return dict(cur.fetchall())
+
+# ============================================
+# GET CONDICIONAL (ETag / Cache-Control)
+# ============================================
+
+CACHE_CONTROL = {
+    "mes_fechado": "public, max-age=31536000, immutable",
+    "dia_fechado": "public, max-age=3600",
+    "aberto": "no-cache",
+}
+
+def fetch_watermarks(tabelas, conn=None):
+    """{tabela: maior id} lido direto do ERP (índice da chave primária)"""
+    if not tabelas:
+        return {}
+    if conn is None:
+        with get_db_connection() as conn:
+            return fetch_watermarks(tabelas, conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT " + ", ".join(f"(SELECT COALESCE(MAX(id), 0) FROM {t})" for t in tabelas))
+        return dict(zip(tabelas, cur.fetchone()))
+
+def make_etag(key, marcas):
+    bruto = repr((API_VERSION, key, sorted(marcas.items()) if marcas else "fechado"))
+    return hashlib.sha1(bruto.encode()).hexdigest()[:20]
+
+def cache_control_for(data_fim):
+    hoje = date.today()
+    if data_fim < hoje.replace(day=1):
+        return CACHE_CONTROL["mes_fechado"]
+    if data_fim < hoje:
+        return CACHE_CONTROL["dia_fechado"]
+    return CACHE_CONTROL["aberto"]
+
+def cached_with_etag(key, tabelas, data_fim, loader, rows=len):
+    """
+    result_cache.get_or_load que guarda junto o ETag do resultado.
+    Período fechado: ETag só da chave (os dados não mudam mais).
+    Período aberto: ETag da chave + marca d'água (maior id) das tabelas,
+    lida antes dos dados - na dúvida o ETag muda e o cliente baixa de novo.
+    Retorna (valor, etag)
+    """
+    def load():
+        marcas = fetch_watermarks(tabelas) if data_fim >= date.today() else None
+        return loader(), make_etag(key, marcas)
+
+    return result_cache.get_or_load(
+        key, load,
+        ttl=result_cache.ttl_for(data_fim),
+        rows=lambda r: rows(r[0]) if callable(rows) else rows,
+    )
+
+def conditional_json(etag, cache_control, build):
+    """304 se o cliente já tem a versão (If-None-Match), senão jsonify(build())"""
+    formato = response_shape()
+    if formato != "linhas":
+        etag = f"{etag}-{formato}"
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = jsonify(build())
+    resposta.set_etag(etag, weak=True)
+    resposta.headers["Cache-Control"] = cache_control
+    return resposta
+
+# ============================================
+# ENDPOINTS
+# ============================================
+
+# Default home route moved to top
+
+
+@app.route('/produto/<int:codigo>')
+def get_produto(codigo):
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT * FROM produto WHERE id = %s LIMIT 1", (codigo,))
+            r = cur.fetchone()
+        return jsonify({"found": bool(r), "data": r})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# ENDPOINTS DE VENDAS - USANDO TABELA vendaMMYYYY
+# ============================================
+
+@app.route('/vendas/produto/<codigo>')
+def get_vendas_produto(codigo):
+    """
+    Retorna resumo de vendas para um produto usando tabela vendaMMYYYY:
+    - quantidade_hoje: total vendido hoje
+    - ultima_venda: data da última venda (tabela não tem hora exata)
+    - numero_vendas: quantidade de transações
+    """
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+            hoje = date.today()
+            tabela = get_venda_table_name(hoje)
+        
+            # Buscar vendas do produto hoje
+            cur.execute(f"""
+                SELECT 
+                    SUM(quantidade) as quantidade_total,
+                    COUNT(*) as numero_vendas,
+                    MAX(data) as ultima_venda
+                FROM {tabela}
+                WHERE id_produto = %s
+                AND data = %s
+            """, (codigo, hoje.isoformat()))
+        
+            result = cur.fetchone()
+        
+            # Buscar nome do produto
+            nome = fetch_nomes_produtos([int(codigo)], conn).get(int(codigo))
+        
+        return jsonify({
+            "codigo": int(codigo),
+            "nome": nome,
+            "data": hoje.isoformat(),
+            "quantidade_total": result['quantidade_total'] or 0,
+            "numero_vendas": result['numero_vendas'] if result['numero_vendas'] else 0,
+            "ultima_venda": result['ultima_venda'],
+            "tabela": tabela,
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def fetch_vendas_historico(codigo, data_inicio, data_fim, loja=None):
+    """Nome do produto e suas vendas no período (já serializadas), mais recentes primeiro"""
+    loja = loja or LOJAS[LOJA_PADRAO]
+    with loja.connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+        # Pode precisar consultar 2 tabelas se cruzar meses
+        tabelas = loja.catalog.tables_between(data_inicio, data_fim, conn)
+    
+        all_results = []
+        if tabelas:
+            cur.execute(plan_historico_query(tabelas), {
+                "codigo": codigo,
+                "inicio": data_inicio,
+                "fim": data_fim,
+            })
+            all_results = cur.fetchall()
+    
+        # Buscar nome do produto
+        nome = fetch_nomes_produtos([codigo], conn, indice=loja.principal).get(codigo)
+    
+    return nome, [dict(r) for r in all_results]
+
+@app.route('/vendas/produto/<codigo>/historico')
+def get_vendas_historico(codigo):
+    """
+    Retorna histórico de vendas dos últimos 7 dias
+    Query: lojas=<l1,l2|todas> (opcional)
+    """
+    try:
+        hoje = date.today()
+        data_inicio = hoje - timedelta(days=7)
+        try:
+            codigo = int(codigo)
+            lojas = parse_lojas(request.args['lojas']) if request.args.get('lojas') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if lojas:
+            return fan_out_historico(codigo, data_inicio, hoje, lojas)
+        
+        # Período inclui hoje: fica no cache só por alguns segundos
+        (nome, vendas), etag = cached_with_etag(
+            ("historico", codigo, data_inicio, hoje),
+            venda_catalog.tables_between(data_inicio, hoje),
+            hoje,
+            lambda: fetch_vendas_historico(codigo, data_inicio, hoje),
+            rows=lambda r: len(r[1]) + 1,
+        )
+        
+        return conditional_json(etag, cache_control_for(hoje), lambda: {
+            "codigo": codigo,
+            "nome": nome,
+            "periodo": {"inicio": data_inicio.isoformat(), "fim": hoje.isoformat()},
+            "vendas": shaped(vendas),
+            "total_registros": len(vendas),
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def merge_historico(listas, limite=100):
+    """Vendas de várias lojas [(loja_id, vendas)] numa lista só, mais recentes primeiro, com a loja de cada uma"""
+    vendas = [dict(v, loja=loja_id) for loja_id, lista in listas for v in lista]
+    vendas.sort(key=lambda v: v['data'], reverse=True)
+    return vendas[:limite]
+
+def fan_out_historico(codigo, data_inicio, data_fim, lojas):
+    """Histórico do produto em cada loja (em paralelo) e as vendas de todas juntas"""
+    resultados = fan_out(lojas, lambda loja: (loja.id, result_cache.get_or_load(
+        ("historico", loja.id, codigo, data_inicio, data_fim),
+        lambda: fetch_vendas_historico(codigo, data_inicio, data_fim, loja),
+        ttl=result_cache.ttl_for(data_fim),
+        rows=lambda r: len(r[1]) + 1,
+    )))
+    corpo = fan_out_response(
+        lojas, resultados,
+        lambda r: {"nome": r[1][0], "vendas": shaped(r[1][1]), "total_registros": len(r[1][1])},
+        lambda rs: {"nome": next((nome for _, (nome, _) in rs if nome), None),
+                    "vendas": shaped(merge_historico([(loja_id, vendas) for loja_id, (_, vendas) in rs]))},
+    )
+    corpo = dict(codigo=codigo, periodo={"inicio": data_inicio.isoformat(), "fim": data_fim.isoformat()}, **corpo)
+    return jsonify(corpo), 503 if corpo["status"] == "erro" else 200
+
+@app.route('/vendas/produtos', methods=['POST'])
+def get_vendas_produtos_batch():
+    """
+    Consulta em lote para múltiplos produtos
+    Body: {"codigos": [123, 456, 789]}
+    """
+    try:
+        data = request.get_json()
+        codigos = data.get('codigos', [])
+        
+        if not codigos:
+            return jsonify({"error": "Lista de códigos vazia"}), 400
+        
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+            hoje = date.today()
+            tabela = get_venda_table_name(hoje)
+        
+            # Buscar vendas de todos os produtos
+            cur.execute(f"""
+                SELECT 
+                    id_produto,
+                    SUM(quantidade) as quantidade_total,
+                    COUNT(*) as numero_vendas,
+                    MAX(data) as ultima_venda
+                FROM {tabela}
+                WHERE id_produto = ANY(%s)
+                AND data = %s
+                GROUP BY id_produto
+            """, (parse_codigos(codigos), hoje.isoformat()))
+        
+            results = cur.fetchall()
+        
+            # Buscar nomes dos produtos
+            produtos = fetch_nomes_produtos(codigos, conn)
+        
+        # Montar resposta
+        vendas_dict = {r['id_produto']: r for r in results}
+        
+        resposta = []
+        for codigo in codigos:
+            venda = vendas_dict.get(codigo, {})
+            resposta.append({
+                "codigo": codigo,
+                "nome": produtos.get(codigo),
+                "quantidade_total": venda.get('quantidade_total', 0),
+                "numero_vendas": venda.get('numero_vendas', 0),
+                "ultima_venda": venda.get('ultima_venda')
+            })
+        
+        return jsonify({
+            "data": hoje.isoformat(),
+            "produtos": resposta,
+            "tabela": tabela,
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def fetch_vendas_ruptura(data_obj, loja=None):
+    """Totais por produto vendidos em um dia, do mais vendido ao menos vendido"""
+    loja = loja or LOJAS[LOJA_PADRAO]
+    tabela = get_venda_table_name(data_obj)
+    if loja.principal and mirror.covers([tabela], data_obj):
+        # Espelho local: só os nomes vêm do ERP
+        results = [dict(r, primeira_venda=data_obj, ultima_venda=data_obj) for r in mirror.dia(data_obj)]
+        produtos = fetch_nomes_produtos([r['id_produto'] for r in results])
+    elif tabela not in loja.catalog.tables():
+        raise ValueError(f"Tabela {tabela} não existe")
+    else:
+        with loja.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+            cur.execute(f"""
+                SELECT 
+                    id_produto,
+                    SUM(quantidade) as quantidade_total,
+                    COUNT(*) as numero_vendas,
+                    MAX(data) as ultima_venda,
+                    MIN(data) as primeira_venda
+                FROM {tabela}
+                WHERE data = %s
+                GROUP BY id_produto
+                ORDER BY quantidade_total DESC
+            """, (data_obj.isoformat(),))
+        
+            results = cur.fetchall()
+        
+            # Buscar nomes dos produtos
+            produtos = fetch_nomes_produtos([r['id_produto'] for r in results], conn, indice=loja.principal)
+    
+    resposta = []
+    for r in results:
+        resposta.append({
+            "codigo": r['id_produto'],
+            "nome": produtos.get(r['id_produto']),
+            "quantidade_total": r['quantidade_total'],
+            "numero_vendas": r['numero_vendas'],
+            "primeira_venda": r['primeira_venda'],
+            "ultima_venda": r['ultima_venda']
+        })
+    return resposta
+
+@app.route('/vendas/ruptura/<data_consulta>')
+def get_vendas_ruptura(data_consulta):
+    """
+    Retorna todas as vendas de uma data específica
+    Formato da data: YYYY-MM-DD
+    """
+    try:
+        try:
+            # Parsear data para determinar tabela
+            data_obj = datetime.strptime(data_consulta, "%Y-%m-%d").date()
+            lojas = parse_lojas(request.args['lojas']) if request.args.get('lojas') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        tabela = get_venda_table_name(data_obj)
+        
+        if lojas:
+            return fan_out_ruptura(data_obj, lojas)
+        
+        resposta, etag = cached_with_etag(
+            ("ruptura", data_obj),
+            [t for t in [tabela] if t in venda_catalog.tables()],
+            data_obj,
+            lambda: fetch_vendas_ruptura(data_obj),
+        )
+        
+        return conditional_json(etag, cache_control_for(data_obj), lambda: {
+            "data": data_consulta,
+            "total_produtos": len(resposta),
+            "produtos": shaped(resposta),
+            "tabela": tabela,
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def merge_ruptura(listas):
+    """Soma por produto as listas de fetch_vendas_ruptura de várias lojas"""
+    total = {}
+    for lista in listas:
+        for p in lista:
+            t = total.get(p['codigo'])
+            if t is None:
+                total[p['codigo']] = dict(p)
+                continue
+            t['nome'] = t['nome'] or p['nome']
+            t['quantidade_total'] = (t['quantidade_total'] or 0) + (p['quantidade_total'] or 0)
+            t['numero_vendas'] = (t['numero_vendas'] or 0) + (p['numero_vendas'] or 0)
+            t['primeira_venda'] = min(t['primeira_venda'], p['primeira_venda'])
+            t['ultima_venda'] = max(t['ultima_venda'], p['ultima_venda'])
+    return sorted(total.values(), key=lambda p: p['quantidade_total'] or 0, reverse=True)
+
+def fan_out_ruptura(data_obj, lojas):
+    """Ruptura do dia em cada loja (em paralelo) e somada entre as lojas"""
+    resultados = fan_out(lojas, lambda loja: result_cache.get_or_load(
+        ("ruptura", loja.id, data_obj),
+        lambda: fetch_vendas_ruptura(data_obj, loja),
+        ttl=result_cache.ttl_for(data_obj),
+    ))
+    corpo = fan_out_response(
+        lojas, resultados,
+        lambda produtos: {"total_produtos": len(produtos), "produtos": shaped(produtos)},
+        lambda listas: {"produtos": shaped(merge_ruptura(listas))},
+    )
+    corpo = dict(data=data_obj.isoformat(), tabela=get_venda_table_name(data_obj), **corpo)
+    return jsonify(corpo), 503 if corpo["status"] == "erro" else 200
+
+def fetch_vendas_periodo(codigos, data_inicio, data_fim, loja=None):
+    """
+    Agrega as vendas dos produtos no período: pelo espelho local quando ele
+    cobre o período (só a loja principal), senão com uma única consulta no ERP.
+    Retorna ({id_produto: {nome, quantidade_total, ...}}, tabelas_consultadas)
+    """
+    loja = loja or LOJAS[LOJA_PADRAO]
+    # Só as tabelas do período que existem de fato (pode cruzar meses)
+    tabelas = loja.catalog.tables_between(data_inicio, data_fim)
+    if loja.principal and mirror.covers(tabelas, data_fim):
+        vendas = mirror.periodo(codigos, data_inicio, data_fim)
+        nomes = fetch_nomes_produtos(codigos)
+        for cod in codigos:
+            vendas.setdefault(cod, {})["nome"] = nomes.get(cod)
+        return vendas, tabelas
+
+    # ERP: uma consulta para todas as tabelas do período
+    with loja.connection() as conn:
+        vendas = {}
+        if tabelas:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(plan_periodo_query(tabelas), {
+                "codigos": codigos,
+                "inicio": data_inicio,
+                "fim": data_fim,
+            })
+            for r in cur.fetchall():
+                vendas[r['id_produto']] = {
+                    "quantidade_total": r['quantidade_total'],
+                    "numero_vendas": r['numero_vendas'],
+                    "primeira_venda": r['primeira_venda'],
+                    "ultima_venda": r['ultima_venda'],
+                }
+        nomes = fetch_nomes_produtos(codigos, conn, indice=loja.principal)
+    for cod in codigos:
+        vendas.setdefault(cod, {})["nome"] = nomes.get(cod)
+    return vendas, tabelas
+
+def merge_vendas(a, b):
+    """Soma dois resultados de fetch_vendas_periodo (períodos disjuntos)"""
+    vendas = {}
+    for cod in a.keys() | b.keys():
+        va, vb = a.get(cod), b.get(cod)
+        if va is None or vb is None:
+            vendas[cod] = va or vb
+            continue
+        datas_inicio = [d for d in (va.get('primeira_venda'), vb.get('primeira_venda')) if d]
+        datas_fim = [d for d in (va.get('ultima_venda'), vb.get('ultima_venda')) if d]
+        vendas[cod] = {
+            "nome": va.get('nome') or vb.get('nome'),
+            "quantidade_total": (va.get('quantidade_total') or 0) + (vb.get('quantidade_total') or 0),
+            "numero_vendas": (va.get('numero_vendas') or 0) + (vb.get('numero_vendas') or 0),
+            "primeira_venda": min(datas_inicio) if datas_inicio else None,
+            "ultima_venda": max(datas_fim) if datas_fim else None,
+        }
+    return vendas
+
+def cached_vendas_periodo(codigos, data_inicio, data_fim, loja=None):
+    """
+    fetch_vendas_periodo com cache (por loja).
+    Um período que cruza o dia atual é dividido em duas partes: os dias
+    fechados (cache sem expiração) e o trecho a partir de hoje (cache curto).
+    """
+    codigos = sorted(set(codigos))
+    hoje = date.today()
+    loja = loja or LOJAS[LOJA_PADRAO]
+
+    def load(inicio, fim):
+        return result_cache.get_or_load(
+            ("periodo", loja.id, tuple(codigos), inicio, fim),
+            lambda: fetch_vendas_periodo(codigos, inicio, fim, loja),
+            ttl=result_cache.ttl_for(fim),
+            rows=len(codigos),
+        )
+
+    if data_inicio < hoje <= data_fim:
+        fechado, tabelas_fechado = load(data_inicio, hoje - timedelta(days=1))
+        aberto, tabelas_aberto = load(hoje, data_fim)
+        return merge_vendas(fechado, aberto), list(dict.fromkeys(tabelas_fechado + tabelas_aberto))
+    return load(data_inicio, data_fim)
+
+@app.route('/vendas/produtos/periodo', methods=['POST'])
+def get_vendas_produtos_periodo():
+    """
+    Consulta vendas de múltiplos produtos em um período de datas
+    Body: {
+        "codigos": [123, 456, 789],
+        "data_inicio": "2026-01-26",
+        "data_fim": "2026-01-28"
+    }
+    """
+    try:
+        data = request.get_json()
+        codigos = data.get('codigos', [])
+        data_inicio_str = data.get('data_inicio')
+        data_fim_str = data.get('data_fim')
+        
+        if not codigos:
+            return jsonify({"error": "Lista de códigos vazia"}), 400
+        
+        # Usar hoje como padrão se não especificado
+        hoje = date.today()
+        try:
+            data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d").date() if data_inicio_str else hoje
+            data_fim = datetime.strptime(data_fim_str, "%Y-%m-%d").date() if data_fim_str else hoje
+            lojas = data.get('lojas') or request.args.get('lojas')
+            lojas = parse_lojas(lojas) if lojas else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if lojas:
+            return fan_out_periodo(codigos, data_inicio, data_fim, lojas)
+        
+        vendas_agregadas, tabelas = cached_vendas_periodo(parse_codigos(codigos), data_inicio, data_fim)
+        
+        return jsonify({
+            "data_inicio": data_inicio.isoformat(),
+            "data_fim": data_fim.isoformat(),
+            "produtos": shaped(montar_produtos_periodo(codigos, vendas_agregadas)),
+            "tabelas_consultadas": tabelas,
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def montar_produtos_periodo(codigos, vendas_agregadas):
+    """Uma linha por código pedido, na ordem pedida (zerada se não vendeu)"""
+    resposta = []
+    for codigo in codigos:
+        venda = vendas_agregadas.get(int(codigo), {})
+        resposta.append({
+            "codigo": codigo,
+            "nome": venda.get('nome'),
+            "quantidade_total": venda.get('quantidade_total') or 0,
+            "numero_vendas": venda.get('numero_vendas') or 0,
+            "primeira_venda": venda.get('primeira_venda'),
+            "ultima_venda": venda.get('ultima_venda')
+        })
+    return resposta
+
+def fan_out_periodo(codigos, data_inicio, data_fim, lojas):
+    """Vendas do período em cada loja (em paralelo) e somadas entre as lojas"""
+    ids = parse_codigos(codigos)
+    resultados = fan_out(lojas, lambda loja: cached_vendas_periodo(ids, data_inicio, data_fim, loja))
+    corpo = fan_out_response(
+        lojas, resultados,
+        lambda r: {"produtos": shaped(montar_produtos_periodo(codigos, r[0])), "tabelas_consultadas": r[1]},
+        lambda rs: {"produtos": shaped(montar_produtos_periodo(codigos, reduce(merge_vendas, [v for v, _ in rs], {})))},
+    )
+    corpo = dict(data_inicio=data_inicio.isoformat(), data_fim=data_fim.isoformat(), **corpo)
+    return jsonify(corpo), 503 if corpo["status"] == "erro" else 200
+
+# ============================================
+# RANKING E CURVA ABC
+# ============================================
+
+RANKING_CONFIG = {
+    "top": 50,          # linhas devolvidas por padrão
+    "max_top": 5000,
+    "corte_a": 0.80,    # participação acumulada até onde vai a classe A
+    "corte_b": 0.95,    # ... e a classe B (o resto é C)
+}
+
+RANKING_METRICAS = {"quantidade": "quantidade", "receita": "receita"}
+
+def plan_totais_query(tabelas):
+    """Totais por produto no período (UNION ALL das tabelas do período)"""
+    partes = [f"""
+                SELECT id_produto, SUM(quantidade) AS quantidade,
+                       SUM(quantidade * precovenda) AS receita, COUNT(*) AS numero_vendas
+                FROM {tabela}
+                WHERE data >= %(inicio)s AND data <= %(fim)s
+                GROUP BY id_produto""" for tabela in tabelas]
+    return f"""
+            SELECT id_produto, SUM(quantidade) AS quantidade, SUM(receita) AS receita,
+                   SUM(numero_vendas)::bigint AS numero_vendas
+            FROM ({UNION_ALL.join(partes)}
+            ) parciais
+            GROUP BY id_produto"""
+
+def plan_ranking_query(tabelas, metrica):
+    """
+    Totais por produto no período e, numa única passada de janela, posição,
+    participação e participação acumulada.
+    Classe ABC pela participação acumulada antes do produto: o item que
+    cruza o corte ainda pertence à classe.
+    Métrica nula (preço não cadastrado) conta como zero e vai para o fim.
+    Os totais vêm de resumo, fora do filtro de classe: sempre há uma linha,
+    com id_produto nulo quando nenhum produto passa no filtro.
+    """
+    valor = f"COALESCE({RANKING_METRICAS[metrica]}, 0)"
+    return f"""
+        WITH totais AS ({plan_totais_query(tabelas)}
+        ), resumo AS (
+            SELECT COALESCE(SUM({valor}), 0) AS total, COUNT(*) AS total_produtos
+            FROM totais
+        ), ranking AS (
+            SELECT id_produto, quantidade, receita, numero_vendas,
+                   ROW_NUMBER() OVER w AS posicao,
+                   {valor} / NULLIF(SUM({valor}) OVER (), 0) AS participacao,
+                   SUM({valor}) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+                       / NULLIF(SUM({valor}) OVER (), 0) AS participacao_acumulada
+            FROM totais
+            WINDOW w AS (ORDER BY {valor} DESC, id_produto)
+        ), classificado AS (
+            SELECT *, CASE
+                WHEN participacao_acumulada - participacao < %(corte_a)s THEN 'A'
+                WHEN participacao_acumulada - participacao < %(corte_b)s THEN 'B'
+                ELSE 'C' END AS classe
+            FROM ranking
+        )
+        SELECT resumo.total, resumo.total_produtos, filtrado.*
+        FROM resumo
+        LEFT JOIN (
+            SELECT * FROM classificado
+            WHERE %(classe)s::text IS NULL OR classe = %(classe)s
+            ORDER BY posicao
+            LIMIT %(top)s
+        ) filtrado ON true
+        ORDER BY filtrado.posicao
+    """
+
+def fetch_vendas_ranking(inicio, fim, metrica, top, corte_a, corte_b, classe=None):
+    """Linhas do ranking (já limitadas a top) e os totais do período"""
+    tabelas = venda_catalog.tables_between(inicio, fim)
+    if not tabelas:
+        return {"produtos": [], "total": 0, "total_produtos": 0, "tabelas_consultadas": []}
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(plan_ranking_query(tabelas, metrica), {
+            "inicio": inicio, "fim": fim, "top": top,
+            "corte_a": corte_a, "corte_b": corte_b, "classe": classe,
+        })
+        rows = cur.fetchall()
+        resumo = rows[0]
+        rows = [r for r in rows if r['id_produto'] is not None]
+        nomes = fetch_nomes_produtos([r['id_produto'] for r in rows], conn)
+    produtos = [{
+        "posicao": r['posicao'],
+        "codigo": r['id_produto'],
+        "nome": nomes.get(r['id_produto']),
+        "classe": r['classe'],
+        "quantidade": r['quantidade'],
+        "receita": round(r['receita'] or 0, 2),
+        "numero_vendas": r['numero_vendas'],
+        "participacao": round(float(r['participacao'] or 0), 5),
+        "participacao_acumulada": round(float(r['participacao_acumulada'] or 0), 5),
+    } for r in rows]
+    return {
+        "produtos": produtos,
+        "total": resumo['total'],
+        "total_produtos": resumo['total_produtos'],
+        "tabelas_consultadas": tabelas,
+    }
+
+def classe_abc(participacao, acumulada, corte_a, corte_b):
+    """Mesma regra do CASE de plan_ranking_query"""
+    antes = acumulada - participacao
+    return "A" if antes < corte_a else ("B" if antes < corte_b else "C")
+
+def rank_totais(totais, metrica, top, corte_a, corte_b, classe=None):
+    """
+    O cálculo de plan_ranking_query em Python, para totais somados entre lojas.
+    totais: {id_produto: {quantidade, receita, numero_vendas}}
+    """
+    valor = lambda v: v[metrica] or 0
+    total = sum(valor(v) for v in totais.values())
+    produtos, acumulado = [], 0
+    for posicao, (cod, v) in enumerate(sorted(totais.items(), key=lambda kv: (-valor(kv[1]), kv[0])), 1):
+        acumulado += valor(v)
+        participacao = float(valor(v) / total) if total else 0.0
+        acumulada = float(acumulado / total) if total else 0.0
+        c = classe_abc(participacao, acumulada, corte_a, corte_b)
+        if classe is not None and c != classe:
+            continue
+        produtos.append({
+            "posicao": posicao,
+            "codigo": cod,
+            "nome": None,
+            "classe": c,
+            "quantidade": v["quantidade"],
+            "receita": round(v["receita"] or 0, 2),
+            "numero_vendas": v["numero_vendas"],
+            "participacao": round(participacao, 5),
+            "participacao_acumulada": round(acumulada, 5),
+        })
+        if len(produtos) >= top:
+            break
+    return {"produtos": produtos, "total": total, "total_produtos": len(totais)}
+
+def fetch_totais_produtos(inicio, fim, loja):
+    """({id_produto: {quantidade, receita, numero_vendas}}, tabelas_consultadas) do período numa loja"""
+    tabelas = loja.catalog.tables_between(inicio, fim)
+    if not tabelas:
+        return {}, []
+    with loja.connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(plan_totais_query(tabelas), {"inicio": inicio, "fim": fim})
+        return {r['id_produto']: {
+            "quantidade": r['quantidade'],
+            "receita": r['receita'],
+            "numero_vendas": r['numero_vendas'],
+        } for r in cur.fetchall()}, tabelas
+
+def merge_totais(listas):
+    """Soma por produto vários resultados de fetch_totais_produtos (lojas diferentes)"""
+    soma = {}
+    for totais in listas:
+        for cod, v in totais.items():
+            t = soma.setdefault(cod, {"quantidade": 0, "receita": 0, "numero_vendas": 0})
+            for campo in t:
+                t[campo] += v[campo] or 0
+    return soma
+
+def fan_out_ranking(data_inicio, data_fim, metrica, top, corte_a, corte_b, classe, lojas):
+    """
+    Ranking de cada loja e o consolidado. Cada loja devolve os totais de todos
+    os produtos (o top de cada uma não basta para classificar a soma) e a
+    classificação é feita aqui sobre eles.
+    """
+    def por_loja(loja):
+        totais, tabelas = result_cache.get_or_load(
+            ("ranking_totais", loja.id, data_inicio, data_fim),
+            lambda: fetch_totais_produtos(data_inicio, data_fim, loja),
+            ttl=result_cache.ttl_for(data_fim),
+            rows=lambda r: len(r[0]) + 1,
+        )
+        ranking = rank_totais(totais, metrica, top, corte_a, corte_b, classe)
+        ids = [p["codigo"] for p in ranking["produtos"]]
+        if loja.principal:
+            nomes = fetch_nomes_produtos(ids)
+        else:
+            with loja.connection() as conn:
+                nomes = fetch_nomes_produtos(ids, conn, indice=False)
+        for p in ranking["produtos"]:
+            p["nome"] = nomes.get(p["codigo"])
+        return totais, dict(ranking, tabelas_consultadas=tabelas)
+
+    def consolidar(resultados):
+        ranking = rank_totais(merge_totais([totais for totais, _ in resultados]),
+                              metrica, top, corte_a, corte_b, classe)
+        nomes = fetch_nomes_produtos([p["codigo"] for p in ranking["produtos"]])
+        for p in ranking["produtos"]:
+            p["nome"] = nomes.get(p["codigo"])
+        return dict(ranking, produtos=shaped(ranking["produtos"]))
+
+    resultados = fan_out(lojas, por_loja)
+    corpo = fan_out_response(
+        lojas, resultados,
+        lambda r: dict(r[1], produtos=shaped(r[1]["produtos"])),
+        consolidar,
+    )
+    corpo = dict(data_inicio=data_inicio.isoformat(), data_fim=data_fim.isoformat(), metrica=metrica,
+                 cortes={"A": corte_a, "B": corte_b}, **corpo)
+    return jsonify(corpo), 503 if corpo["status"] == "erro" else 200
+
+@app.route('/vendas/ranking')
+def get_vendas_ranking():
+    """
+    Mais vendidos do período com curva ABC, calculados no Postgres
+    Query: data_inicio, data_fim (padrão: últimos 30 dias), metrica=quantidade|receita,
+           top (padrão 50), corte_a (0.80), corte_b (0.95), classe=A|B|C (opcional),
+           lojas=<l1,l2|todas> (opcional)
+    """
+    try:
+        hoje = date.today()
+        data_fim = datetime.strptime(request.args['data_fim'], "%Y-%m-%d").date() if request.args.get('data_fim') else hoje
+        data_inicio = (datetime.strptime(request.args['data_inicio'], "%Y-%m-%d").date()
+                       if request.args.get('data_inicio') else data_fim - timedelta(days=29))
+        metrica = request.args.get('metrica', 'quantidade')
+        top = int(request.args.get('top', RANKING_CONFIG["top"]))
+        corte_a = float(request.args.get('corte_a', RANKING_CONFIG["corte_a"]))
+        corte_b = float(request.args.get('corte_b', RANKING_CONFIG["corte_b"]))
+        classe = request.args.get('classe', '').upper() or None
+        lojas = parse_lojas(request.args['lojas']) if request.args.get('lojas') else None
+        
+        if metrica not in RANKING_METRICAS:
+            return jsonify({"error": "Métrica deve ser quantidade ou receita"}), 400
+        if data_inicio > data_fim or not 1 <= top <= RANKING_CONFIG["max_top"]:
+            return jsonify({"error": f"Período inválido ou top fora de 1..{RANKING_CONFIG['max_top']}"}), 400
+        if not 0 < corte_a < corte_b <= 1 or classe not in (None, "A", "B", "C"):
+            return jsonify({"error": "Cortes devem ser 0 < corte_a < corte_b <= 1 e classe A, B ou C"}), 400
+        
+        if lojas:
+            return fan_out_ranking(data_inicio, data_fim, metrica, top, corte_a, corte_b, classe, lojas)
+        
+        ranking = result_cache.get_or_load(
+            ("ranking", data_inicio, data_fim, metrica, top, corte_a, corte_b, classe),
+            lambda: fetch_vendas_ranking(data_inicio, data_fim, metrica, top, corte_a, corte_b, classe),
+            ttl=result_cache.ttl_for(data_fim),
+            rows=lambda r: len(r["produtos"]) + 1,
+        )
+        
+        return jsonify({
+            "data_inicio": data_inicio.isoformat(),
+            "data_fim": data_fim.isoformat(),
+            "metrica": metrica,
+            "cortes": {"A": corte_a, "B": corte_b},
+            "total": ranking["total"],
+            "total_produtos": ranking["total_produtos"],
+            "produtos": shaped(ranking["produtos"]),
+            "tabelas_consultadas": ranking["tabelas_consultadas"],
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# DETECTOR DE RUPTURA (ver stockout.py)
+# ============================================
+
+RUPTURA_CONFIG = {
+    "semanas": 8,                # mesmos dias da semana usados como histórico
+    "max_semanas": 26,
+    "limiar_parada": 3.0,        # vendas esperadas no silêncio para alertar (exp(-3) = 5% de acaso)
+    "fator_abaixo": 0.5,         # alerta se vendeu menos que isso do esperado até agora
+    "min_vendas_esperadas": 4,   # abaixo disso o produto vende pouco demais para comparar
+    "min_dias": 3,               # dias do histórico em que o produto precisa ter vendido
+}
+
+def fetch_dias_venda(datas):
+    """
+    Agregados por produto e o movimento da loja (menor/maior id, linhas) em cada data.
+    Retorna {"produtos": [(id_produto, data, quantidade, vendas, ultimo_id)], "dias": {data: (menor, maior, linhas)}}
+    """
+    existentes = venda_catalog.tables()
+    tabelas = [t for t in dict.fromkeys(get_venda_table_name(d) for d in sorted(datas)) if t in existentes]
+    if not tabelas:
+        return {"produtos": [], "dias": {}}
+    produtos_sql = UNION_ALL.join(f"""
+            SELECT id_produto, data, SUM(quantidade), COUNT(*), MAX(id)
+            FROM {tabela}
+            WHERE data = ANY(%(datas)s)
+            GROUP BY 1, 2""" for tabela in tabelas)
+    dias_sql = UNION_ALL.join(f"""
+            SELECT data, MIN(id), MAX(id), COUNT(*)
+            FROM {tabela}
+            WHERE data = ANY(%(datas)s)
+            GROUP BY 1""" for tabela in tabelas)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(produtos_sql, {"datas": list(datas)})
+            produtos = cur.fetchall()
+            cur.execute(dias_sql, {"datas": list(datas)})
+            dias = {r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()}
+    return {"produtos": produtos, "dias": dias}
+
+def cached_dias_venda(datas):
+    """fetch_dias_venda com cache: dias fechados sem expiração, hoje por ttl_hoje"""
+    fechados = tuple(sorted(d for d in datas if d < date.today()))
+    abertos = tuple(sorted(d for d in datas if d >= date.today()))
+    partes = [result_cache.get_or_load(
+        ("dias_venda", grupo),
+        lambda grupo=grupo: fetch_dias_venda(grupo),
+        ttl=result_cache.ttl_for(grupo[-1]),
+        rows=lambda r: len(r["produtos"]) + len(r["dias"]),
+    ) for grupo in (fechados, abertos) if grupo]
+    return {
+        "produtos": [p for parte in partes for p in parte["produtos"]],
+        "dias": {d: v for parte in partes for d, v in parte["dias"].items()},
+    }
+
+@app.route('/vendas/ruptura/<data_consulta>/alertas')
+def get_alertas_ruptura(data_consulta):
+    """
+    Produtos com provável ruptura no dia: pararam de vender cedo demais ou
+    venderam bem abaixo do normal para o dia da semana.
+    Query: semanas (histórico do mesmo dia da semana, padrão 8)
+    """
+    try:
+        data_obj = datetime.strptime(data_consulta, "%Y-%m-%d").date()
+        semanas = int(request.args.get('semanas', RUPTURA_CONFIG["semanas"]))
+        if not 1 <= semanas <= RUPTURA_CONFIG["max_semanas"]:
+            return jsonify({"error": f"Histórico deve ter de 1 a {RUPTURA_CONFIG['max_semanas']} semanas"}), 400
+        
+        historico = [data_obj - timedelta(weeks=k) for k in range(1, semanas + 1)]
+        dados = cached_dias_venda([data_obj] + historico)
+        alertas, resumo = detect_stockouts(dados["produtos"], dados["dias"], data_obj, **{
+            k: RUPTURA_CONFIG[k] for k in ("limiar_parada", "fator_abaixo", "min_vendas_esperadas", "min_dias")
+        })
+        nomes = fetch_nomes_produtos([a["codigo"] for a in alertas])
+        for a in alertas:
+            a["nome"] = nomes.get(a["codigo"])
+        
+        return jsonify({
+            "data": data_obj.isoformat(),
+            "historico": sorted(d.isoformat() for d in historico if d in dados["dias"]),
+            **resumo,
+            "total_alertas": len(alertas),
+            "alertas": shaped(alertas),
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# PERFIS POR DIA DA SEMANA E MÊS (ver profiles.py)
+# ============================================
+
+PERFIL_CONFIG = {
+    "path": os.path.join(DATA_DIR, "perfis_vendas.db"),
+    "hour": 3,              # recalcula toda madrugada a partir desta hora
+    "check_interval": 600,  # segundos entre verificações
+    "min_month_days": 8,    # dias de um dia da semana num mês (~2 anos) para o perfil do mês
+}
+
+DIAS_SEMANA = ["seg", "ter", "qua", "qui", "sex", "sab", "dom"]
+
+# Fonte: o espelho local, depois da primeira sincronização deste processo
+perfis = ProfileStore(source=mirror.daily, ready=lambda: mirror.stats()["syncs"] > 0, **PERFIL_CONFIG)
+
+@app.route('/vendas/perfil')
+def get_vendas_perfil():
+    """
+    Perfil de venda por dia da semana (média, mediana, percentis 10/25/75/90)
+    Query: codigos=1,2,3 (sem codigos: todos os produtos com perfil),
+           mes=1-12 (opcional: perfil daquele mês onde há amostra, ver profiles.py)
+    """
+    try:
+        if not perfis.loaded:
+            return jsonify({"error": "Perfis ainda não calculados"}), 503
+        
+        codigos = parse_codigos(request.args['codigos'].split(',')) if request.args.get('codigos') else perfis.codigos()
+        mes = int(request.args['mes']) if request.args.get('mes') else None
+        if mes is not None and not 1 <= mes <= 12:
+            raise ValueError("mes deve ser de 1 a 12")
+        nomes = fetch_nomes_produtos(codigos)
+        produtos = []
+        for codigo in codigos:
+            perfil = perfis.get(codigo, mes)
+            produtos.append({
+                "codigo": codigo,
+                "nome": nomes.get(codigo),
+                "perfil": {DIAS_SEMANA[w]: valores for w, valores in perfil.items()} if perfil else None,
+            })
+        meta = perfis.meta
+        
+        return jsonify({
+            "gerado_em": meta.get("gerado_em"),
+            "periodo": {"inicio": meta.get("inicio") or None, "fim": meta.get("fim")},
+            "mes": mes,
+            "total_produtos": len(produtos),
+            "produtos": produtos,
+            "status": "ok"
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ============================================
+# LISTAS DE PRODUTOS SALVAS (watchlists)
+# ============================================
+
+WATCHLIST_CONFIG = {
+    "path": os.path.join(DATA_DIR, "watchlists.json"),
+    "results_path": os.path.join(DATA_DIR, "watchlists_resultados.db"),
+    "interval": 30,        # segundos entre recálculos (abaixo do ttl_hoje do cache)
+    "follow_interval": 5,  # segundos entre releituras dos resultados nos workers secundários
+    # Listas criadas na primeira execução: nome -> arquivo [{"code": ..., "name": ...}]
+    "seeds": {
+        "rotisseria": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ROTISSERIA_CODES.json"),
+    },
+}
+
+WATCHLIST_NAME_RE = re.compile(r'^[a-z0-9_-]{1,40}$')
+
+@contextmanager
+def file_lock(path):
+    """Lock exclusivo entre processos (os workers do serve.py) sobre o arquivo path"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK desiste depois de ~10 s: continua esperando
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class Watchlists:
+    """
+    Listas nomeadas de produtos guardadas no servidor (arquivo JSON).
+    O resultado do dia de cada lista (formato de /vendas/produtos/periodo) é
+    recalculado em segundo plano e guardado já codificado: a consulta só
+    devolve os bytes prontos, sem reprocessar a lista de códigos.
+    compute(nome, codigos) monta o corpo da resposta; o ETag é só desse corpo,
+    atualizado_em (hora do cálculo) entra depois, para não mudar o ETag a cada volta.
+    Se o arquivo muda (PUT/DELETE em outro worker do serve.py), as listas são relidas.
+    Alterações releem e gravam o arquivo sob um lock entre processos (path + ".lock").
+    Com results_path, os resultados também vão para um SQLite: no serve.py só o
+    worker principal recalcula (start) e os outros releem de lá (follow).
+    """
+
+    def __init__(self, path, compute, seeds=None, interval=30, results_path=None, follow_interval=5):
+        self.path = path
+        self.compute = compute
+        self.interval = interval
+        self.results_path = results_path
+        self.follow_interval = follow_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listas = {}      # nome -> [codigos]
+        self._resultados = {}  # nome -> (json em bytes, etag, dia, calculado_em)
+        self._refreshes = 0
+        self._last_error = None
+        self._mtime = None
+        with file_lock(path + ".lock"):
+            if os.path.exists(path):
+                self._load()
+            else:
+                for nome, arquivo in (seeds or {}).items():
+                    if os.path.exists(arquivo):
+                        with open(arquivo, encoding="utf-8") as f:
+                            itens = json.load(f)
+                        self._listas[nome] = parse_codigos([i["code"] if isinstance(i, dict) else i for i in itens])
+                self._save()
+        if results_path:
+            with self._db() as db:
+                db.execute("""CREATE TABLE IF NOT EXISTS resultado (
+                    nome TEXT PRIMARY KEY, lista TEXT NOT NULL, corpo BLOB NOT NULL,
+                    etag TEXT NOT NULL, dia TEXT NOT NULL, calculado_em REAL NOT NULL)""")
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.results_path, timeout=5)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _publish(self, nome, codigos, resultado):
+        """Grava o resultado para os outros workers (falha só fica em last_error)"""
+        if not self.results_path:
+            return
+        corpo, etag, dia, calculado_em = resultado
+        try:
+            with self._db() as db:
+                db.execute("INSERT OR REPLACE INTO resultado VALUES (?, ?, ?, ?, ?, ?)",
+                           (nome, json.dumps(codigos), corpo, etag, dia.isoformat(), calculado_em))
+        except sqlite3.Error as e:
+            self._last_error = f"{nome}: {e}"
+
+    def _load_results(self):
+        """Traz os resultados gravados por outro worker, se são de hoje, da lista atual e mais novos"""
+        with self._db() as db:
+            rows = db.execute("SELECT nome, lista, corpo, etag, dia, calculado_em FROM resultado").fetchall()
+        hoje = date.today()
+        with self._lock:
+            for nome, lista, corpo, etag, dia, calculado_em in rows:
+                atual = self._resultados.get(nome)
+                if (nome in self._listas and json.loads(lista) == self._listas[nome]
+                        and date.fromisoformat(dia) == hoje and (atual is None or atual[3] < calculado_em)):
+                    self._resultados[nome] = (bytes(corpo), etag, hoje, calculado_em)
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            self._listas = {nome: parse_codigos(codigos) for nome, codigos in json.load(f).items()}
+        self._mtime = mtime
+
+    def _save(self):
+        """Grava num temporário próprio deste processo e troca o arquivo de uma vez"""
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                   dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._listas, f, indent=2)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _check_file(self, force=False):
+        """Relê o arquivo se outro processo o alterou, ou sempre com force (chamar com o lock adquirido)"""
+        try:
+            if not force and os.stat(self.path).st_mtime_ns == self._mtime:
+                return
+            anteriores = self._listas
+            self._load()
+        except (OSError, ValueError):
+            return
+        for nome in list(self._resultados):
+            if self._listas.get(nome) != anteriores.get(nome):
+                del self._resultados[nome]
+
+    def names(self):
+        with self._lock:
+            self._check_file()
+            return {nome: len(codigos) for nome, codigos in self._listas.items()}
+
+    def codigos(self, nome):
+        with self._lock:
+            self._check_file()
+            return self._listas.get(nome)
+
+    def put(self, nome, codigos):
+        with self._lock, file_lock(self.path + ".lock"):
+            self._check_file(force=True)
+            self._listas[nome] = list(dict.fromkeys(codigos))
+            self._resultados.pop(nome, None)
+            self._save()
+
+    def delete(self, nome):
+        with self._lock, file_lock(self.path + ".lock"):
+            self._check_file(force=True)
+            existia = self._listas.pop(nome, None) is not None
+            self._resultados.pop(nome, None)
+            if existia:
+                self._save()
+        if existia and self.results_path:
+            with self._db() as db:
+                db.execute("DELETE FROM resultado WHERE nome = ?", (nome,))
+        return existia
+
+    def refresh(self, nome):
+        codigos = self.codigos(nome)
+        if codigos is None:
+            return None
+        dados = self.compute(nome, codigos)
+        etag = hashlib.sha1(app.json.dumps(dados).encode("utf-8")).hexdigest()[:20]
+        dados["atualizado_em"] = datetime.now().isoformat(timespec="seconds")
+        corpo = app.json.dumps(dados).encode("utf-8")
+        resultado = (corpo, etag, date.today(), time.time())
+        with self._lock:
+            atual = self._listas.get(nome) == codigos
+            if atual:
+                self._resultados[nome] = resultado
+        if atual:
+            self._publish(nome, codigos, resultado)
+        self._refreshes += 1
+        return resultado
+
+    def result(self, nome):
+        """(json em bytes, etag) do dia; calcula na hora se ainda não há resultado de hoje"""
+        with self._lock:
+            resultado = self._resultados.get(nome)
+        if resultado is None or resultado[2] != date.today():
+            resultado = self.refresh(nome)
+        return resultado
+
+    def _run(self):
+        while True:
+            for nome in list(self.names()):
+                try:
+                    self.refresh(nome)
+                    self._last_error = None
+                except Exception as e:
+                    # Mantém o último resultado bom; a próxima volta tenta de novo
+                    self._last_error = f"{nome}: {e}"
+            time.sleep(self.interval)
+
+    def start(self):
+        """Recalcula todas as listas a cada interval segundos"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="watchlists", daemon=True)
+            self._thread.start()
+
+    def _follow(self):
+        while True:
+            try:
+                self.names()  # relê o arquivo das listas se mudou
+                self._load_results()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+            time.sleep(self.follow_interval)
 
-# ============================================
-# ENDPOINTS
-# ============================================
+    def follow(self):
+        """Só relê os resultados que o worker principal grava (sem recalcular neste processo)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name="watchlists-follow", daemon=True)
+            self._thread.start()
 
-# Default home route moved to top
+    def stats(self):
+        with self._lock:
+            idades = [time.time() - r[3] for r in self._resultados.values()]
+            return {
+                "lists": len(self._listas),
+                "ready": len(self._resultados),
+                "refreshes": self._refreshes,
+                "oldest_age": round(max(idades), 1) if idades else None,
+                "last_error": self._last_error,
+            }
+
+def compute_watchlist(nome, codigos):
+    hoje = date.today()
+    vendas, tabelas = cached_vendas_periodo(codigos, hoje, hoje)
+    return {
+        "nome": nome,
+        "data_inicio": hoje.isoformat(),
+        "data_fim": hoje.isoformat(),
+        "produtos": montar_produtos_periodo(codigos, vendas),
+        "tabelas_consultadas": tabelas,
+        "status": "ok"
+    }
 
+watchlists = Watchlists(compute=compute_watchlist, **WATCHLIST_CONFIG)
 
-@app.route('/produto/<codigo>')
-def get_produto(codigo):
+@app.route('/vendas/watchlist')
+def list_watchlists():
+    return jsonify({"listas": watchlists.names(), "status": "ok"})
+
+@app.route('/vendas/watchlist/<nome>', methods=['GET'])
+def get_watchlist(nome):
+    """
+    Vendas de hoje dos produtos da lista, pré-calculadas em segundo plano
+    Query opcional: data_inicio, data_fim, formato=colunas (calculados na hora)
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(f"SELECT * FROM produto WHERE id = {codigo} LIMIT 1")
-        r = cur.fetchone()
-        conn.close()
-        return jsonify({"found": bool(r), "data": serialize_row(r)})
+        codigos = watchlists.codigos(nome)
+        if codigos is None:
+            return jsonify({"error": f"Lista {nome} não existe"}), 404
+        
+        if request.args.get('data_inicio') or request.args.get('data_fim') or response_shape() != "linhas":
+            hoje = date.today()
+            data_inicio = datetime.strptime(request.args['data_inicio'], "%Y-%m-%d").date() if request.args.get('data_inicio') else hoje
+            data_fim = datetime.strptime(request.args['data_fim'], "%Y-%m-%d").date() if request.args.get('data_fim') else hoje
+            vendas, tabelas = cached_vendas_periodo(codigos, data_inicio, data_fim)
+            return jsonify({
+                "nome": nome,
+                "data_inicio": data_inicio.isoformat(),
+                "data_fim": data_fim.isoformat(),
+                "produtos": shaped(montar_produtos_periodo(codigos, vendas)),
+                "tabelas_consultadas": tabelas,
+                "status": "ok"
+            })
+        
+        corpo, etag, _, _ = watchlists.result(nome)
+        if request.if_none_match.contains_weak(etag):
+            resposta = Response(status=304)
+        else:
+            resposta = Response(corpo, mimetype="application/json")
+        resposta.set_etag(etag, weak=True)
+        resposta.headers["Cache-Control"] = "no-cache"
+        return resposta
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/vendas/watchlist/<nome>', methods=['PUT'])
+def put_watchlist(nome):
+    """Cria ou substitui a lista. Body: {"codigos": [123, 456]}"""
+    try:
+        if not WATCHLIST_NAME_RE.match(nome):
+            return jsonify({"error": "Nome deve ter até 40 letras minúsculas, números, - ou _"}), 400
+        codigos = parse_codigos((request.get_json() or {}).get('codigos', []))
+        if not codigos:
+            return jsonify({"error": "Lista de códigos vazia"}), 400
+        watchlists.put(nome, codigos)
+        return jsonify({"nome": nome, "total_codigos": len(watchlists.codigos(nome)), "status": "ok"})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/vendas/watchlist/<nome>', methods=['DELETE'])
+def delete_watchlist(nome):
+    if not watchlists.delete(nome):
+        return jsonify({"error": f"Lista {nome} não existe"}), 404
+    return jsonify({"nome": nome, "status": "ok"})
+
 # ============================================
-# ENDPOINTS DE VENDAS - USANDO TABELA vendaMMYYYY
+# SÉRIES TEMPORAIS DENSAS
 # ============================================
 
-@app.route('/vendas/produto/<codigo>')
-def get_vendas_produto(codigo):
+GRANULARIDADES = {"dia": "dia", "day": "dia", "semana": "semana", "week": "semana", "mes": "mes", "month": "mes"}
+SERIE_MAX_CELLS = 1000000  # produtos x intervalos por requisição
+
+def series_axis(data_inicio, data_fim, granularidade):
+    """Início de cada intervalo (dia, semana começando na segunda, ou mês) que cobre o período"""
+    if granularidade == "mes":
+        return list(month_starts(data_inicio, data_fim))
+    if granularidade == "semana":
+        d, passo = data_inicio - timedelta(days=data_inicio.weekday()), timedelta(days=7)
+    else:
+        d, passo = data_inicio, timedelta(days=1)
+    eixo = []
+    while d <= data_fim:
+        eixo.append(d)
+        d += passo
+    return eixo
+
+def plan_serie_query(tabelas, granularidade):
+    """UNION ALL de um GROUP BY (produto, intervalo) por tabela vendaMMYYYY"""
+    bucket = {
+        "dia": "data",
+        "semana": "date_trunc('week', data)::date",
+        "mes": "date_trunc('month', data)::date",
+    }[granularidade]
+    partes = [f"""
+            SELECT id_produto, {bucket} AS inicio, SUM(quantidade) AS quantidade
+            FROM {tabela}
+            WHERE id_produto = ANY(%(codigos)s)
+            AND data >= %(inicio)s AND data <= %(fim)s
+            GROUP BY 1, 2""" for tabela in tabelas]
+    # Semanas que cruzam a virada do mês aparecem em duas tabelas: soma final no Postgres
+    return f"""
+        SELECT id_produto, inicio, SUM(quantidade) AS quantidade
+        FROM ({UNION_ALL.join(partes)}
+        ) parciais
+        GROUP BY 1, 2
     """
-    Retorna resumo de vendas para um produto usando tabela vendaMMYYYY:
-    - quantidade_hoje: total vendido hoje
-    - ultima_venda: data da última venda (tabela não tem hora exata)
-    - numero_vendas: quantidade de transações
+
+def fetch_vendas_serie(codigos, data_inicio, data_fim, granularidade, loja=None):
+    """
+    Séries densas: um eixo de datas compartilhado e, para cada produto,
+    uma lista de quantidades alinhada ao eixo e preenchida com zero.
+    """
+    loja = loja or LOJAS[LOJA_PADRAO]
+    eixo = series_axis(data_inicio, data_fim, granularidade)
+    tabelas = loja.catalog.tables_between(data_inicio, data_fim)
+    if loja.principal and mirror.covers(tabelas, data_fim):
+        rows = mirror.serie(codigos, data_inicio, data_fim, granularidade)
+    elif tabelas:
+        with loja.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(plan_serie_query(tabelas, granularidade), {
+                    "codigos": codigos,
+                    "inicio": data_inicio,
+                    "fim": data_fim,
+                })
+                rows = cur.fetchall()
+    else:
+        rows = []
+
+    # Montagem colunar: uma lista pré-alocada por produto, preenchida por posição
+    posicao = {d: i for i, d in enumerate(eixo)}
+    linha = {cod: i for i, cod in enumerate(codigos)}
+    quantidades = [[0.0] * len(eixo) for _ in codigos]
+    for cod, inicio, qtd in rows:
+        quantidades[linha[cod]][posicao[inicio]] = float(qtd or 0)
+    return {
+        "datas": [d.isoformat() for d in eixo],
+        "codigos": codigos,
+        "quantidades": quantidades,
+        "tabelas_consultadas": tabelas,
+    }
+
+def merge_series(series):
+    """Soma ponto a ponto séries de fetch_vendas_serie com o mesmo eixo e os mesmos códigos"""
+    quantidades = [[round(sum(pontos), 3) for pontos in zip(*linhas)]
+                   for linhas in zip(*(s["quantidades"] for s in series))]
+    return {"quantidades": quantidades,
+            "tabelas_consultadas": list(dict.fromkeys(t for s in series for t in s["tabelas_consultadas"]))}
+
+def fan_out_serie(codigos, data_inicio, data_fim, granularidade, lojas, celulas):
+    """Séries de cada loja (em paralelo) e somadas entre as lojas; eixo e códigos iguais em todas"""
+    resultados = fan_out(lojas, lambda loja: result_cache.get_or_load(
+        ("serie", loja.id, tuple(codigos), data_inicio, data_fim, granularidade),
+        lambda: fetch_vendas_serie(codigos, data_inicio, data_fim, granularidade, loja),
+        ttl=result_cache.ttl_for(data_fim),
+        rows=celulas,
+    ))
+    corpo = fan_out_response(
+        lojas, resultados,
+        lambda serie: {"quantidades": serie["quantidades"], "tabelas_consultadas": serie["tabelas_consultadas"]},
+        lambda series: merge_series(series) if series else {"quantidades": []},
+    )
+    nomes = fetch_nomes_produtos(codigos)
+    corpo = dict(data_inicio=data_inicio.isoformat(), data_fim=data_fim.isoformat(), granularidade=granularidade,
+                 datas=[d.isoformat() for d in series_axis(data_inicio, data_fim, granularidade)],
+                 codigos=codigos, nomes=[nomes.get(c) for c in codigos], **corpo)
+    return jsonify(corpo), 503 if corpo["status"] == "erro" else 200
+
+@app.route('/vendas/serie', methods=['POST'])
+def get_vendas_serie():
+    """
+    Séries temporais de vendas de vários produtos em formato colunar
+    Body: {
+        "codigos": [123, 456, 789],
+        "data_inicio": "2026-01-01",
+        "data_fim": "2026-03-31",
+        "granularidade": "dia" | "semana" | "mes",
+        "lojas": ["l1", "l2"] ou "todas" (opcional)
+    }
+    Resposta: "datas" (eixo compartilhado) e "quantidades" (uma lista por código, na ordem de "codigos")
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        data = request.get_json()
+        codigos = list(dict.fromkeys(parse_codigos(data.get('codigos', []))))
+        granularidade = GRANULARIDADES.get(data.get('granularidade', 'dia'))
+        
+        if not codigos:
+            return jsonify({"error": "Lista de códigos vazia"}), 400
+        if granularidade is None:
+            return jsonify({"error": "Granularidade deve ser dia, semana ou mes"}), 400
         
         hoje = date.today()
-        tabela = get_venda_table_name(hoje)
-        
-        # Buscar vendas do produto hoje
-        cur.execute(f"""
-            SELECT 
-                SUM(quantidade) as quantidade_total,
-                COUNT(*) as numero_vendas,
-                MAX(data) as ultima_venda
-            FROM {tabela}
-            WHERE id_produto = %s
-            AND data = %s
-        """, (codigo, hoje.isoformat()))
+        try:
+            data_fim = datetime.strptime(data['data_fim'], "%Y-%m-%d").date() if data.get('data_fim') else hoje
+            data_inicio = datetime.strptime(data['data_inicio'], "%Y-%m-%d").date() if data.get('data_inicio') else data_fim - timedelta(days=29)
+            lojas = data.get('lojas') or request.args.get('lojas')
+            lojas = parse_lojas(lojas) if lojas else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        result = cur.fetchone()
+        celulas = len(codigos) * len(series_axis(data_inicio, data_fim, granularidade))
+        if data_inicio > data_fim or celulas > SERIE_MAX_CELLS:
+            return jsonify({"error": f"Período inválido ou grande demais ({celulas} pontos, máximo {SERIE_MAX_CELLS})"}), 400
         
-        # Buscar nome do produto
-        cur.execute("SELECT id, descricaocompleta FROM produto WHERE id = %s LIMIT 1", (codigo,))
-        produto = cur.fetchone()
+        if lojas:
+            return fan_out_serie(codigos, data_inicio, data_fim, granularidade, lojas, celulas)
         
-        conn.close()
+        serie = result_cache.get_or_load(
+            ("serie", tuple(codigos), data_inicio, data_fim, granularidade),
+            lambda: fetch_vendas_serie(codigos, data_inicio, data_fim, granularidade),
+            ttl=result_cache.ttl_for(data_fim),
+            rows=celulas,
+        )
+        nomes = fetch_nomes_produtos(codigos)
         
         return jsonify({
-            "codigo": int(codigo),
-            "nome": produto['descricaocompleta'] if produto else None,
-            "data": hoje.isoformat(),
-            "quantidade_total": serialize_value(result['quantidade_total']) if result['quantidade_total'] else 0,
-            "numero_vendas": result['numero_vendas'] if result['numero_vendas'] else 0,
-            "ultima_venda": serialize_value(result['ultima_venda']) if result['ultima_venda'] else None,
-            "tabela": tabela,
+            "data_inicio": data_inicio.isoformat(),
+            "data_fim": data_fim.isoformat(),
+            "granularidade": granularidade,
+            "datas": serie["datas"],
+            "codigos": serie["codigos"],
+            "nomes": [nomes.get(c) for c in codigos],
+            "quantidades": serie["quantidades"],
+            "tabelas_consultadas": serie["tabelas_consultadas"],
             "status": "ok"
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/vendas/produto/<codigo>/historico')
-def get_vendas_historico(codigo):
+# ============================================
+# COMPARATIVO SEMANA A SEMANA
+# ============================================
+
+COMPARATIVO_MAX_SEMANAS = 12
+
+def plan_dias_query(tabelas):
+    """Vendas por (produto, data) só nas datas pedidas, UNION ALL das tabelas envolvidas"""
+    partes = [f"""
+            SELECT id_produto, data, SUM(quantidade) AS quantidade, COUNT(*) AS numero_vendas
+            FROM {tabela}
+            WHERE id_produto = ANY(%(codigos)s)
+            AND data = ANY(%(datas)s)
+            GROUP BY 1, 2""" for tabela in tabelas]
+    return UNION_ALL.join(partes)
+
+def fetch_vendas_dias(codigos, datas):
+    """{(id_produto, data): (quantidade, numero_vendas)} em uma consulta para todas as datas"""
+    existentes = venda_catalog.tables()
+    tabelas = [t for t in dict.fromkeys(get_venda_table_name(d) for d in sorted(datas)) if t in existentes]
+    if not tabelas:
+        return {}
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(plan_dias_query(tabelas), {"codigos": codigos, "datas": list(datas)})
+            return {(r[0], r[1]): (r[2], r[3]) for r in cur.fetchall()}
+
+def cached_vendas_dias(codigos, datas):
+    """fetch_vendas_dias com cache: datas fechadas sem expiração, hoje por ttl_hoje"""
+    vendas = {}
+    for grupo in (tuple(sorted(d for d in datas if d < date.today())),
+                  tuple(sorted(d for d in datas if d >= date.today()))):
+        if grupo:
+            vendas.update(result_cache.get_or_load(
+                ("dias", tuple(codigos), grupo),
+                lambda grupo=grupo: fetch_vendas_dias(codigos, grupo),
+                ttl=result_cache.ttl_for(grupo[-1]),
+            ))
+    return vendas
+
+@app.route('/vendas/comparativo', methods=['POST'])
+def get_vendas_comparativo():
     """
-    Retorna histórico de vendas dos últimos 7 dias
+    Um dia comparado com o mesmo dia da semana nas semanas anteriores
+    Body: {
+        "codigos": [123, 456, 789],
+        "data": "2026-01-27",   (dia âncora, padrão hoje)
+        "semanas": 4            (semanas anteriores, 1 a 12)
+    }
+    Resposta: "datas" (âncora primeiro) e, por código, quantidades alinhadas a "datas",
+    a média das semanas anteriores e a variação da âncora sobre essa média
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        hoje = date.today()
-        data_inicio = hoje - timedelta(days=7)
-        
-        # Pode precisar consultar 2 tabelas se cruzar meses
-        tabelas = set()
-        d = data_inicio
-        while d <= hoje:
-            tabelas.add(get_venda_table_name(d))
-            d += timedelta(days=1)
+        data = request.get_json()
+        codigos = list(dict.fromkeys(parse_codigos(data.get('codigos', []))))
+        if not codigos:
+            return jsonify({"error": "Lista de códigos vazia"}), 400
         
-        all_results = []
-        for tabela in tabelas:
-            try:
-                cur.execute(f"""
-                    SELECT 
-                        id_produto,
-                        quantidade,
-                        precovenda as valor,
-                        (quantidade * precovenda) as valortotal,
-                        data
-                    FROM {tabela}
-                    WHERE id_produto = %s
-                    AND data >= %s
-                    ORDER BY data DESC, id DESC
-                    LIMIT 100
-                """, (codigo, data_inicio.isoformat()))
-                all_results.extend(cur.fetchall())
-            except:
-                pass  # Tabela pode não existir
+        ancora = datetime.strptime(data['data'], "%Y-%m-%d").date() if data.get('data') else date.today()
+        semanas = int(data.get('semanas', 4))
+        if not 1 <= semanas <= COMPARATIVO_MAX_SEMANAS:
+            return jsonify({"error": f"Semanas deve ser de 1 a {COMPARATIVO_MAX_SEMANAS}"}), 400
         
-        # Buscar nome do produto
-        cur.execute("SELECT id, descricaocompleta FROM produto WHERE id = %s LIMIT 1", (codigo,))
-        produto = cur.fetchone()
+        datas = [ancora - timedelta(weeks=k) for k in range(semanas + 1)]
+        vendas = cached_vendas_dias(codigos, datas)
+        nomes = fetch_nomes_produtos(codigos)
         
-        conn.close()
+        quantidades, numero_vendas, medias, variacoes = [], [], [], []
+        for cod in codigos:
+            linha = [vendas.get((cod, d), (0, 0)) for d in datas]
+            qtds = [q or 0 for q, _ in linha]
+            anteriores = qtds[1:]
+            media = sum(anteriores) / len(anteriores)
+            quantidades.append(qtds)
+            numero_vendas.append([n for _, n in linha])
+            medias.append(round(media, 3))
+            variacoes.append(round(float(qtds[0]) / float(media) - 1, 4) if media else None)
         
         return jsonify({
-            "codigo": int(codigo),
-            "nome": produto['descricaocompleta'] if produto else None,
-            "periodo": {"inicio": data_inicio.isoformat(), "fim": hoje.isoformat()},
-            "vendas": [serialize_row(r) for r in all_results],
-            "total_registros": len(all_results),
+            "data": ancora.isoformat(),
+            "semanas": semanas,
+            "datas": [d.isoformat() for d in datas],
+            "codigos": codigos,
+            "nomes": [nomes.get(c) for c in codigos],
+            "quantidades": quantidades,
+            "numero_vendas": numero_vendas,
+            "media_anteriores": medias,
+            "variacao": variacoes,
             "status": "ok"
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/vendas/produtos', methods=['POST'])
-def get_vendas_produtos_batch():
+# ============================================
+# PREVISÃO DE PRODUÇÃO (ver forecast.py)
+# ============================================
+
+PREVISAO_CONFIG = {
+    "semanas": 8,        # semanas de histórico por padrão
+    "max_semanas": 52,
+    "max_dias": 14,      # dias previstos por requisição
+    "janela": 4,         # ocorrências do mesmo dia da semana na média móvel
+    "alpha": 0.3,        # suavização do nível (Holt)
+    "beta": 0.1,         # suavização da tendência (Holt)
+    "phi": 0.9,          # amortecimento da tendência por semana à frente
+    "peso_media": 0.5,   # peso da média móvel contra a suavização na sugestão
+    "margem": 0.1,       # margem de segurança sobre a previsão
+}
+
+@app.route('/previsao', methods=['POST'])
+def get_previsao():
     """
-    Consulta em lote para múltiplos produtos
-    Body: {"codigos": [123, 456, 789]}
+    Sugestão de produção por produto a partir do histórico de vendas
+    Body: {
+        "codigos": [123, 456, 789],
+        "data": "2026-01-27",   (primeiro dia previsto, padrão amanhã)
+        "dias": 1,              (quantos dias prever a partir de data)
+        "semanas": 8            (semanas de histórico, até ontem)
+    }
+    Só dias fechados entram no histórico: o cálculo fica em cache até a virada do dia.
     """
     try:
         data = request.get_json()
-        codigos = data.get('codigos', [])
-        
+        codigos = list(dict.fromkeys(parse_codigos(data.get('codigos', []))))
         if not codigos:
             return jsonify({"error": "Lista de códigos vazia"}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         hoje = date.today()
-        tabela = get_venda_table_name(hoje)
-        
-        # Buscar vendas de todos os produtos
-        placeholders = ','.join(['%s'] * len(codigos))
-        cur.execute(f"""
-            SELECT 
-                id_produto,
-                SUM(quantidade) as quantidade_total,
-                COUNT(*) as numero_vendas,
-                MAX(data) as ultima_venda
-            FROM {tabela}
-            WHERE id_produto IN ({placeholders})
-            AND data = %s
-            GROUP BY id_produto
-        """, (*codigos, hoje.isoformat()))
-        
-        results = cur.fetchall()
-        
-        # Buscar nomes dos produtos
-        cur.execute(f"SELECT id, descricaocompleta FROM produto WHERE id IN ({placeholders})", tuple(codigos))
-        produtos = {r['id']: r['descricaocompleta'] for r in cur.fetchall()}
+        primeiro = datetime.strptime(data['data'], "%Y-%m-%d").date() if data.get('data') else hoje + timedelta(days=1)
+        dias = int(data.get('dias', 1))
+        semanas = int(data.get('semanas', PREVISAO_CONFIG["semanas"]))
+        if primeiro < hoje or not 1 <= dias <= PREVISAO_CONFIG["max_dias"]:
+            return jsonify({"error": f"Previsão vai de hoje em diante, com 1 a {PREVISAO_CONFIG['max_dias']} dias"}), 400
+        if not 1 <= semanas <= PREVISAO_CONFIG["max_semanas"]:
+            return jsonify({"error": f"Histórico deve ter de 1 a {PREVISAO_CONFIG['max_semanas']} semanas"}), 400
         
-        conn.close()
+        fim = hoje - timedelta(days=1)
+        inicio = fim - timedelta(days=semanas * 7 - 1)
+        if len(codigos) * semanas * 7 > SERIE_MAX_CELLS:
+            return jsonify({"error": f"Produtos demais para {semanas} semanas de histórico"}), 400
+        datas = [primeiro + timedelta(days=i) for i in range(dias)]
         
-        # Montar resposta
-        vendas_dict = {r['id_produto']: serialize_row(r) for r in results}
+        serie = result_cache.get_or_load(
+            ("serie", tuple(codigos), inicio, fim, "dia"),
+            lambda: fetch_vendas_serie(codigos, inicio, fim, "dia"),
+            ttl=result_cache.ttl_for(fim),
+            rows=len(codigos) * semanas * 7,
+        )
+        eixo = [date.fromisoformat(d) for d in serie["datas"]]
+        previsoes = forecast(eixo, serie["quantidades"], datas, **{
+            k: PREVISAO_CONFIG[k] for k in ("janela", "alpha", "beta", "phi", "peso_media", "margem")
+        })
         
-        resposta = []
-        for codigo in codigos:
-            venda = vendas_dict.get(codigo, {})
-            resposta.append({
-                "codigo": codigo,
-                "nome": produtos.get(codigo),
-                "quantidade_total": venda.get('quantidade_total', 0),
-                "numero_vendas": venda.get('numero_vendas', 0),
-                "ultima_venda": venda.get('ultima_venda')
-            })
+        produtos = []
+        for codigo, p in zip(codigos, previsoes):
+            info = produto_index.get(codigo) or {}
+            if info.get("pesavel") is False:
+                # Produto por unidade: sugestão arredondada para cima
+                p["sugestao"] = [math.ceil(q) for q in p["sugestao"]]
+            produtos.append(dict(codigo=codigo, nome=info.get("descricaocompleta"), **p))
+        if not produto_index.loaded:
+            nomes = fetch_nomes_produtos(codigos)
+            for p in produtos:
+                p["nome"] = nomes.get(p["codigo"])
         
         return jsonify({
-            "data": hoje.isoformat(),
-            "produtos": resposta,
-            "tabela": tabela,
+            "datas": [d.isoformat() for d in datas],
+            "historico": {"data_inicio": inicio.isoformat(), "data_fim": fim.isoformat(), "semanas": semanas},
+            "produtos": shaped(produtos),
+            "tabelas_consultadas": serie["tabelas_consultadas"],
             "status": "ok"
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/vendas/ruptura/<data_consulta>')
-def get_vendas_ruptura(data_consulta):
+# ============================================
+# EXPORTAÇÃO EM MASSA VIA COPY
+# ============================================
+
+EXPORT_CONFIG = {
+    "chunk_size": 65536,  # bytes lidos do COPY por vez
+    "queue_chunks": 16,   # blocos em trânsito entre o banco e a resposta HTTP
+    "statement_timeout": 0,  # ms; o COPY anda no ritmo do cliente, então sem limite
+}
+
+class ExportCancelled(CallCancelled):
+    """Cliente desconectou no meio da exportação"""
+
+def copy_blocks(sql, params=None):
     """
-    Retorna todas as vendas de uma data específica
-    Formato da data: YYYY-MM-DD
+    Executa COPY ... TO STDOUT e entrega os blocos conforme chegam do banco.
+    O COPY roda em uma thread e escreve numa fila limitada: a memória do
+    servidor fica constante, qualquer que seja o tamanho da tabela.
     """
+    blocos = queue.Queue(maxsize=EXPORT_CONFIG["queue_chunks"])
+    cancelado = threading.Event()
+    fim = object()
+
+    class _Writer:
+        def write(self, data):
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            while True:
+                if cancelado.is_set():
+                    raise ExportCancelled()
+                try:
+                    blocos.put(data, timeout=1)
+                    return len(data)
+                except queue.Full:
+                    pass
+
+    conn = get_db_connection(statement_timeout=EXPORT_CONFIG["statement_timeout"])
+
+    def copiar():
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(cur.mogrify(sql, params).decode(), _Writer(), size=EXPORT_CONFIG["chunk_size"])
+            blocos.put(fim)
+        except Exception as e:
+            if not cancelado.is_set():
+                blocos.put(e)
+
+    worker = threading.Thread(target=copiar, name="copy-export", daemon=True)
+    worker.start()
+    completo = False
+    erro = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Parsear data para determinar tabela
-        data_obj = datetime.strptime(data_consulta, "%Y-%m-%d").date()
-        tabela = get_venda_table_name(data_obj)
-        
-        cur.execute(f"""
-            SELECT 
-                id_produto,
-                SUM(quantidade) as quantidade_total,
-                COUNT(*) as numero_vendas,
-                MAX(data) as ultima_venda,
-                MIN(data) as primeira_venda
-            FROM {tabela}
-            WHERE data = %s
-            GROUP BY id_produto
-            ORDER BY quantidade_total DESC
-        """, (data_consulta,))
-        
-        results = cur.fetchall()
-        
-        # Buscar nomes dos produtos
-        if results:
-            ids = [r['id_produto'] for r in results]
-            placeholders = ','.join(['%s'] * len(ids))
-            cur.execute(f"SELECT id, descricaocompleta FROM produto WHERE id IN ({placeholders})", tuple(ids))
-            produtos = {r['id']: r['descricaocompleta'] for r in cur.fetchall()}
+        while True:
+            item = blocos.get()
+            if item is fim:
+                completo = True
+                return
+            if isinstance(item, Exception):
+                erro = item
+                raise item
+            yield item
+    finally:
+        if not completo:
+            cancelado.set()
+            try:
+                conn.cancel()
+            except psycopg2.Error:
+                pass
+        worker.join()
+        if completo:
+            conn.close()
         else:
-            produtos = {}
+            # Falha do COPY conta para o disjuntor; cliente que desconectou, não
+            conn.discard(erro or ExportCancelled())
+
+def copy_to_stream(sql, params=None):
+    """
+    copy_blocks já com a conexão emprestada, o COPY iniciado e o primeiro bloco
+    lido: falha do ERP (disjuntor aberto, pool esgotado, erro na consulta)
+    sobe aqui, na rota, antes de o 200 ser enviado. Retorna o iterável do corpo.
+    """
+    blocos = copy_blocks(sql, params)
+    primeiro = next(blocos, None)
+    if primeiro is None:
+        return []
+
+    def stream():
+        try:
+            yield primeiro
+            yield from blocos
+        finally:
+            blocos.close()
+    return stream()
+
+@app.route('/vendas/exportar/<mes>')
+def get_vendas_exportar(mes):
+    """
+    Exporta as linhas de uma tabela vendaMMYYYY em streaming (COPY TO STDOUT)
+    mes: YYYY-MM
+    Query: formato=csv (padrão) | ndjson
+           data_inicio / data_fim (YYYY-MM-DD, opcional: fatia do mês)
+    """
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in ('csv', 'ndjson'):
+            return jsonify({"error": "Formato deve ser csv ou ndjson"}), 400
+        try:
+            inicio_mes = datetime.strptime(mes, "%Y-%m").date()
+            data_inicio = datetime.strptime(request.args['data_inicio'], "%Y-%m-%d").date() if request.args.get('data_inicio') else None
+            data_fim = datetime.strptime(request.args['data_fim'], "%Y-%m-%d").date() if request.args.get('data_fim') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        conn.close()
+        tabela = get_venda_table_name(inicio_mes)
+        if tabela not in venda_catalog.tables():
+            return jsonify({"error": f"Tabela {tabela} não existe"}), 404
         
-        resposta = []
-        for r in results:
-            resposta.append({
-                "codigo": r['id_produto'],
-                "nome": produtos.get(r['id_produto']),
-                "quantidade_total": serialize_value(r['quantidade_total']),
-                "numero_vendas": r['numero_vendas'],
-                "primeira_venda": serialize_value(r['primeira_venda']),
-                "ultima_venda": serialize_value(r['ultima_venda'])
-            })
+        filtros, params = [], {}
+        if data_inicio:
+            filtros.append("data >= %(inicio)s")
+            params["inicio"] = data_inicio
+        if data_fim:
+            filtros.append("data <= %(fim)s")
+            params["fim"] = data_fim
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
         
-        return jsonify({
-            "data": data_consulta,
-            "total_produtos": len(resposta),
-            "produtos": resposta,
-            "tabela": tabela,
-            "status": "ok"
+        if formato == 'csv':
+            sql = f"COPY (SELECT * FROM {tabela} {where} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER true)"
+            mimetype = 'text/csv'
+        else:
+            # Uma linha JSON por venda; QUOTE/DELIMITER que nunca aparecem impedem o COPY de escapar o JSON
+            sql = (f"COPY (SELECT row_to_json(v) FROM (SELECT * FROM {tabela} {where} ORDER BY id) v) "
+                   "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+            mimetype = 'application/x-ndjson'
+        
+        return Response(copy_to_stream(sql, params or None), mimetype=mimetype, headers={
+            "Content-Disposition": f"attachment; filename={tabela}{'_' + data_inicio.isoformat() if data_inicio else ''}.{formato}",
+            "X-Accel-Buffering": "no",
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/vendas/produtos/periodo', methods=['POST'])
-def get_vendas_produtos_periodo():
+# ============================================
+# FEED DE ALTERAÇÕES (MARCA D'ÁGUA POR id)
+# ============================================
+
+CHANGES_CONFIG = {
+    "janela": 2000,      # ids abaixo do topo em que uma lacuna ainda pode ser venda não confirmada
+    "max_buracos": 100,  # lacunas levadas na marca d'água; acima disso a resposta é um reset
+}
+
+def format_watermark(tabela, max_id, buracos=()):
+    """buracos=None: lacunas demais para levar na marca (a próxima consulta é um reset)"""
+    marca = f"{tabela}:{max_id}"
+    if buracos is None:
+        return f"{marca}:*"
+    return f"{marca}:{','.join(map(str, buracos))}" if buracos else marca
+
+def parse_watermark(valor):
     """
-    Consulta vendas de múltiplos produtos em um período de datas
-    Body: {
-        "codigos": [123, 456, 789],
-        "data_inicio": "2026-01-26",
-        "data_fim": "2026-01-28"
-    }
+    'venda102026:12345' ou 'venda102026:12345:12340,12342' -> ('venda102026', 12345, (12340, 12342));
+    'venda102026:12345:*' -> ('venda102026', 12345, None); None se não informado
     """
-    try:
-        data = request.get_json()
-        codigos = data.get('codigos', [])
-        data_inicio_str = data.get('data_inicio')
-        data_fim_str = data.get('data_fim')
-        
-        if not codigos:
-            return jsonify({"error": "Lista de códigos vazia"}), 400
-        
-        # Usar hoje como padrão se não especificado
-        hoje = date.today()
-        data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d").date() if data_inicio_str else hoje
-        data_fim = datetime.strptime(data_fim_str, "%Y-%m-%d").date() if data_fim_str else hoje
-        
-        conn = get_db_connection()
+    if not valor:
+        return None
+    partes = valor.split(':')
+    if len(partes) == 3 and partes[2] == "*":
+        buracos = None
+    else:
+        buracos = partes[2].split(',') if len(partes) == 3 and partes[2] else []
+        if not all(b.isdigit() for b in buracos):
+            raise ValueError(f"Marca d'água inválida: {valor}")
+        buracos = tuple(sorted(int(b) for b in buracos))
+    if len(partes) not in (2, 3) or not VENDA_TABLE_RE.match(partes[0]) or not partes[1].isdigit():
+        raise ValueError(f"Marca d'água inválida: {valor}")
+    return partes[0], int(partes[1]), buracos
+
+def pending_ids(buracos, inicio, ate, vistos):
+    """Ids ainda ausentes: os buracos anteriores mais (inicio, ate], menos os vistos no snapshot"""
+    return sorted(set(buracos).union(range(inicio + 1, ate + 1)) - vistos)
+
+def fetch_vendas_changes(since, codigos=None):
+    """
+    Deltas por produto e dia das linhas novas desde a marca d'água, na tabela do mês atual.
+    Sem marca (ou marca de outro mês) devolve os totais de hoje e reset=True.
+
+    Ids são gerados antes do commit: uma venda pode aparecer depois de outra de id
+    maior. Os ids ainda ausentes nos últimos `janela` abaixo do topo (buracos) vão
+    na marca e são procurados de novo na consulta seguinte, até aparecerem ou
+    saírem da janela (transação desfeita). Tudo é lido num único snapshot, então
+    cada linha entra em exatamente um delta.
+    Com mais de max_buracos lacunas, nenhuma é descartada: a resposta vira um
+    reset (totais de hoje no mesmo snapshot) e a marca sai com buracos=None,
+    que faz da consulta seguinte outro reset, até as lacunas caberem de novo.
+    Retorna (deltas, (tabela, novo_id, buracos), reset)
+    """
+    hoje = date.today()
+    tabela = get_venda_table_name(hoje)
+    reset = since is None or since[0] != tabela or since[2] is None
+    desde, buracos = (0, ()) if reset else (since[1], since[2])
+    with get_db_connection() as conn:
+        if tabela not in venda_catalog.tables(conn):
+            return [], (tabela, 0, ()), reset
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Determinar quais tabelas consultar (pode cruzar meses)
-        tabelas = set()
-        d = data_inicio
-        while d <= data_fim:
-            tabelas.add(get_venda_table_name(d))
-            d += timedelta(days=1)
-        
-        # Agregar resultados de todas as tabelas
-        vendas_agregadas = {}  # codigo -> {quantidade_total, numero_vendas, primeira_venda, ultima_venda}
-        
-        placeholders = ','.join(['%s'] * len(codigos))
-        
-        for tabela in tabelas:
+        cur.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        try:
+            # Limite superior fixo: linhas gravadas durante a consulta ficam para a próxima marca
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) AS max_id FROM {tabela}")
+            ate = max(cur.fetchone()['max_id'], desde)
+            piso = ate - CHANGES_CONFIG["janela"]
+            buracos = [b for b in buracos if b > piso]
+            if ate == desde and not buracos:
+                cur.execute("COMMIT")
+                return [], (tabela, desde, ()), reset
+            novas = "((id > %(desde)s AND id <= %(ate)s) OR id = ANY(%(buracos)s))"
+            params = {"desde": desde, "ate": ate, "buracos": buracos, "piso": max(piso, desde),
+                      "hoje": hoje, "codigos": codigos}
+            cur.execute(f"""
+                SELECT id FROM {tabela}
+                WHERE (id > %(piso)s AND id <= %(ate)s) OR id = ANY(%(buracos)s)
+            """, params)
+            vistos = {r['id'] for r in cur.fetchall()}
+            faltando = pending_ids(buracos, max(piso, desde), ate, vistos)
+            transbordou = len(faltando) > CHANGES_CONFIG["max_buracos"]
+            if transbordou:
+                reset = True
+            filtros = ["id <= %(ate)s", "data = %(hoje)s"] if reset else [novas]
+            if codigos:
+                filtros.append("id_produto = ANY(%(codigos)s)")
+            cur.execute(f"""
+                SELECT 
+                    id_produto,
+                    data,
+                    SUM(quantidade) as quantidade,
+                    COUNT(*) as numero_vendas
+                FROM {tabela}
+                WHERE {" AND ".join(filtros)}
+                GROUP BY id_produto, data
+                ORDER BY data, id_produto
+            """, params)
+            deltas = cur.fetchall()
+            cur.execute("COMMIT")
+        except Exception:
             try:
-                cur.execute(f"""
-                    SELECT 
-                        id_produto,
-                        SUM(quantidade) as quantidade_total,
-                        COUNT(*) as numero_vendas,
-                        MIN(data) as primeira_venda,
-                        MAX(data) as ultima_venda
-                    FROM {tabela}
-                    WHERE id_produto IN ({placeholders})
-                    AND data >= %s AND data <= %s
-                    GROUP BY id_produto
-                """, (*codigos, data_inicio.isoformat(), data_fim.isoformat()))
-                
-                for row in cur.fetchall():
-                    cod = row['id_produto']
-                    if cod not in vendas_agregadas:
-                        vendas_agregadas[cod] = {
-                            'quantidade_total': 0,
-                            'numero_vendas': 0,
-                            'primeira_venda': None,
-                            'ultima_venda': None
-                        }
-                    vendas_agregadas[cod]['quantidade_total'] += float(row['quantidade_total'] or 0)
-                    vendas_agregadas[cod]['numero_vendas'] += row['numero_vendas'] or 0
-                    if row['primeira_venda']:
-                        pv = vendas_agregadas[cod]['primeira_venda']
-                        if pv is None or row['primeira_venda'] < pv:
-                            vendas_agregadas[cod]['primeira_venda'] = row['primeira_venda']
-                    if row['ultima_venda']:
-                        uv = vendas_agregadas[cod]['ultima_venda']
-                        if uv is None or row['ultima_venda'] > uv:
-                            vendas_agregadas[cod]['ultima_venda'] = row['ultima_venda']
-            except Exception as e:
-                pass  # Tabela pode não existir
-        
-        # Buscar nomes dos produtos
-        cur.execute(f"SELECT id, descricaocompleta FROM produto WHERE id IN ({placeholders})", tuple(codigos))
-        produtos = {r['id']: r['descricaocompleta'] for r in cur.fetchall()}
-        
-        conn.close()
+                cur.execute("ROLLBACK")
+            except psycopg2.Error:
+                pass
+            raise
+    return deltas, (tabela, ate, None if transbordou else tuple(faltando)), reset
+
+@app.route('/vendas/changes')
+def get_vendas_changes():
+    """
+    Feed de alterações: só o que foi vendido desde a última consulta do cliente
+    Query: since=venda102026:12345 (marca devolvida na chamada anterior, repassar como veio; opcional)
+           codigos=123,456 (opcional)
+    Sem since, com marca de um mês anterior ou com vendas não confirmadas demais para
+    acompanhar (marca terminada em :*), devolve os totais de hoje com reset=true.
+    """
+    try:
+        try:
+            since = parse_watermark(request.args.get('since'))
+            codigos = parse_codigos(c for c in request.args.get('codigos', '').split(',') if c.strip())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Montar resposta
-        resposta = []
-        for codigo in codigos:
-            venda = vendas_agregadas.get(codigo, {})
-            resposta.append({
-                "codigo": codigo,
-                "nome": produtos.get(codigo),
-                "quantidade_total": venda.get('quantidade_total', 0),
-                "numero_vendas": venda.get('numero_vendas', 0),
-                "primeira_venda": serialize_value(venda.get('primeira_venda')) if venda.get('primeira_venda') else None,
-                "ultima_venda": serialize_value(venda.get('ultima_venda')) if venda.get('ultima_venda') else None
-            })
+        deltas, marca, reset = fetch_vendas_changes(since, codigos or None)
         
         return jsonify({
-            "data_inicio": data_inicio.isoformat(),
-            "data_fim": data_fim.isoformat(),
-            "produtos": resposta,
-            "tabelas_consultadas": list(tabelas),
+            "since": request.args.get('since'),
+            "watermark": format_watermark(*marca),
+            "reset": reset,
+            "tabela": marca[0],
+            "alteracoes": [{
+                "codigo": r['id_produto'],
+                "data": r['data'],
+                "quantidade": r['quantidade'],
+                "numero_vendas": r['numero_vendas']
+            } for r in deltas],
             "status": "ok"
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ============================================
+# STREAM DE VENDAS AO VIVO (SERVER-SENT EVENTS)
+# ============================================
+
+STREAM_CONFIG = {
+    "interval": 10,     # segundos entre leituras de vendas novas no ERP
+    "heartbeat": 15,    # segundos sem eventos antes de mandar um ping
+    "queue_size": 100,  # eventos pendentes por cliente antes de ressincronizar
+}
+
+def sse_event(evento, dados):
+    return f"event: {evento}\ndata: {app.json.dumps(dados)}\n\n"
+
+class SalesStream:
+    """
+    Um único poller lê as vendas novas do ERP (feed por marca d'água) e
+    distribui as atualizações para todos os clientes conectados.
+    A carga no banco não depende de quantas telas estão abertas.
+    """
+
+    class _Subscriber:
+        def __init__(self, codigos, queue_size):
+            self.codigos = set(codigos) if codigos else None
+            self.queue = queue.Queue(maxsize=queue_size)
+
+        def wants(self, codigo):
+            return self.codigos is None or codigo in self.codigos
+
+    def __init__(self, interval=10, heartbeat=15, queue_size=100):
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._watermark = None
+        self._dia = None
+        self._totais = {}  # codigo -> [quantidade, numero_vendas] de hoje
+        self._polls = 0
+        self._events = 0
+        self._resyncs = 0
+        self._last_error = None
+
+    def subscribe(self, codigos=None):
+        sub = self._Subscriber(codigos, self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self._dia is not None:
+                sub.queue.put_nowait(self._snapshot(sub))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sales-stream", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _snapshot(self, sub):
+        return sse_event("snapshot", {
+            "data": self._dia,
+            "watermark": format_watermark(*self._watermark),
+            "produtos": [{"codigo": cod, "quantidade_total": qtd, "numero_vendas": n}
+                         for cod, (qtd, n) in sorted(self._totais.items()) if sub.wants(cod)],
+        })
+
+    def _offer(self, sub, evento):
+        try:
+            sub.queue.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: descarta o atrasado e manda os totais atuais
+            while not sub.queue.empty():
+                try:
+                    sub.queue.get_nowait()
+                except queue.Empty:
+                    break
+            sub.queue.put_nowait(self._snapshot(sub))
+            self._resyncs += 1
+
+    def _poll(self):
+        hoje = date.today()
+        if self._dia != hoje:
+            # Virada do dia: recomeça pelos totais do novo dia
+            self._watermark = None
+        deltas, marca, reset = fetch_vendas_changes(self._watermark)
+        with self._lock:
+            self._watermark = marca
+            self._polls += 1
+            if reset:
+                self._dia = hoje
+                self._totais = {}
+            alterados = []
+            for r in deltas:
+                if r['data'] != hoje:
+                    continue
+                total = self._totais.setdefault(r['id_produto'], [0, 0])
+                total[0] += r['quantidade'] or 0
+                total[1] += r['numero_vendas']
+                alterados.append(r['id_produto'])
+            for sub in list(self._subscribers):
+                if reset:
+                    self._offer(sub, self._snapshot(sub))
+                    continue
+                produtos = [{
+                    "codigo": r['id_produto'],
+                    "data": r['data'],
+                    "quantidade": r['quantidade'],
+                    "numero_vendas": r['numero_vendas'],
+                    "quantidade_total": self._totais[r['id_produto']][0] if r['data'] == hoje else None,
+                } for r in deltas if sub.wants(r['id_produto'])]
+                if produtos:
+                    self._offer(sub, sse_event("vendas", {
+                        "watermark": format_watermark(*marca),
+                        "produtos": produtos,
+                    }))
+                    self._events += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self._poll()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                with self._lock:
+                    for sub in list(self._subscribers):
+                        self._offer(sub, sse_event("erro", {"error": str(e)}))
+            time.sleep(self.interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "running": self._thread is not None,
+                "watermark": format_watermark(*self._watermark) if self._watermark else None,
+                "polls": self._polls,
+                "events": self._events,
+                "resyncs": self._resyncs,
+                "last_error": self._last_error,
+            }
+
+sales_stream = SalesStream(**STREAM_CONFIG)
+
+@app.route('/vendas/stream')
+def get_vendas_stream():
+    """
+    Vendas ao vivo via Server-Sent Events
+    Query: codigos=123,456 (opcional, sem filtro recebe todos os produtos)
+    Eventos: snapshot (totais de hoje), vendas (novas vendas + total atualizado), erro
+    """
+    try:
+        codigos = parse_codigos(c for c in request.args.get('codigos', '').split(',') if c.strip())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def eventos(sub):
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    yield sub.queue.get(timeout=sales_stream.heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+        finally:
+            sales_stream.unsubscribe(sub)
+
+    return Response(eventos(sales_stream.subscribe(codigos)), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+def start_background_jobs():
+    """Tarefas em segundo plano do bridge (chamar uma vez por processo)"""
+    produto_index.start()
+    perfis.start()
+    watchlists.start()
+    mirror.start()
+
+# ============================================
+# WORKERS (serve.py)
+# ============================================
+
+SHARED_CACHE_CONFIG = {
+    "path": os.path.join(DATA_DIR, "cache_compartilhado.db"),
+    "max_entries": 20000,  # resultados mantidos no arquivo
+}
+
+def configure_worker(workers):
+    """
+    Prepara este processo para ser um de `workers` processos do serve.py
+    (chamar antes de atender): o limite de conexões de cada loja com o ERP é
+    dividido entre os processos e, com mais de um, o cache de resultados
+    ganha o nível compartilhado.
+    """
+    maxconn = max(1, POOL_CONFIG["maxconn"] // workers)
+    for loja in LOJAS.values():
+        loja.pool.maxconn = maxconn
+        loja.pool.minconn = min(loja.pool.minconn, maxconn)
+    if workers > 1:
+        result_cache.shared = SharedCache(**SHARED_CACHE_CONFIG)
+
+def start_follower_jobs():
+    """
+    Tarefas dos workers secundários do serve.py: o espelho, os perfis e as
+    listas são mantidos pelo worker principal (start_background_jobs) e aqui
+    só relidos do disco.
+    """
+    produto_index.start()
+    perfis.follow()
+    watchlists.follow()
+    mirror.follow()
+
+# Servidor de desenvolvimento; em produção: python serve.py
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5005)
+    try:
+        db_pool.warmup()
+    except Exception as e:
+        print(f"Aviso: ERP indisponível na inicialização ({e})")
+    start_background_jobs()
+    app.run(host='0.0.0.0', port=5005, threaded=True)
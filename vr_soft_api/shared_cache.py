@@ -0,0 +1,123 @@
+"""
+Segundo nível do cache de resultados, compartilhado entre processos.
+
+Com vários workers (serve.py) cada processo tem o próprio ResultCache em
+memória; este arquivo SQLite fica atrás deles: o resultado que um worker
+buscou no ERP serve aos outros sem uma nova consulta. Valores gravados com
+pickle, chave = sha1 do repr da chave do ResultCache (tuplas de str, int e
+date: o repr é estável entre processos). Expiração em tempo de relógio.
+"""
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    chave TEXT PRIMARY KEY,
+    valor BLOB NOT NULL,
+    expira_em REAL,
+    gravado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_gravado_em ON cache (gravado_em);
+"""
+
+class SharedCache:
+    """
+    get(key) -> (True, valor, ttl restante ou None) ou (False, None, None); put(key, valor, ttl).
+    Falhas do SQLite (arquivo travado, disco cheio) contam como miss: o cache em
+    memória e o ERP continuam respondendo.
+    """
+
+    def __init__(self, path, max_entries=20000, max_value_bytes=8 * 1024 * 1024, prune_every=200):
+        self.path = path
+        self.max_entries = max_entries          # entradas mantidas no arquivo
+        self.max_value_bytes = max_value_bytes  # resultados maiores ficam só em memória
+        self.prune_every = prune_every          # gravações entre limpezas
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._last_error = None
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")  # é só cache: perder as últimas gravações não importa
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _key(key):
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _failed(self, e):
+        with self._lock:
+            self._errors += 1
+            self._last_error = str(e)
+
+    def get(self, key):
+        try:
+            with self._db() as db:
+                row = db.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (self._key(key),)).fetchone()
+            agora = time.time()
+            if row is not None and (row[1] is None or row[1] > agora):
+                with self._lock:
+                    self._hits += 1
+                return True, pickle.loads(row[0]), (row[1] - agora if row[1] is not None else None)
+        except Exception as e:
+            self._failed(e)
+        with self._lock:
+            self._misses += 1
+        return False, None, None
+
+    def put(self, key, value, ttl=None):
+        try:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if len(blob) > self.max_value_bytes:
+                return
+            agora = time.time()
+            with self._db() as db:
+                db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                           (self._key(key), blob, agora + ttl if ttl is not None else None, agora))
+            with self._lock:
+                self._puts += 1
+                limpar = self._puts % self.prune_every == 0
+            if limpar:
+                self.prune()
+        except Exception as e:
+            self._failed(e)
+
+    def prune(self):
+        """Remove os vencidos e, acima de max_entries, os gravados há mais tempo"""
+        with self._db() as db:
+            db.execute("DELETE FROM cache WHERE expira_em IS NOT NULL AND expira_em <= ?", (time.time(),))
+            db.execute("""
+                DELETE FROM cache WHERE chave IN (
+                    SELECT chave FROM cache ORDER BY gravado_em DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self._db() as db:
+            db.execute("DELETE FROM cache")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "hits": self._hits,
+                "misses": self._misses,
+                "writes": self._puts,
+                "errors": self._errors,
+                "last_error": self._last_error,
+            }
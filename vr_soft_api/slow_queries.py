@@ -0,0 +1,159 @@
+"""
+Log de consultas lentas ao ERP, com o plano de execução de cada uma.
+
+Toda consulta acima de threshold segundos vira uma linha JSON num arquivo
+rotativo (SQL, parâmetros, duração, linhas, erro) e é somada por forma: a
+loja mais o texto do SQL sem os parâmetros. Na primeira ocorrência de cada
+forma o plano é capturado com EXPLAIN (ANALYZE OFF) na mesma conexão,
+logo após a consulta lenta; as ocorrências seguintes só somam.
+
+Dos planos saem as tabelas lidas por Seq Scan, que é o que interessa para
+mostrar quais tabelas vendaMMYYYY estão sem índice.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+VENDA_TABLE = re.compile(r"\bvenda\d{6}\b")
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+def seq_scans(plano):
+    """Tabelas lidas por Seq Scan num plano EXPLAIN (FORMAT JSON)"""
+    tabelas = set()
+    pendentes = [item["Plan"] for item in plano or [] if isinstance(item, dict) and "Plan" in item]
+    while pendentes:
+        no = pendentes.pop()
+        if no.get("Node Type") == "Seq Scan" and "Relation Name" in no:
+            tabelas.add(no["Relation Name"])
+        pendentes.extend(no.get("Plans", []))
+    return sorted(tabelas)
+
+class SlowQueryLog:
+    """
+    Consultas lentas no log rotativo e agregadas por forma em memória.
+    No máximo max_shapes formas: ao passar disso sai a de menor tempo total.
+    """
+
+    ORDENS = ("total", "max", "ocorrencias")
+
+    def __init__(self, path, threshold=1.0, max_bytes=5 * 1024 * 1024, backups=3,
+                 max_shapes=500, explain=True, ignore=()):
+        self.path = path
+        self.threshold = threshold  # segundos a partir dos quais a consulta é registrada
+        self.max_shapes = max_shapes
+        self.explain = explain      # captura o plano na primeira ocorrência de cada forma
+        self.ignore = set(ignore)   # tipos de consulta (query_label) que não entram no log
+        self._logger = logging.getLogger(f"slow_queries.{path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+        self._lock = threading.Lock()
+        self._shapes = {}  # forma -> agregado
+        self._logged = 0
+        self._plans = 0
+        self._evicted = 0
+
+    def _explain(self, conn, sql, params):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("EXPLAIN (ANALYZE OFF, FORMAT JSON) " + sql, params)
+                return cur.fetchone()[0]
+        except Exception as e:
+            return {"erro": str(e)}
+
+    def observe(self, loja, label, sql, params, segundos, linhas, erro, conn=None):
+        """Chamado após cada consulta; ignora as rápidas e os tipos em ignore"""
+        if segundos < self.threshold or label in self.ignore:
+            return
+        texto = " ".join(sql.split())
+        forma = hashlib.sha1(f"{loja}\n{texto}".encode()).hexdigest()[:12]
+        agora = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            item = self._shapes.get(forma)
+            nova = item is None
+            if nova:
+                if len(self._shapes) >= self.max_shapes:
+                    del self._shapes[min(self._shapes, key=lambda f: self._shapes[f]["total"])]
+                    self._evicted += 1
+                item = self._shapes[forma] = {
+                    "forma": forma, "loja": loja, "tipo": label, "sql": texto,
+                    "tabelas": sorted(set(VENDA_TABLE.findall(texto))),
+                    "ocorrencias": 0, "erros": 0, "total": 0.0, "max": 0.0, "linhas_max": 0,
+                    "ultimos_params": None, "ultima_em": None, "plano": None, "seq_scans": [],
+                }
+            item["ocorrencias"] += 1
+            item["total"] += segundos
+            item["max"] = max(item["max"], segundos)
+            item["linhas_max"] = max(item["linhas_max"], linhas or 0)
+            item["ultimos_params"] = params
+            item["ultima_em"] = agora
+            if erro is not None:
+                item["erros"] += 1
+            self._logged += 1
+
+        plano = None
+        if nova and self.explain and conn is not None and not conn.closed and EXPLAINABLE.match(texto):
+            plano = self._explain(conn, sql, params)
+            with self._lock:
+                item["plano"] = plano
+                item["seq_scans"] = seq_scans(plano) if isinstance(plano, list) else []
+                self._plans += 1
+
+        registro = {
+            "em": agora, "loja": loja, "forma": forma, "tipo": label,
+            "duracao_ms": round(segundos * 1000, 1), "linhas": linhas,
+            "erro": str(erro) if erro is not None else None,
+            "tabelas": item["tabelas"], "sql": texto, "params": params,
+        }
+        if plano is not None:
+            registro["plano"] = plano
+        try:
+            self._logger.info(json.dumps(registro, default=str, ensure_ascii=False))
+        except Exception as e:
+            print(f"Consultas lentas: falha ao gravar o log ({e})")
+
+    def _public(self, item):
+        saida = {k: v for k, v in item.items() if k not in ("total", "max")}
+        saida["total_ms"] = round(item["total"] * 1000, 1)
+        saida["max_ms"] = round(item["max"] * 1000, 1)
+        saida["media_ms"] = round(item["total"] * 1000 / item["ocorrencias"], 1)
+        return saida
+
+    def worst(self, limite=20, ordem="total"):
+        """As formas com maior tempo total, maior duração ou mais ocorrências"""
+        if ordem not in self.ORDENS:
+            raise ValueError(f"ordem deve ser uma de: {', '.join(self.ORDENS)}")
+        with self._lock:
+            itens = sorted(self._shapes.values(), key=lambda i: i[ordem], reverse=True)[:limite]
+            return [self._public(i) for i in itens]
+
+    def tables(self):
+        """{(loja, tabela): {consultas, total_ms, seq_scan}} das tabelas vendaMMYYYY nas formas lentas"""
+        saida = {}
+        with self._lock:
+            for item in self._shapes.values():
+                for tabela in item["tabelas"]:
+                    t = saida.setdefault((item["loja"], tabela), {"consultas": 0, "total_ms": 0.0, "seq_scan": False})
+                    t["consultas"] += item["ocorrencias"]
+                    t["total_ms"] = round(t["total_ms"] + item["total"] * 1000, 1)
+                    t["seq_scan"] = t["seq_scan"] or tabela in item["seq_scans"]
+        return saida
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "shapes": len(self._shapes),
+                "logged": self._logged,
+                "plans": self._plans,
+                "evicted": self._evicted,
+                "path": self.path,
+            }
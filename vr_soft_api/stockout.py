@@ -0,0 +1,79 @@
+"""
+Detector de ruptura: produtos que pararam de vender cedo demais no dia ou
+que venderam bem abaixo do normal para aquele dia da semana.
+
+As tabelas vendaMMYYYY não têm hora, então o "relógio" do dia é o próprio
+movimento da loja: o id das linhas cresce a cada item vendido. Do histórico
+do mesmo dia da semana sai a taxa de cada produto por linha vendida na loja;
+o silêncio de um produto é quantas linhas a loja vendeu depois da última
+venda dele. Com taxa e silêncio, o número de vendas que eram esperadas no
+silêncio (lambda) dá a chance de o produto ter simplesmente ficado sem
+venda por acaso: exp(-lambda). Lambda alto = provavelmente acabou.
+
+Todos os produtos são avaliados numa passada só sobre os agregados do dia.
+"""
+import math
+
+def detect(produtos, dias, data_alvo, limiar_parada=3.0, fator_abaixo=0.5,
+           min_vendas_esperadas=4, min_dias=3):
+    """
+    produtos: [(id_produto, data, quantidade, vendas, ultimo_id)] do dia alvo e dos dias do histórico
+    dias: {data: (menor_id, maior_id, linhas)} da loja nesses mesmos dias
+    Retorna (alertas, resumo); alertas do mais para o menos provável.
+    """
+    historico = [d for d in dias if d != data_alvo]
+    linhas_historico = sum(dias[d][2] for d in historico)
+    resumo = {
+        "dias_historico": len(historico),
+        "linhas_dia": 0,
+        "linhas_media_historico": round(linhas_historico / len(historico), 1) if historico else None,
+        "progresso_dia": None,
+        "produtos_analisados": 0,
+    }
+    if data_alvo not in dias or not linhas_historico:
+        return [], resumo
+    menor_id, maior_id, linhas_dia = dias[data_alvo]
+    linhas_por_id = linhas_dia / max(1, maior_id - menor_id + 1)
+    resumo["linhas_dia"] = linhas_dia
+    resumo["progresso_dia"] = round(linhas_dia / (linhas_historico / len(historico)), 3)
+
+    # Acumula histórico (quantidade, vendas, dias com venda) e o dia alvo em uma passada
+    soma = {}
+    hoje = {}
+    for cod, data, quantidade, vendas, ultimo_id in produtos:
+        if data == data_alvo:
+            hoje[cod] = (float(quantidade or 0), vendas, ultimo_id)
+            continue
+        q, n, k = soma.get(cod, (0.0, 0, 0))
+        soma[cod] = (q + float(quantidade or 0), n + vendas, k + 1)
+
+    alertas = []
+    for cod, (soma_q, soma_n, dias_com_venda) in soma.items():
+        if dias_com_venda < min_dias:
+            continue
+        resumo["produtos_analisados"] += 1
+        taxa = soma_n / linhas_historico
+        esperado_qtd = soma_q / linhas_historico * linhas_dia
+        esperado_vendas = taxa * linhas_dia
+        quantidade, _, ultimo_id = hoje.get(cod, (0.0, 0, None))
+        silencio = linhas_dia if ultimo_id is None else (maior_id - ultimo_id) * linhas_por_id
+        lam = taxa * silencio
+
+        if lam >= limiar_parada:
+            motivo = "sem_venda" if ultimo_id is None else "parou_cedo"
+        elif esperado_vendas >= min_vendas_esperadas and quantidade < fator_abaixo * esperado_qtd:
+            motivo = "abaixo_esperado"
+        else:
+            continue
+        alertas.append({
+            "codigo": cod,
+            "motivo": motivo,
+            "quantidade": round(quantidade, 3),
+            "quantidade_esperada": round(esperado_qtd, 3),
+            "vendas_esperadas_no_silencio": round(lam, 2),
+            "probabilidade": round(1 - math.exp(-lam), 3),
+            "ultima_venda_fracao": (round((ultimo_id - menor_id) / max(1, maior_id - menor_id), 3)
+                                    if ultimo_id is not None else None),
+        })
+    alertas.sort(key=lambda a: (a["vendas_esperadas_no_silencio"], a["quantidade_esperada"]), reverse=True)
+    return alertas, resumo
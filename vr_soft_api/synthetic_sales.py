@@ -0,0 +1,381 @@
+"""
+Gerador de vendas sintéticas no formato do VR, calibrado pelo histórico real.
+
+Calibração (SALES_HISTORY_30DAYS.json e ROTISSERIA_CODES.json, na raiz):
+para cada produto real, linhas por dia enquanto está à venda (numero_vendas
+sobre os dias entre a primeira e a última venda), quantidade média por linha,
+fração da janela em que esteve à venda e se é pesável. Os produtos reais
+entram no catálogo com os próprios códigos e nomes; os demais são sorteados
+desses perfis, com variação, até completar o número pedido de produtos.
+
+Síntese, dia a dia:
+- sazonalidade por dia da semana e por mês;
+- cada produto alterna períodos à venda e fora de linha (cadeia de dois
+  estados com a fração calibrada);
+- promoções de alguns dias multiplicam o volume e baixam o preço;
+- rupturas cortam as vendas de um produto a partir de um ponto do dia;
+- os ids crescem ao longo do dia, como no ERP (o detector de ruptura usa
+  o id como relógio).
+As taxas são escaladas para que um dia típico tenha linhas_dia linhas.
+
+Cada mês é gerado num processo à parte, com semente derivada de (seed,
+tabela): o resultado é o mesmo com qualquer número de processos. Destino:
+COPY direto num Postgres ou arquivos no formato texto do COPY, com um
+carregar.sql para o psql.
+
+Uso avulso:
+    python synthetic_sales.py --port 55432 --database vr_bench --meses 24
+    python synthetic_sales.py --pasta C:\\bench\\dados --meses 6 --linhas-dia 100000
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+import psycopg2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(BASE_DIR, "..", "SALES_HISTORY_30DAYS.json")
+CODES_FILE = os.path.join(BASE_DIR, "..", "ROTISSERIA_CODES.json")
+
+WEEKDAY_FACTOR = (0.95, 0.9, 0.95, 1.0, 1.15, 1.35, 0.8)  # segunda..domingo
+MONTH_FACTOR = (0.9, 0.9, 0.95, 1.0, 1.0, 0.95, 1.0, 1.0, 0.95, 1.0, 1.05, 1.3)  # janeiro..dezembro
+
+PRODUTO_DDL = """
+CREATE TABLE produto (
+    id integer PRIMARY KEY,
+    descricaocompleta varchar(60),
+    descricaoreduzida varchar(30),
+    id_tipoembalagem integer,
+    pesavel boolean
+)"""
+
+VENDA_DDL = """
+CREATE TABLE {tabela} (
+    id serial PRIMARY KEY,
+    id_loja integer NOT NULL DEFAULT 1,
+    id_produto integer NOT NULL,
+    data date NOT NULL,
+    quantidade numeric(12,3) NOT NULL,
+    precovenda numeric(12,2) NOT NULL
+)"""
+
+VENDA_COLUMNS = "(id, id_produto, data, quantidade, precovenda)"
+
+# ============================================
+# CALIBRAÇÃO
+# ============================================
+
+def month_range(meses, ate):
+    """(primeiro dia, último dia) dos últimos `meses` meses terminando em ate (o último mês vai até ate)"""
+    inicio = ate.replace(day=1)
+    for _ in range(meses - 1):
+        inicio = (inicio - timedelta(days=1)).replace(day=1)
+    d = inicio
+    while d <= ate:
+        proximo = (d + timedelta(days=32)).replace(day=1)
+        yield d, min(proximo - timedelta(days=1), ate)
+        d = proximo
+
+def load_profiles(history_file=HISTORY_FILE, codes_file=CODES_FILE):
+    """
+    Perfis dos produtos reais: [{codigo, nome, pesavel, taxa, quantidade, disponibilidade}]
+    taxa = linhas por dia à venda; quantidade = média por linha; disponibilidade = fração da janela à venda
+    """
+    with open(history_file, encoding="utf-8") as f:
+        historico = json.load(f)
+    janela = (date.fromisoformat(historico["data_fim"]) - date.fromisoformat(historico["data_inicio"])).days + 1
+    perfis = {}
+    for p in historico["produtos"]:
+        nome = " ".join(p["nome"].split())
+        n = p["numero_vendas"]
+        total = float(p["quantidade_total"] or 0)
+        pesavel = "KG" in nome.split() or total != int(total)
+        if n:
+            dias = (date.fromisoformat(p["ultima_venda"]) - date.fromisoformat(p["primeira_venda"])).days + 1
+            perfil = {"taxa": n / dias, "quantidade": total / n, "disponibilidade": min(1.0, dias / janela)}
+        else:
+            perfil = {"taxa": 0.0, "quantidade": 1.0, "disponibilidade": 0.0}
+        perfis[int(p["codigo"])] = dict(perfil, codigo=int(p["codigo"]), nome=nome, pesavel=pesavel)
+
+    # Códigos da rotisseria sem histórico herdam o perfil de um produto com venda
+    if codes_file and os.path.exists(codes_file):
+        with open(codes_file, encoding="utf-8") as f:
+            codigos = json.load(f)
+        com_venda = [p for p in perfis.values() if p["taxa"]]
+        rng = random.Random("rotisseria")
+        for item in codigos:
+            cod = int(item["code"])
+            if cod not in perfis and com_venda:
+                nome = " ".join(item["name"].split())
+                perfis[cod] = dict(rng.choice(com_venda), codigo=cod, nome=nome, pesavel="KG" in nome.split())
+    return sorted(perfis.values(), key=lambda p: p["codigo"])
+
+def build_catalog(perfis, n, rng):
+    """
+    Os produtos reais mais sintéticos sorteados dos perfis reais (com variação), até n itens.
+    Retorna [(codigo, nome, pesavel, taxa, quantidade, disponibilidade, preco)]
+    """
+    catalogo = []
+    for p in perfis:
+        catalogo.append((p["codigo"], p["nome"], p["pesavel"], p["taxa"], p["quantidade"],
+                         p["disponibilidade"], _preco(p["pesavel"], rng)))
+    reais = {p["codigo"] for p in perfis}
+    codigo = 0
+    while len(catalogo) < n:
+        codigo += 1
+        if codigo in reais:
+            continue
+        base = rng.choice(perfis)
+        taxa = base["taxa"] * rng.lognormvariate(0, 0.4)
+        quantidade = max(0.05, base["quantidade"] * rng.lognormvariate(0, 0.25))
+        disponibilidade = min(1.0, max(0.0, base["disponibilidade"] + rng.uniform(-0.1, 0.1)))
+        nome = f"{base['nome'][:48]} S{codigo}"
+        catalogo.append((codigo, nome, base["pesavel"], taxa, quantidade, disponibilidade,
+                         _preco(base["pesavel"], rng)))
+    return catalogo
+
+def _preco(pesavel, rng):
+    return round(rng.uniform(20, 90) if pesavel else rng.uniform(2, 40), 2)
+
+# ============================================
+# EVENTOS (disponibilidade e promoções)
+# ============================================
+
+def schedule(catalogo, inicio, fim, rng, fora_media=7, promocao_intervalo=60):
+    """
+    Mudanças de estado por dia: {data: [(indice_produto, "ativo", bool) ou ("promo", (mult, desconto) ou None)]}
+    e o estado inicial (ativos, promos). Períodos fora de linha duram em média fora_media dias;
+    cada produto entra em promoção em média a cada promocao_intervalo dias.
+    """
+    eventos = {}
+    ativos, promos = [], [None] * len(catalogo)
+    horizonte = (fim - inicio).days + 1
+    for i, (_, _, _, taxa, _, disponibilidade, _) in enumerate(catalogo):
+        if not taxa or not disponibilidade:
+            ativos.append(False)
+            continue
+        # Dois estados com média fora_media dias fora e a fração calibrada de dias à venda
+        sempre = disponibilidade >= 0.97
+        media_on = fora_media * disponibilidade / (1 - disponibilidade) if not sempre else None
+        ativo = sempre or rng.random() < disponibilidade
+        ativos.append(ativo)
+        if not sempre:
+            dia = 0
+            while True:
+                dia += max(1, round(rng.expovariate(1 / (media_on if ativo else fora_media))))
+                if dia >= horizonte:
+                    break
+                ativo = not ativo
+                eventos.setdefault(inicio + timedelta(days=dia), []).append((i, "ativo", ativo))
+        dia = 0
+        while True:
+            dia += max(1, round(rng.expovariate(1 / promocao_intervalo)))
+            if dia >= horizonte:
+                break
+            duracao = rng.randint(3, 7)
+            promo = (round(rng.uniform(1.5, 3.0), 2), round(rng.uniform(0.1, 0.3), 2))
+            eventos.setdefault(inicio + timedelta(days=dia), []).append((i, "promo", promo))
+            if dia + duracao < horizonte:
+                eventos.setdefault(inicio + timedelta(days=dia + duracao), []).append((i, "promo", None))
+            dia += duracao
+    return eventos, ativos, promos
+
+def apply_events(eventos, ativos, promos):
+    for i, campo, valor in eventos:
+        if campo == "ativo":
+            ativos[i] = valor
+        else:
+            promos[i] = valor
+
+# ============================================
+# GERAÇÃO DE UM MÊS
+# ============================================
+
+def generate_days(tarefa):
+    """
+    Linhas de um mês no formato texto do COPY, um bloco por dia: (data, texto, linhas)
+    """
+    (tabela, inicio, fim, catalogo, ativos, promos, eventos, escala, seed, ruptura) = tarefa
+    rng = random.Random(f"{seed}:{tabela}")
+    ativos, promos = list(ativos), list(promos)
+    taxas = [taxa * escala for _, _, _, taxa, _, _, _ in catalogo]
+    quantidades = [c[4] for c in catalogo]
+    pesaveis = [c[2] for c in catalogo]
+    proximo_id = 1
+    d = inicio
+    while d <= fim:
+        apply_events(eventos.get(d, ()), ativos, promos)
+        pesos = [t * (promos[i][0] if promos[i] else 1) if ativos[i] else 0.0 for i, t in enumerate(taxas)]
+        acumulado = list(accumulate(pesos))
+        esperado = acumulado[-1] * WEEKDAY_FACTOR[d.weekday()] * MONTH_FACTOR[d.month - 1] if acumulado else 0
+        n = max(0, round(rng.gauss(esperado, math.sqrt(esperado)))) if esperado else 0
+        # Rupturas do dia: produto para de vender a partir de uma fração do movimento
+        k = min(len(catalogo), max(0, round(rng.gauss(len(catalogo) * ruptura, math.sqrt(len(catalogo) * ruptura)))))
+        corte = {i: rng.uniform(0.2, 0.9) * n for i in rng.sample(range(len(catalogo)), k)}
+
+        # Partes fixas da linha no dia: "codigo\tdata\t" e o preço (com desconto se em promoção)
+        dia = d.isoformat()
+        prefixos = [f"{c[0]}\t{dia}\t" for c in catalogo]
+        precos = [round(c[6] * (1 - promos[i][1]), 2) if promos[i] else c[6] for i, c in enumerate(catalogo)]
+        partes = []
+        escrever = partes.append
+        aleatorio = rng.random
+        for j, i in enumerate(rng.choices(range(len(catalogo)), cum_weights=acumulado, k=n) if n else ()):
+            limite = corte.get(i)
+            if limite is not None and j > limite:
+                continue
+            q = quantidades[i] * (0.5 + aleatorio())
+            if pesaveis[i]:
+                escrever(f"{proximo_id}\t{prefixos[i]}{q:.3f}\t{precos[i]}\n")
+            else:
+                escrever(f"{proximo_id}\t{prefixos[i]}{max(1, round(q))}\t{precos[i]}\n")
+            proximo_id += 1
+        linhas = len(partes)
+        yield d, "".join(partes), linhas
+        d += timedelta(days=1)
+
+def load_month(tarefa, db=None, pasta=None, indice=False):
+    """Gera um mês e grava no Postgres (COPY) ou em pasta/<tabela>.tsv. Retorna (tabela, linhas, segundos)"""
+    tabela = tarefa[0]
+    inicio = time.monotonic()
+    total = 0
+    if db is not None:
+        conn = psycopg2.connect(**db)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for _, texto, linhas in generate_days(tarefa):
+                    if linhas:
+                        cur.copy_expert(f"COPY {tabela} {VENDA_COLUMNS} FROM STDIN", io.StringIO(texto))
+                    total += linhas
+                cur.execute(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), GREATEST(%s, 1))", (total,))
+                if indice:
+                    cur.execute(f"CREATE INDEX {tabela}_data_produto ON {tabela} (data, id_produto)")
+                cur.execute(f"ANALYZE {tabela}")
+        finally:
+            conn.close()
+    else:
+        with open(os.path.join(pasta, f"{tabela}.tsv"), "w", encoding="utf-8", newline="\n") as f:
+            for _, texto, linhas in generate_days(tarefa):
+                f.write(texto)
+                total += linhas
+    return tabela, total, time.monotonic() - inicio
+
+def _load_month(args):
+    return load_month(*args)
+
+# ============================================
+# ORQUESTRAÇÃO
+# ============================================
+
+def generate(db=None, pasta=None, meses=24, ate=None, produtos=20000, linhas_dia=40000, seed=1,
+             processos=None, indice=False, ruptura=0.02, history_file=HISTORY_FILE, codes_file=CODES_FILE,
+             log=print):
+    """
+    Gera produto e as tabelas vendaMMYYYY dos últimos `meses` meses até `ate` (hoje).
+    db: dsn do Postgres de destino (tabelas recriadas); ou pasta: arquivos .tsv + carregar.sql.
+    Retorna o total de linhas de venda.
+    """
+    if (db is None) == (pasta is None):
+        raise ValueError("Informe db ou pasta")
+    ate = ate or date.today()
+    rng = random.Random(seed)
+    catalogo = build_catalog(load_profiles(history_file, codes_file), produtos, rng)
+    periodos = list(month_range(meses, ate))
+    eventos, ativos, promos = schedule(catalogo, periodos[0][0], ate, rng)
+
+    # Taxas escaladas para que um dia típico (fator 1) tenha linhas_dia linhas
+    disponivel = sum(c[3] * c[5] for c in catalogo)
+    escala = linhas_dia / disponivel if disponivel else 1.0
+    log(f"{len(catalogo)} produtos, escala {escala:.1f}x sobre as taxas do histórico")
+
+    # Estado de disponibilidade e promoções no início de cada mês (os meses são gerados em paralelo)
+    tarefas = []
+    d = periodos[0][0]
+    for inicio, fim in periodos:
+        while d < inicio:
+            apply_events(eventos.get(d, ()), ativos, promos)
+            d += timedelta(days=1)
+        eventos_mes = {dia: eventos[dia] for dia in eventos if inicio <= dia <= fim}
+        tabela = f"venda{inicio.month:02d}{inicio.year}"
+        tarefas.append((tabela, inicio, fim, catalogo, list(ativos), list(promos), eventos_mes, escala, seed, ruptura))
+
+    inicio_total = time.monotonic()
+    if db is not None:
+        conn = psycopg2.connect(**db)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS produto")
+                cur.execute(PRODUTO_DDL)
+                cur.copy_expert("COPY produto FROM STDIN", io.StringIO(produto_rows(catalogo)))
+                for t in tarefas:
+                    cur.execute(f"DROP TABLE IF EXISTS {t[0]}")
+                    cur.execute(VENDA_DDL.format(tabela=t[0]))
+        finally:
+            conn.close()
+    else:
+        os.makedirs(pasta, exist_ok=True)
+        with open(os.path.join(pasta, "produto.tsv"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(produto_rows(catalogo))
+        with open(os.path.join(pasta, "carregar.sql"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(load_script([t[0] for t in tarefas], indice))
+
+    total = 0
+    argumentos = [(t, db, pasta, indice) for t in tarefas]
+    with Pool(processos or min(len(tarefas), os.cpu_count() or 1)) as pool:
+        for tabela, linhas, segundos in pool.imap(_load_month, argumentos):
+            total += linhas
+            log(f"{tabela}: {linhas} linhas em {segundos:.1f}s")
+    decorrido = time.monotonic() - inicio_total
+    log(f"{total} linhas em {decorrido:.1f}s ({total / decorrido * 60 / 1e6:.1f} milhões/min)")
+    return total
+
+def produto_rows(catalogo):
+    return "".join(f"{codigo}\t{nome[:60]}\t{nome[:30]}\t{4 if pesavel else 1}\t{pesavel}\n"
+                   for codigo, nome, pesavel, *_ in catalogo)
+
+def load_script(tabelas, indice=False):
+    """carregar.sql: recria as tabelas e carrega os .tsv da mesma pasta (psql -f carregar.sql)"""
+    linhas = ["DROP TABLE IF EXISTS produto;", PRODUTO_DDL.strip() + ";", "\\copy produto FROM 'produto.tsv'"]
+    for tabela in tabelas:
+        linhas += [f"DROP TABLE IF EXISTS {tabela};", VENDA_DDL.format(tabela=tabela).strip() + ";",
+                   f"\\copy {tabela} {VENDA_COLUMNS} FROM '{tabela}.tsv'",
+                   f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {tabela}));"]
+        if indice:
+            linhas.append(f"CREATE INDEX {tabela}_data_produto ON {tabela} (data, id_produto);")
+        linhas.append(f"ANALYZE {tabela};")
+    return "\n".join(linhas) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Vendas sintéticas no formato do VR, calibradas pelo histórico real")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default="55432")
+    parser.add_argument("--database", default="vr_bench")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--pasta", help="grava arquivos .tsv + carregar.sql em vez de usar o Postgres")
+    parser.add_argument("--meses", type=int, default=24)
+    parser.add_argument("--produtos", type=int, default=20000)
+    parser.add_argument("--linhas-dia", type=int, default=40000, help="linhas num dia típico")
+    parser.add_argument("--ruptura", type=float, default=0.02, help="fração de produtos em ruptura por dia")
+    parser.add_argument("--indice", action="store_true", help="cria índice (data, id_produto) em cada tabela")
+    parser.add_argument("--processos", type=int, help="meses gerados ao mesmo tempo (padrão: núcleos)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    db = None
+    if not args.pasta:
+        db = {"host": args.host, "port": str(args.port), "database": args.database,
+              "user": args.user, "password": args.password}
+    generate(db=db, pasta=args.pasta, meses=args.meses, produtos=args.produtos, linhas_dia=args.linhas_dia,
+             seed=args.seed, processos=args.processos, indice=args.indice, ruptura=args.ruptura)
+
+if __name__ == '__main__':
+    main()